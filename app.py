@@ -27,7 +27,7 @@ DEFAULTS = {
     "current_page": "Inicio",
     "excel_uploaded": False,
     "excel_filename": "",
-    "excel_data": None,
+    "excel_data_version": None,   # el DataFrame vive en utils.cobro_store
     "upload_time": None,
     "unidad": "EIP",
 }
@@ -1,8 +1,7 @@
 import pandas as pd
-import requests
 import os
-from msal import ConfidentialClientApplication
 from dotenv import load_dotenv
+from utils.graph_client import obtener_token_o_none, site_id, descargar_item_a_disco, ruta_por_path
 
 # Cargar variables desde .env
 load_dotenv()
@@ -14,33 +13,22 @@ DOMAIN = os.getenv("DOMAIN")
 SITE_NAME = os.getenv("SITE_NAME")
 FILE_PATH = os.getenv("FILE_PATH")
 
+def _config() -> dict:
+    return {"tenant_id": TENANT_ID, "client_id": CLIENT_ID, "client_secret": CLIENT_SECRET}
+
 def get_access_token():
-    authority = f"https://login.microsoftonline.com/{TENANT_ID}"
-    app = ConfidentialClientApplication(
-        client_id=CLIENT_ID,
-        client_credential=CLIENT_SECRET,
-        authority=authority
-    )
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-    return result.get("access_token", None)
+    return obtener_token_o_none(_config())
 
 def get_site_id(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{DOMAIN}:/sites/{SITE_NAME}"
-    res = requests.get(url, headers=headers)
-    if res.status_code == 200:
-        return res.json()["id"]
-    return None
+    return site_id(DOMAIN, SITE_NAME, token)
 
 def download_excel(token, site_id):
-    headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:{FILE_PATH}:/content"
-    res = requests.get(url, headers=headers)
-    if res.status_code == 200:
-        with open("indicadores.xlsx", "wb") as f:
-            f.write(res.content)
-        return "indicadores.xlsx"
-    return None
+    # fichero inmutable de la caché de descargas (antes se pisaba un indicadores.xlsx común)
+    try:
+        ruta, _ = descargar_item_a_disco(ruta_por_path(site_id, FILE_PATH), token)
+    except Exception:
+        return None
+    return ruta
 
 # ✅ Función principal que otras páginas deben usar
 def cargar_excel_desde_sharepoint(anio: str) -> pd.ExcelFile | None:
@@ -1,9 +1,16 @@
 import streamlit as st
 import pandas as pd
-from pages.academica.sharepoint_utils import get_access_token, get_site_id, download_excel
+from pages.academica.sharepoint_utils import referencia_libro
 from pages.academica.consolidado import show_consolidado
 from pages.academica.area_tech import show_area_tech
 from pages.academica.gestion_corporativa import show_gestion_corporativa
+from utils.cache_ns import invalidar, registrar_invalidador
+from utils.datos_remotos import servir, caducar, pintar_estado
+from utils.graph_client import leer_referencia, referencia_vigente
+
+CLAVE_ACADEMICA = "academica_libro"  # todas las hojas, sin cabecera
+
+registrar_invalidador("academica", "swr_academica", lambda: caducar(CLAVE_ACADEMICA))
 
 def deduplicate_headers(headers):
     seen = {}
@@ -20,29 +27,25 @@ def academica_page():
     st.title("📚 Indicadores Académicos - EIP")
 
     if st.button("🔄 Actualizar datos"):
+        # se sigue viendo la copia actual mientras se descarga la nueva
+        invalidar("academica")
         st.session_state["academica_opcion"] = "Consolidado Académico"
         st.rerun()
 
+    # última copia buena al instante; el refresco va en segundo plano
     config = st.secrets["academica"]
-    token = get_access_token(config)
-    if not token:
-        st.error("❌ Error obteniendo token.")
-        return
-
-    site_id = get_site_id(config, token)
-    if not site_id:
-        st.error("❌ Error obteniendo site_id.")
-        return
-
-    file = download_excel(config, token, site_id)
-    if not file:
-        st.error("❌ No se pudo descargar el Excel.")
+    try:
+        datos = servir(CLAVE_ACADEMICA, lambda: referencia_libro(config, sheet_name=None, header=None),
+                       valido=referencia_vigente)
+        all_sheets = leer_referencia(datos["valor"])
+    except Exception as e:
+        st.error(f"❌ No se pudo descargar el Excel. ({e})")
         return
+    pintar_estado(datos)
 
     try:
         # Leer todas las hojas como dataframes
         excel_data = {}
-        all_sheets = pd.read_excel(file, sheet_name=None, header=None)
 
         for sheet_name, df in all_sheets.items():
             headers = deduplicate_headers(df.iloc[0].tolist())
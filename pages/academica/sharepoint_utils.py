@@ -1,28 +1,26 @@
-import requests
-from msal import ConfidentialClientApplication
+from utils.graph_client import (
+    obtener_token_o_none, site_id, leer_excel_item, referencia_excel_item, ruta_por_path,
+)
 
 def get_access_token(config):
-    authority = f"https://login.microsoftonline.com/{config['tenant_id']}"
-    app = ConfidentialClientApplication(
-        client_id=config["client_id"],
-        client_credential=config["client_secret"],
-        authority=authority
-    )
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-    return result.get("access_token", None)
+    return obtener_token_o_none(config)
 
 def get_site_id(config, token):
-    headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{config['domain']}:/sites/{config['site_name']}"
-    res = requests.get(url, headers=headers)
-    return res.json()["id"] if res.ok else None
+    return site_id(config["domain"], config["site_name"], token)
 
-def download_excel(config, token, site_id, filename="indicadores.xlsx"):
-    headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:{config['file_path']}:/content"
-    res = requests.get(url, headers=headers)
-    if res.ok:
-        with open(filename, "wb") as f:
-            f.write(res.content)
-        return filename
-    return None
+def leer_excel(config, token, site_id, **kwargs):
+    """read_excel del fichero de `config['file_path']`; no descarga ni parsea si su cTag no cambió."""
+    return leer_excel_item(ruta_por_path(site_id, config["file_path"]), token, **kwargs)
+
+def referencia_libro(config, **kwargs):
+    """
+    Token + site + descarga a disco en una llamada, sin pintar nada. Devuelve una
+    referencia ligera para utils/datos_remotos.py; el libro se lee con leer_referencia.
+    """
+    token = get_access_token(config)
+    if not token:
+        raise RuntimeError("Error obteniendo token.")
+    sid = get_site_id(config, token)
+    if not sid:
+        raise RuntimeError("Error obteniendo site_id.")
+    return referencia_excel_item(ruta_por_path(sid, config["file_path"]), token, **kwargs)
@@ -7,9 +7,15 @@ import unicodedata
 from datetime import datetime
 from io import BytesIO
 from responsive import get_screen_size
+from utils.programas import clasificar_programas
+from utils.graph_client import (
+    obtener_token, obtener_token_o_none, peticion, descargar_item, ruta_share,
+    servir_share_urls, PREFIJO_SHARE,
+)
+from utils.cache_ns import registrar_invalidador
+from utils.datos_remotos import caducar_prefijo, pintar_estado
 import base64
 import requests
-import msal
 import re
 import json
 import time
@@ -75,50 +81,38 @@ KNOWN_PEOPLE = {
 }
 KNOWN_EMAILS = sorted(KNOWN_PEOPLE.keys())
 
+# el botón de recarga caduca las copias del año anterior (se refrescan en segundo plano)
+registrar_invalidador("leads", "swr_share", lambda: caducar_prefijo(PREFIJO_SHARE))
+registrar_invalidador("ventas", "swr_share", lambda: caducar_prefijo(PREFIJO_SHARE))
+
 # =========================
 # SHAREPOINT / GRAPH HELPERS (token + descarga por share link)
 # =========================
 def _get_graph_token_from_secrets_section(secret_section: dict) -> str | None:
-    try:
-        tenant = secret_section["tenant_id"]
-        client = secret_section["client_id"]
-        client_secret = secret_section["client_secret"]
-    except Exception:
-        return None
-    authority = f"https://login.microsoftonline.com/{tenant}"
-    scope = ["https://graph.microsoft.com/.default"]
-    try:
-        app = msal.ConfidentialClientApplication(client, authority=authority, client_credential=client_secret)
-        result = app.acquire_token_silent(scope, account=None)
-        if not result:
-            result = app.acquire_token_for_client(scopes=scope)
-        return result.get("access_token") if result and "access_token" in result else None
-    except Exception:
-        return None
+    return obtener_token_o_none(secret_section)
 
 def download_sharepoint_file_by_shareurl(share_url: str, token: str, timeout: int = 60) -> bytes | None:
+    if not share_url or not token:
+        return None
     try:
-        if not share_url or not token:
-            return None
-        raw = share_url
-        encoded = base64.urlsafe_b64encode(raw.encode("utf-8")).decode("utf-8").rstrip("=")
-        share_id = f"u!{encoded}"
-        endpoint = f"https://graph.microsoft.com/v1.0/shares/{share_id}/driveItem/content"
-        headers = {"Authorization": f"Bearer {token}"}
-        r = requests.get(endpoint, headers=headers, timeout=timeout)
-        if r.status_code == 200:
-            return r.content
-        else:
-            try:
-                st.warning(f"SharePoint download status: {r.status_code}")
-                st.info(r.text[:800])
-            except Exception:
-                pass
-            return None
+        # si el cTag no cambió desde la última descarga, se sirven los bytes en memoria
+        contenido, _ = descargar_item(ruta_share(share_url), token, timeout=timeout)
+        return contenido
     except Exception as e:
-        st.warning(f"Exception descargando sharelink: {str(e)}")
+        _avisar_error_descarga(e)
         return None
 
+def _avisar_error_descarga(e: Exception):
+    if isinstance(e, requests.HTTPError):
+        r = e.response
+        try:
+            st.warning(f"SharePoint download status: {r.status_code}")
+            st.info(r.text[:800])
+        except Exception:
+            pass
+    else:
+        st.warning(f"Exception descargando sharelink: {str(e)}")
+
 def _get_share_urls_from_secrets():
     leads_url = DEFAULT_LEADS_SHARE_URL
     ventas_url = DEFAULT_VENTAS_SHARE_URL
@@ -130,55 +124,40 @@ def _get_share_urls_from_secrets():
         pass
     return leads_url, ventas_url
 
-def load_bytes_for_leads(year_selected: int):
-    if year_selected == ANIO_ACTUAL:
-        if os.path.exists(LEADS_GENERADOS_FILE_LOCAL):
-            try:
-                return open(LEADS_GENERADOS_FILE_LOCAL, "rb").read()
-            except Exception:
-                return None
-        return None
-    try:
-        secret_section = st.secrets.get("admisiones_bdd", None)
-    except Exception:
-        secret_section = None
-    token = _get_graph_token_from_secrets_section(secret_section) if secret_section else None
-    leads_url, _ = _get_share_urls_from_secrets()
-    if leads_url and token:
-        data = download_sharepoint_file_by_shareurl(leads_url, token)
-        if data:
-            return data
-    if os.path.exists(LEADS_GENERADOS_FILE_LOCAL):
+def _leer_local(path: str) -> bytes | None:
+    if os.path.exists(path):
         try:
-            return open(LEADS_GENERADOS_FILE_LOCAL, "rb").read()
+            return open(path, "rb").read()
         except Exception:
             return None
     return None
 
-def load_bytes_for_ventas(year_selected: int):
+def load_bytes_leads_y_ventas(year_selected: int, progreso=None) -> tuple:
+    """
+    (leads_bytes, ventas_bytes). Año anterior: la primera vez ambas share URLs se
+    descargan a la vez con un solo token; después se sirve la última copia y se
+    refresca en segundo plano. Lo que falle cae al fichero local.
+    """
     if year_selected == ANIO_ACTUAL:
-        if os.path.exists(VENTAS_FILE_LOCAL):
-            try:
-                return open(VENTAS_FILE_LOCAL, "rb").read()
-            except Exception:
-                return None
-        return None
+        return _leer_local(LEADS_GENERADOS_FILE_LOCAL), _leer_local(VENTAS_FILE_LOCAL)
     try:
         secret_section = st.secrets.get("admisiones_bdd", None)
     except Exception:
         secret_section = None
-    token = _get_graph_token_from_secrets_section(secret_section) if secret_section else None
-    _, ventas_url = _get_share_urls_from_secrets()
-    if ventas_url and token:
-        data = download_sharepoint_file_by_shareurl(ventas_url, token)
-        if data:
-            return data
-    if os.path.exists(VENTAS_FILE_LOCAL):
-        try:
-            return open(VENTAS_FILE_LOCAL, "rb").read()
-        except Exception:
-            return None
-    return None
+    leads_url, ventas_url = _get_share_urls_from_secrets()
+    urls = {k: u for k, u in (("leads", leads_url), ("ventas", ventas_url)) if u} if secret_section else {}
+    al_completar = (lambda _k, hechos, total: progreso(hechos, total)) if progreso else None
+    datos = servir_share_urls(urls, secret_section, al_completar=al_completar) if urls else {}
+    pintar_estado(list(datos.values()))
+
+    out = {}
+    for k, local in (("leads", LEADS_GENERADOS_FILE_LOCAL), ("ventas", VENTAS_FILE_LOCAL)):
+        d = datos.get(k)
+        data = d["valor"] if d else None
+        if d and data is None and d["error"] is not None:
+            _avisar_error_descarga(d["error"])
+        out[k] = data if data else _leer_local(local)
+    return out["leads"], out["ventas"]
 
 # ---------------------------
 # Helpers para enviar correo (Graph) — añadido para completar la funcionalidad
@@ -197,35 +176,18 @@ def _check_graph_secrets() -> bool:
 
 def get_access_token(force_renew: bool = False):
     try:
-        tenant_id = st.secrets["graph"]["tenant_id"]
-        client_id = st.secrets["graph"]["client_id"]
-        client_secret = st.secrets["graph"]["client_secret"]
-        authority = f"https://login.microsoftonline.com/{tenant_id}"
-        scope = ["https://graph.microsoft.com/.default"]
-
-        app = msal.ConfidentialClientApplication(
-            client_id=client_id, authority=authority, client_credential=client_secret
-        )
-
-        if not force_renew:
-            result = app.acquire_token_silent(scope, account=None)
-            if result and "access_token" in result:
-                return result["access_token"]
-
-        result = app.acquire_token_for_client(scopes=scope)
-        if "access_token" in result:
-            return result["access_token"]
-
-        st.error(f"❌ Error obteniendo token: {result.get('error_description', 'Unknown error')}")
+        return obtener_token(st.secrets["graph"], force_renew=force_renew)
+    except RuntimeError as e:
+        st.error(f"❌ Error obteniendo token: {e}")
         return None
     except Exception as e:
         st.error(f"❌ Error en autenticación: {str(e)}")
         return None
 
 def _post_graph_sendmail(from_email: str, payload: dict, token: str, timeout_sec: int = 45):
-    endpoint = f"https://graph.microsoft.com/v1.0/users/{from_email}/sendMail"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    resp = requests.post(endpoint, headers=headers, json=payload, timeout=timeout_sec)
+    # reintentos=1: el bucle de send_email_with_attachment gestiona 401/429/5xx
+    resp = peticion("POST", f"users/{from_email}/sendMail", token, reintentos=1,
+                    timeout=timeout_sec, json=payload)
     return resp.status_code, resp.text, resp.reason
 
 def send_email_with_attachment(recipient_emails, subject, body_html, attachment_bytes, attachment_name, debug_mode=True):
@@ -332,12 +294,6 @@ def _norm_name(s: str) -> str:
 def _find_col(cols, candidates):
     return next((c for c in candidates if c in cols), None)
 
-def normalizar(texto: str) -> str:
-    texto = str(texto) if pd.notna(texto) else ""
-    texto = texto.lower()
-    texto = unicodedata.normalize('NFD', texto).encode('ascii', 'ignore').decode("utf-8")
-    return texto.strip()
-
 def lighten_hex(hex_color: str, factor: float = 0.85) -> str:
     try:
         hex_color = hex_color.strip().lstrip('#')
@@ -403,9 +359,11 @@ def app():
     selected_year = st.selectbox("Selecciona Año:", options=year_options, format_func=lambda y: year_labels.get(y, str(y)), index=0)
 
     # Intentar cargar bytes del archivo de leads según año
-    with st.spinner("Cargando archivo(s)..."):
-        leads_bytes = load_bytes_for_leads(selected_year)
-        ventas_bytes = load_bytes_for_ventas(selected_year)
+    barra = st.progress(0.0, text="Cargando archivo(s)...")
+    def _progreso(hechos, total):
+        barra.progress(hechos / total, text=f"Cargando archivo(s)... ({hechos}/{total})")
+    leads_bytes, ventas_bytes = load_bytes_leads_y_ventas(selected_year, progreso=_progreso)
+    barra.empty()
 
     if selected_year == ANIO_ACTUAL - 1:
         if leads_bytes is None:
@@ -450,27 +408,8 @@ def app():
     df["programa"] = _to_blank_label(df["programa"])
     df["propietario"] = _to_blank_label(df["propietario"])
 
-    # clasificación (mismo bloque que tenías)
-    CATEGORIAS_EXACTAS = {
-        "MÁSTER IA": ["máster en inteligencia artificial", "máster integral en inteligencia artificial", "máster ia", "master ia", "master en inteligencia artificial"],
-        "MÁSTER RRHH": ["máster recursos humanos rrhh: dirección de personas, desarrollo de talento y gestión laboral", "máster en rrhh: dirección de personas, desarrollo de talento y gestión laboral", "máster rrhh", "master rrhh", "master en rrhh, dirección de personas, desarrollo de talento y gestión laboral"],
-        "MÁSTER CIBERSEGURIDAD": ["máster en dirección de ciberseguridad, hacking ético y seguridad ofensiva", "master en direccion de ciberseguridad, hacking etico y seguridad ofensiva", "la importancia de la ciberseguridad y privacidad", "máster ciber", "master ciber", "máster ciberseguridad"],
-        "CERTIFICACIÓN SAP S/4HANA": ["certificado sap s/4hana finance", "certificado oficial sap s/4hana finance", "certificado oficial sap s/4hana sourcing and procurement", "certificado oficial sap s/4hana logística", "consultoría sap s4hana finanzas", "consultoría sap bw4/hana", "consultoría sap s4hana planificación de la producción y fabricación", "sap btp: la plataforma para la transformación digital", "máster en dirección financiera y consultoría funcional sap s/4hana finance", "sap s/4hana", "sap"],
-        "MÁSTER DPO": ["máster profesional en auditoría de protección de datos, gestión de riesgos y cyber compliance", "master en auditoría de protección de datos, gestión de riesgos y cyber compliance", "máster en dirección de compliance & protección de datos", "máster en auditoría de protección de datos, gestión de riesgos y cyber compliance​", "dpo"],
-        "MÁSTER EERR": ["master en gestión eficiente de energías renovables", "master profesional en energías renovables, redes inteligentes y movilidad eléctrica", "máster en gestión eficiente de las energías renovables", "máster en bim y gestión eficiente de la energía (no usar)", "energías renovables", "eerr"],
-        "MBA + RRHH": ["doble máster oficial en rrhh + mba", "doble máster en rrhh + mba", "doble máster rrhh + mba", "doble máster en dirección financiera + dirección rrhh", "mba rrhh"],
-        "PROGRAMA CALIFORNIA": ["programa movilidad california", "california state university"]
-    }
-
-    def clasificar_programa(nombre: str) -> str:
-        nombre_limpio = normalizar(nombre)
-        for categoria, nombres in CATEGORIAS_EXACTAS.items():
-            if nombre_limpio in [normalizar(n) for n in nombres]:
-                return categoria
-        return "SIN CLASIFICAR"
-
-    df["programa_categoria"] = df["programa"].apply(clasificar_programa)
-    df["programa_final"] = df.apply(lambda r: r["programa"] if r["programa_categoria"] == "SIN CLASIFICAR" else r["programa_categoria"], axis=1)
+    # clasificación: índice de alias precompilado, una vez por programa distinto
+    df["programa_categoria"], df["programa_final"] = clasificar_programas(df["programa"])
 
     # ================= VENTAS (opcional) - ahora soporta SharePoint según selected_year
     ventas_ok = False
@@ -503,11 +442,7 @@ def app():
         prog_col = 'programa' if 'programa' in df_ventas.columns else ('nombre' if 'nombre' in df_ventas.columns else None)
         if prog_col:
             df_ventas["programa_bruto"] = df_ventas[prog_col].astype(str)
-            df_ventas["programa_categoria"] = df_ventas["programa_bruto"].apply(clasificar_programa)
-            df_ventas["programa_final"] = df_ventas.apply(
-                lambda r: r["programa_bruto"] if r.get("programa_categoria", "SIN CLASIFICAR") == "SIN CLASIFICAR" else r.get("programa_categoria"),
-                axis=1
-            )
+            df_ventas["programa_categoria"], df_ventas["programa_final"] = clasificar_programas(df_ventas["programa_bruto"])
         else:
             df_ventas["programa_final"] = "(Desconocido)"
 
@@ -5,16 +5,16 @@ import streamlit.components.v1 as components
 import pandas as pd
 import plotly.express as px
 import os
-import unicodedata
-import re
 from datetime import datetime
 from io import BytesIO
 from responsive import get_screen_size
+from utils.normalizacion import sin_tildes_lower, norm_clave, mapear_unicos
+from utils.programas import abreviar_programa, abreviar_programas, unificar_nombres
+from utils.graph_client import obtener_token_o_none, descargar_item, ruta_share, servir_share_urls
+from utils.datos_remotos import pintar_estado
 
 # ------------------ IMPORTS PARA SHAREPOINT / GRAPH ------------------
-import msal
 import requests
-import base64
 import io as _io
 import traceback
 
@@ -61,24 +61,12 @@ PROGRAM_COLOR_MAP = {
 # =========================
 # UTILIDADES
 # =========================
-def _strip_accents_lower(s: str) -> str:
-    if not isinstance(s, str): return ""
-    s = s.strip().lower()
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-def _norm(s: str) -> str:
-    s = s or ""
-    s = str(s).strip().lower()
-    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-    s = re.sub(r"\s+", " ", s)
-    return s
-
 def _alias_comercial(s: str) -> str:
     if not isinstance(s, str): return ""
     raw = s.strip()
     if " " not in raw:
         return raw.lower()
-    parts = _norm(raw).split()
+    parts = norm_clave(raw).split()
     if len(parts) >= 2:
         return (parts[0][0] + parts[1]).lower()
     return parts[0].lower()
@@ -110,51 +98,11 @@ def lighten_hex(hex_color: str, factor: float = 0.85) -> str:
     except Exception:
         return "#f5f7fa"
 
-# ========= Abreviar nombres de programa (para tiles y gráficos) EN MAYÚSCULAS =========
-def abreviar_programa(nombre: str) -> str:
-    base = _strip_accents_lower(nombre)
-    if "ciber" in base or "hacking" in base or "ofensiva" in base:
-        return "CIBER"
-    if "sap" in base or "s/4hana" in base or "s 4 hana" in base:
-        return "SAP"
-    if "inteligencia artificial" in base or base.startswith("master ia") or base.startswith("máster ia") or base == "ia":
-        return "IA"
-    if "dpo" in base or "proteccion de datos" in base or "compliance" in base:
-        return "DPO"
-    if "rrhh" in base or "recursos humanos" in base:
-        return "RRHH"
-    if "energ" in base or "eerr" in base or "renovabl" in base:
-        return "EERR"
-    if "blackwell" in base:
-        return "BLACKWELL"
-    return nombre.upper() if isinstance(nombre, str) else nombre
-
-# =========================
-# CATEGORÍAS (para nombre_unificado)
-# =========================
-CATEGORIAS_KEYWORDS = {
-    "MÁSTER CIBERSEGURIDAD": ["ciber","ciberseguridad","hacking","etico","seguridad ofensiva","seguridad informatica","ethical hacking","ofensiva"],
-    "MÁSTER RRHH": ["rrhh","recursos humanos","gestion laboral","human resources"],
-    "MÁSTER EERR": ["eerr","energias","energia","renovables","energetica"],
-    "MÁSTER DPO": ["dpo","delegado de proteccion de datos","proteccion de datos","privacidad","rgpd","gdpr"],
-    "MÁSTER IA": ["ia","inteligencia artificial","machine learning","aprendizaje automatico"],
-    "CERTIFICACIÓN SAP S/4HANA": ["sap","s/4hana","certificacion sap","sap s4hana","sap s 4 hana"],
-    "MBA + RRHH": ["mba rrhh","mba + rrhh","mba y rrhh","mba recursos humanos"],
-    "PROGRAMA CALIFORNIA": ["california","programa california"],
-}
-def unificar_nombre(valor_original: str) -> str:
-    if not isinstance(valor_original, str) or not valor_original.strip(): return valor_original
-    base = _strip_accents_lower(valor_original)
-    for categoria, kws in CATEGORIAS_KEYWORDS.items():
-        for kw in kws:
-            if kw in base: return categoria
-    return valor_original
-
 # =========================
 # RESOLVER COLUMNAS PV-FE (robusto)
 # =========================
 def _resolver_columnas(cols):
-    norm_map = {_norm(c): c for c in cols}
+    norm_map = {norm_clave(c): c for c in cols}
     keys = list(norm_map.keys())
 
     def find_any(patterns):
@@ -182,7 +130,7 @@ def _encontrar_archivo_pvfe():
     if os.path.exists(PVFE_FILE): return PVFE_FILE
     if os.path.isdir(UPLOAD_FOLDER):
         for fn in os.listdir(UPLOAD_FOLDER):
-            if _norm(fn).startswith("listadofacturacionficticia") or _norm(fn).startswith("pv-fe") or "facturacion" in _norm(fn):
+            if norm_clave(fn).startswith("listadofacturacionficticia") or norm_clave(fn).startswith("pv-fe") or "facturacion" in norm_clave(fn):
                 return os.path.join(UPLOAD_FOLDER, fn)
     return None
 
@@ -190,51 +138,34 @@ def _encontrar_archivo_pvfe():
 # GRAPH / SHARE-URL HELPERS
 # =========================
 def _get_graph_token_from_secrets_section(secret_section: dict) -> str | None:
-    try:
-        tenant = secret_section["tenant_id"]
-        client = secret_section["client_id"]
-        client_secret = secret_section["client_secret"]
-    except Exception:
-        return None
-    authority = f"https://login.microsoftonline.com/{tenant}"
-    scope = ["https://graph.microsoft.com/.default"]
-    try:
-        app = msal.ConfidentialClientApplication(client, authority=authority, client_credential=client_secret)
-        result = app.acquire_token_silent(scope, account=None)
-        if not result:
-            result = app.acquire_token_for_client(scopes=scope)
-        return result.get("access_token") if result and "access_token" in result else None
-    except Exception:
-        return None
+    return obtener_token_o_none(secret_section)
 
 def download_sharepoint_file_by_shareurl(share_url: str, token: str, timeout: int = 60) -> bytes | None:
     """
     Descarga el archivo vía Graph usando el share link.
     Devuelve bytes del fichero o None en error.
     """
+    if not share_url or not token:
+        return None
     try:
-        if not share_url or not token:
-            return None
-        raw = share_url
-        encoded = base64.urlsafe_b64encode(raw.encode("utf-8")).decode("utf-8").rstrip("=")
-        share_id = f"u!{encoded}"
-        endpoint = f"https://graph.microsoft.com/v1.0/shares/{share_id}/driveItem/content"
-        headers = {"Authorization": f"Bearer {token}"}
-        r = requests.get(endpoint, headers=headers, timeout=timeout)
-        if r.status_code == 200:
-            return r.content
-        else:
-            # mostrar info en app para debug
-            st.warning(f"No se pudo descargar desde SharePoint (status {r.status_code}).")
-            try:
-                st.info(r.text[:1000])
-            except Exception:
-                pass
-            return None
+        # si el cTag no cambió desde la última descarga, se sirven los bytes en memoria
+        contenido, _ = descargar_item(ruta_share(share_url), token, timeout=timeout)
+        return contenido
     except Exception as e:
-        st.warning(f"Exception descargando sharelink: {str(e)}")
+        _avisar_error_descarga(e)
         return None
 
+def _avisar_error_descarga(e: Exception):
+    if isinstance(e, requests.HTTPError):
+        r = e.response
+        st.warning(f"No se pudo descargar desde SharePoint (status {r.status_code}).")
+        try:
+            st.info(r.text[:1000])
+        except Exception:
+            pass
+    else:
+        st.warning(f"Exception descargando sharelink: {str(e)}")
+
 def _get_share_urls_from_secrets():
     """
     Intenta leer ventas_share_url/leads_share_url/pvfe_share_url desde st.secrets['admisiones_bdd'].
@@ -255,62 +186,58 @@ def _get_share_urls_from_secrets():
 # =========================
 # FUNCIONES DE CARGA SEGÚN AÑO
 # =========================
-def load_bytes_for(kind: str, year_selected: int):
-    """
-    kind in {"ventas","pvfe","leads","preventas"}
-    if year_selected == ANIO_ACTUAL -> read local files
-    if year_selected == ANIO_ACTUAL-1 -> try download from share URLs (or secrets)
-    Returns bytes or None.
-    """
-    # LOCAL mapping
-    local_map = {
+def _leer_local(kind: str) -> bytes | None:
+    p = {
         "ventas": VENTAS_FILE,
         "pvfe": PVFE_FILE,
         "leads": LEADS_FILE,
         "preventas": PREVENTAS_FILE
-    }
+    }.get(kind)
+    if p and os.path.exists(p):
+        try:
+            return open(p, "rb").read()
+        except Exception:
+            return None
+    return None
+
+def load_bytes_varios(kinds, year_selected: int, progreso=None) -> dict:
+    """
+    kinds ⊆ {"ventas","pvfe","leads","preventas"} -> {kind: bytes | None}
+    if year_selected == ANIO_ACTUAL -> read local files
+    if year_selected == ANIO_ACTUAL-1 -> share URLs con stale-while-revalidate: la
+    primera vez se descargan en paralelo (un solo token), después se sirve la
+    última copia y se refresca en segundo plano; fallback local para lo que falle.
+    `progreso(hechos, total)` se llama según va terminando cada primera descarga.
+    """
     if year_selected == ANIO_ACTUAL:
-        p = local_map.get(kind)
-        if p and os.path.exists(p):
-            try:
-                return open(p, "rb").read()
-            except Exception:
-                return None
-        return None
+        return {k: _leer_local(k) for k in kinds}
 
-    # else año anterior -> intentar descargar desde SharePoint (share_urls)
+    # año anterior -> SharePoint (share_urls); preventas no tiene share URL, va siempre a local
     ventas_url, pvfe_url, leads_url = _get_share_urls_from_secrets()
+    urls = {"ventas": ventas_url, "pvfe": pvfe_url, "leads": leads_url}
     try:
         secret_section = st.secrets.get("admisiones_bdd", None)
-        token = _get_graph_token_from_secrets_section(secret_section) if secret_section else None
     except Exception:
-        token = None
-
-    if kind == "ventas":
-        url = ventas_url
-    elif kind == "pvfe":
-        url = pvfe_url
-    elif kind == "leads":
-        url = leads_url
-    elif kind == "preventas":
-        # en tu caso no has dado preventas año anterior, usar fallback local
-        url = None
-    else:
-        url = None
-
-    if url and token:
-        data = download_sharepoint_file_by_shareurl(url, token)
-        if data:
-            return data
+        secret_section = None
+
+    pendientes = {k: urls[k] for k in kinds if urls.get(k)} if secret_section else {}
+    al_completar = (lambda _k, hechos, total: progreso(hechos, total)) if progreso else None
+    remotos = servir_share_urls(pendientes, secret_section, al_completar=al_completar) if pendientes else {}
+    pintar_estado(list(remotos.values()))
+
+    out = {}
+    for k in kinds:
+        d = remotos.get(k)
+        data = d["valor"] if d else None
+        if d and data is None and d["error"] is not None:
+            _avisar_error_descarga(d["error"])
+        # si la descarga falló (o no había URL), intento fallback local
+        out[k] = data if data else _leer_local(k)
+    return out
 
-    # si llegamos aquí, intento fallback local
-    p = local_map.get(kind)
-    if p and os.path.exists(p):
-        try:
-            return open(p, "rb").read()
-        except Exception:
-            return None
-    return None
+def load_bytes_for(kind: str, year_selected: int):
+    """Un único fichero; ver load_bytes_varios. Returns bytes or None."""
+    return load_bytes_varios([kind], year_selected)[kind]
 
 # =========================
 # APP
@@ -330,11 +257,15 @@ def app():
     selected_year = st.selectbox("Selecciona Año:", options=year_options, format_func=lambda y: year_labels.get(y, str(y)), index=0)
 
     # Intento cargar los bytes de ventas / pvfe / leads según el año seleccionado
-    with st.spinner("Cargando archivos..."):
-        ventas_bytes = load_bytes_for("ventas", selected_year)
-        pvfe_bytes   = load_bytes_for("pvfe", selected_year)
-        leads_bytes  = load_bytes_for("leads", selected_year)
-        preventas_bytes = load_bytes_for("preventas", selected_year)  # probablemente local
+    barra = st.progress(0.0, text="Cargando archivos...")
+    def _progreso(hechos, total):
+        barra.progress(hechos / total, text=f"Cargando archivos... ({hechos}/{total})")
+    datos = load_bytes_varios(["ventas", "pvfe", "leads", "preventas"], selected_year, progreso=_progreso)
+    barra.empty()
+    ventas_bytes = datos["ventas"]
+    pvfe_bytes   = datos["pvfe"]
+    leads_bytes  = datos["leads"]
+    preventas_bytes = datos["preventas"]  # probablemente local
 
     # Mensajes de diagnóstico (útil mientras pruebas)
     if selected_year == ANIO_ACTUAL - 1:
@@ -443,7 +374,7 @@ def app():
         df_leads = pd.DataFrame()
 
     # Renombrados y comprobaciones (manteniendo tu lógica original)
-    df_ventas.rename(columns={c: _strip_accents_lower(c) for c in df_ventas.columns}, inplace=True)
+    df_ventas.rename(columns={c: sin_tildes_lower(c) for c in df_ventas.columns}, inplace=True)
     if "nombre" not in df_ventas.columns or "propietario" not in df_ventas.columns:
         st.warning("❌ El archivo de ventas debe tener columnas 'nombre' y 'propietario'.")
         return
@@ -470,12 +401,12 @@ def app():
 
     df_ventas["mes"]     = df_ventas["fecha de cierre"].dt.month_name().map(traducciones_meses)
     df_ventas["mes_num"] = df_ventas["fecha de cierre"].dt.month
-    df_ventas["nombre_unificado"] = df_ventas["nombre"].apply(unificar_nombre)
-    df_ventas["prog_corto"] = df_ventas["nombre_unificado"].apply(abreviar_programa)
+    df_ventas["nombre_unificado"] = unificar_nombres(df_ventas["nombre"])
+    df_ventas["prog_corto"] = abreviar_programas(df_ventas["nombre_unificado"])
 
     # PREVENTAS (opcional)
     if df_preventas is not None:
-        df_preventas.rename(columns={c: _strip_accents_lower(c) for c in df_preventas.columns}, inplace=True)
+        df_preventas.rename(columns={c: sin_tildes_lower(c) for c in df_preventas.columns}, inplace=True)
         columnas_importe = [col for col in df_preventas.columns if "importe" in col]
     else:
         columnas_importe = []
@@ -530,7 +461,7 @@ def app():
 
             # Filtrado por propietario (alias) si hay columna comercial
             if _cols_prev["comer"] and not is_all:
-                _dfp_prev["_alias"] = _dfp_prev[_cols_prev["comer"]].astype(str).apply(_alias_comercial)
+                _dfp_prev["_alias"] = mapear_unicos(_dfp_prev[_cols_prev["comer"]].astype(str), _alias_comercial)
                 _dfp_prev = _dfp_prev[_dfp_prev["_alias"] == selected_alias]
 
             if _cols_prev["total"]:
@@ -588,7 +519,7 @@ def app():
             owner_cols_prev = [c for c in dft_prev.columns if any(x in c for x in ["propietario","comercial","asesor","owner","vendedor","responsable"])]
             if owner_cols_prev:
                 ocol_prev = owner_cols_prev[0]
-                dft_prev["_alias"] = dft_prev[ocol_prev].astype(str).apply(_alias_comercial)
+                dft_prev["_alias"] = mapear_unicos(dft_prev[ocol_prev].astype(str), _alias_comercial)
                 if not is_all:
                     dft_prev = dft_prev[dft_prev["_alias"] == selected_alias]
             columnas_importe_prev = [col for col in dft_prev.columns if "importe" in col]
@@ -606,7 +537,7 @@ def app():
         """, unsafe_allow_html=True)
 
     # ======= RESUMEN & COLORES (para gráficos de matrículas) =======
-    df_ventas_filtrado["prog_corto"] = df_ventas_filtrado["nombre_unificado"].apply(abreviar_programa)
+    df_ventas_filtrado["prog_corto"] = abreviar_programas(df_ventas_filtrado["nombre_unificado"])
     resumen = df_ventas_filtrado.groupby(["prog_corto","propietario"]).size().reset_index(name="Total Matrículas")
     totales_propietario = resumen.groupby("propietario")["Total Matrículas"].sum().reset_index()
     totales_propietario["propietario_display"] = totales_propietario.apply(
@@ -807,7 +738,7 @@ def app():
         # ---------- Suma de PVP por Forma de Pago ----------
         fp_col = None
         for c in base_df.columns:
-            if _norm(str(c)) == "forma de pago":
+            if norm_clave(str(c)) == "forma de pago":
                 fp_col = c
                 break
 
@@ -938,7 +869,7 @@ def app():
 
     # Ventas/Preventas por alias (Clientify/Preventas) — filtradas
     ventas_by_alias = (
-        df_ventas_filtrado.assign(_alias=df_ventas_filtrado["propietario"].astype(str).apply(_alias_comercial))
+        df_ventas_filtrado.assign(_alias=mapear_unicos(df_ventas_filtrado["propietario"].astype(str), _alias_comercial))
                  .groupby("_alias")
                  .agg(ventas_count=("propietario","size"), ventas_importe=("importe","sum"))
                  .reset_index()
@@ -951,7 +882,7 @@ def app():
         if owner_cols:
             ocol = owner_cols[0]
             dft = df_preventas.copy()
-            dft["_alias"] = dft[ocol].astype(str).apply(_alias_comercial)
+            dft["_alias"] = mapear_unicos(dft[ocol].astype(str), _alias_comercial)
             if not is_all:
                 dft = dft[dft["_alias"] == selected_alias]
             imp_cols = [c for c in dft.columns if "importe" in c]
@@ -976,7 +907,7 @@ def app():
             dfp["_mes_es"] = ""
 
         if cols["comer"]:
-            dfp["_alias"] = dfp[cols["comer"]].astype(str).apply(_alias_comercial)
+            dfp["_alias"] = mapear_unicos(dfp[cols["comer"]].astype(str), _alias_comercial)
         else:
             dfp["_alias"] = "-"
 
@@ -1215,7 +1146,7 @@ def app():
 
             # Filtrar por propietario alias si hay columna comercial
             if cols["comer"]:
-                vista["_alias"] = vista[cols["comer"]].astype(str).apply(_alias_comercial)
+                vista["_alias"] = mapear_unicos(vista[cols["comer"]].astype(str), _alias_comercial)
                 if not is_all:
                     vista = vista[vista["_alias"] == selected_alias]
 
@@ -1,11 +1,15 @@
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-import unicodedata
 import re
 from datetime import datetime
 import html
 
+from utils.cache_ns import invalidar
+from utils.fechas import parsear_fecha_cierre
+from utils.memo_dataset import memo_dataset
+from utils.normalizacion import norm_colname, norm_texto, normalizar_serie, anadir_flags_ge
+
 # ========== UI ==========
 
 def render_card(title, value, color):
@@ -82,37 +86,8 @@ def render_objectives_card(total_alumnos: int, area_counts: pd.Series) -> str:
 
 # ========== Helpers ==========
 
-MESES_ES = {
-    "enero":"01","febrero":"02","marzo":"03","abril":"04","mayo":"05","junio":"06",
-    "julio":"07","agosto":"08","septiembre":"09","setiembre":"09","octubre":"10",
-    "noviembre":"11","diciembre":"12"
-}
 INVALID_TXT = {"", "NO ENCONTRADO", "NAN", "NULL", "NONE"}
 
-def _strip_accents(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-
-def _norm_colname(s: str) -> str:
-    s = str(s)
-    s = _strip_accents(s).upper()
-    s = s.replace('\u00A0', ' ')
-    s = re.sub(r'[\.\-_/]', ' ', s)
-    s = re.sub(r'\s+', ' ', s).strip()
-    s = re.sub(r'[^A-Z0-9 ]', '', s)
-    return s
-
-def _norm_text_cell(x: object, upper: bool = False, deaccent: bool = False) -> str:
-    if pd.isna(x):
-        s = ""
-    else:
-        s = str(x).replace('\u00A0', ' ')
-    s = re.sub(r'\s+', ' ', s).strip()
-    if deaccent:
-        s = _strip_accents(s)
-    if upper:
-        s = s.upper()
-    return s
-
 def _build_colmap(cols):
     expected = {
         "CONSECUCION GE": ["CONSECUCION GE"],
@@ -132,13 +107,13 @@ def _build_colmap(cols):
         "PROVINCIA 1": ["PROVINCIA 1", "PROVINCIA1", "PROVINCIA_1", "PROVINCIA UNO"],
         "PROVINCIA 2": ["PROVINCIA 2", "PROVINCIA2", "PROVINCIA_2", "PROVINCIA DOS"],
     }
-    norm_lookup = { _norm_colname(c): c for c in cols }
+    norm_lookup = { norm_colname(c): c for c in cols }
     colmap = {}
     for canon, aliases in expected.items():
         found = None
         alias_norm = None
         for alias in aliases:
-            alias_norm = _norm_colname(alias)
+            alias_norm = norm_colname(alias)
             if alias_norm in norm_lookup:
                 found = norm_lookup[alias_norm]; break
         if not found and alias_norm is not None:
@@ -149,39 +124,10 @@ def _build_colmap(cols):
             colmap[canon] = found
     return colmap
 
-def _to_bool(x):
-    if isinstance(x, bool): return x
-    if isinstance(x, (int, float)) and not pd.isna(x): return bool(x)
-    if isinstance(x, str): return x.strip().lower() in ('true','verdadero','sí','si','1','x')
-    return False
-
 def _clean_series(s: pd.Series) -> pd.Series:
-    s = s.dropna().astype(str).apply(lambda v: _norm_text_cell(v, upper=True, deaccent=True))
+    s = normalizar_serie(s.dropna().astype(str), upper=True, deaccent=True)
     return s[~s.isin(INVALID_TXT)]
 
-def _parse_fecha_es(value):
-    if pd.isna(value): return None
-    if isinstance(value, (int, float)): return value
-    s = str(value).strip()
-    if not s: return None
-    s_low = _strip_accents(s.lower())
-    s_low = re.sub(r'\bde\b', ' ', s_low)
-    s_low = re.sub(r'\s+', ' ', s_low).strip()
-    for mes, num in MESES_ES.items():
-        s_low = re.sub(rf'\b{mes}\b', num, s_low)
-    m = re.match(r'^(\d{1,2})\s+(\d{2})\s+(\d{4})$', s_low)
-    if m:
-        d, mm, yyyy = m.groups()
-        d = d.zfill(2)
-        return f"{d}/{mm}/{yyyy}"
-    return s
-
-def _is_blank(x) -> bool:
-    if x is None: return True
-    if isinstance(x, float) and pd.isna(x): return True
-    if isinstance(x, str) and x.strip() == "": return True
-    return pd.isna(x)
-
 # ========== HTML tables (genéricas) ==========
 
 def _html_table(df: pd.DataFrame, col_widths: list[str], align_nums: bool = True, small: bool = True) -> str:
@@ -389,7 +335,7 @@ COMM_KEYS = {
     "FUERA DE ESPAÑA":"Fuera de España"
 }
 
-def _n(s): return _norm_text_cell(s, upper=True, deaccent=True)
+def _n(s): return norm_texto(s, upper=True, deaccent=True)
 
 def _map_prov_to_comm(raw_name: str) -> tuple[str, str, str, str]:
     if pd.isna(raw_name): 
@@ -452,47 +398,43 @@ def _map_prov_to_comm(raw_name: str) -> tuple[str, str, str, str]:
 
 # ========== APP ==========
 
-def render(df: pd.DataFrame):
-    st.title("Informe de Cierre de Expedientes")
-    st.button("🔄 Recargar / limpiar caché", on_click=st.cache_data.clear)
-
+@memo_dataset("empleo")
+def _preparar_cierre(df: pd.DataFrame) -> tuple[list, pd.DataFrame | None]:
+    """(columnas que faltan, df normalizado con AÑO_CIERRE y flags). Memoizada por versión del Excel."""
     # Detecta columnas base
     colmap = _build_colmap(df.columns)
     required = ["CONSECUCION GE","DEVOLUCION GE","INAPLICACION GE","CONSULTOR EIP",
                 "PRACTICAS_GE","EMPRESA PRACT","EMPRESA GE","AREA","NOMBRE","APELLIDOS","FECHA CIERRE"]
     missing = [k for k in required if k not in colmap]
     if missing:
-        st.error("Faltan columnas requeridas: " + ", ".join(missing))
-        st.stop()
+        return missing, None
 
-    # Renombra
+    # Renombra (devuelve un frame nuevo: el sellado de entrada no se toca)
     df = df.rename(columns={colmap[k]:k for k in colmap})
 
     # Limpieza
-    df["AREA"] = df["AREA"].apply(lambda v: _norm_text_cell(v, upper=True, deaccent=True))
+    df["AREA"] = normalizar_serie(df["AREA"], upper=True, deaccent=True)
     for c in ["PRACTICAS_GE","EMPRESA PRACT","EMPRESA GE","NOMBRE","APELLIDOS"]:
-        df[c] = df[c].apply(_norm_text_cell)
-    df["CONSULTOR EIP"] = df["CONSULTOR EIP"].apply(_norm_text_cell).replace('', 'Otros').fillna('Otros')
+        df[c] = normalizar_serie(df[c])
+    df["CONSULTOR EIP"] = normalizar_serie(df["CONSULTOR EIP"]).replace('', 'Otros').fillna('Otros')
     df = df[df["CONSULTOR EIP"].str.upper()!="NO ENCONTRADO"]
 
     # FECHA CIERRE robusta
     col_fc = "FECHA CIERRE"
-    if not pd.api.types.is_numeric_dtype(df[col_fc]):
-        df[col_fc] = df[col_fc].apply(_parse_fecha_es)
-    if pd.api.types.is_numeric_dtype(df[col_fc]):
-        dt = pd.to_datetime(df[col_fc], unit="D", origin="1899-12-30", errors="coerce")
-    else:
-        dt = pd.to_datetime(df[col_fc], errors="coerce", dayfirst=True)
-    df[col_fc] = dt
-    anio = df[col_fc].dt.year
-    mask = (anio.isin([1899, 1970]) | ((anio < 2015) & (anio != 2000)) | (anio > 2035))
-    df.loc[mask, col_fc] = pd.NaT
+    df[col_fc] = parsear_fecha_cierre(df[col_fc])
     df["AÑO_CIERRE"] = df[col_fc].dt.year
 
     # Booleanos
-    df["CONSECUCION_BOOL"]=df["CONSECUCION GE"].apply(_to_bool)
-    df["INAPLICACION_BOOL"]=df["INAPLICACION GE"].apply(_to_bool)
-    df["DEVOLUCION_BOOL"]=df["DEVOLUCION GE"].apply(_to_bool)
+    return [], anadir_flags_ge(df)  # <X>_BOOL / <X>_VACIO
+
+def render(df: pd.DataFrame):
+    st.title("Informe de Cierre de Expedientes")
+    st.button("🔄 Recargar / limpiar caché", on_click=invalidar, args=("empleo",))
+
+    missing, df = _preparar_cierre(df)
+    if missing:
+        st.error("Faltan columnas requeridas: " + ", ".join(missing))
+        st.stop()
 
     # Selector informe (AÑO)
     anios = sorted(df["AÑO_CIERRE"].dropna().unique().astype(int)) if "AÑO_CIERRE" in df else []
@@ -502,7 +444,7 @@ def render(df: pd.DataFrame):
     df_base = df.copy() if "Total" in opcion else df[df["AÑO_CIERRE"]==int(opcion.split()[-1])].copy()
 
     # Filtro consultor
-    consultores = df_base["CONSULTOR EIP"].dropna().apply(_norm_text_cell)
+    consultores = normalizar_serie(df_base["CONSULTOR EIP"].dropna())
     consultores = consultores[~consultores.str.upper().isin(list(INVALID_TXT))]
     consultores_unicos = sorted(consultores.unique())
     sel = st.multiselect("Filtrar por Consultor:", options=consultores_unicos, default=consultores_unicos)
@@ -511,7 +453,7 @@ def render(df: pd.DataFrame):
     df_f = df_base[df_base["CONSULTOR EIP"].isin(sel)].copy()
 
     # Normaliza área
-    df_f["AREA_N"] = df_f["AREA"].apply(lambda v: _norm_text_cell(v, upper=True, deaccent=True))
+    df_f["AREA_N"] = normalizar_serie(df_f["AREA"], upper=True, deaccent=True)
     df_f.loc[df_f["AREA_N"] == "", "AREA_N"] = "SIN ÁREA"
 
     # Selector de área
@@ -550,11 +492,11 @@ def render(df: pd.DataFrame):
 
                 df_cons = df[df["CONSULTOR EIP"].isin(sel)].copy()
                 m_sin_fecha = df_cons["FECHA CIERRE"].isna()
-                emp = df_cons["EMPRESA PRACT"].apply(_norm_text_cell)
+                emp = normalizar_serie(df_cons["EMPRESA PRACT"])
                 m_emp_ok = ~(emp.eq("") | emp.str.upper().isin(list(INVALID_TXT)))
-                m_con_blank  = df_cons["CONSECUCION GE"].apply(_is_blank)
-                m_inap_blank = df_cons["INAPLICACION GE"].apply(_is_blank)
-                m_dev_blank  = df_cons["DEVOLUCION GE"].apply(_is_blank)
+                m_con_blank  = df_cons["CONSECUCION_VACIO"]
+                m_inap_blank = df_cons["INAPLICACION_VACIO"]
+                m_dev_blank  = df_cons["DEVOLUCION_VACIO"]
                 en_curso = int((m_sin_fecha & m_emp_ok & m_con_blank & m_inap_blank & m_dev_blank).sum())
 
                 c4.markdown(render_card("Prácticas en curso", en_curso, "#fff3e0"), unsafe_allow_html=True)
@@ -583,7 +525,7 @@ def render(df: pd.DataFrame):
     st.markdown("")
     df_tmp = df_scope.copy()
     if "AREA_N" not in df_tmp:
-        df_tmp["AREA_N"] = df_tmp["AREA"].apply(lambda v: _norm_text_cell(v, upper=True, deaccent=True))
+        df_tmp["AREA_N"] = normalizar_serie(df_tmp["AREA"], upper=True, deaccent=True)
         df_tmp.loc[df_tmp["AREA_N"] == "", "AREA_N"] = "SIN ÁREA"
 
     # Clave alumno
@@ -597,7 +539,7 @@ def render(df: pd.DataFrame):
 
     con_area  = df_tmp[df_tmp["CONSECUCION_BOOL"]].groupby("AREA_N").size()
     inap_area = df_tmp[df_tmp["INAPLICACION_BOOL"]].groupby("AREA_N").size()
-    emp_pr_norm = df_tmp["EMPRESA PRACT"].apply(lambda v: _norm_text_cell(v, upper=True, deaccent=True))
+    emp_pr_norm = normalizar_serie(df_tmp["EMPRESA PRACT"], upper=True, deaccent=True)
     mask_pract  = ~emp_pr_norm.isin(INVALID_TXT)
     prac_area   = df_tmp[mask_pract].groupby("AREA_N").size()
     alumnos_area = df_tmp.groupby("AREA_N")["ALUMNO_KEY"].nunique()
@@ -2,16 +2,21 @@
 # -*- coding: utf-8 -*-
 import os
 import re
-import time
 import unicodedata
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
-import requests
 from urllib.parse import quote, unquote
+from concurrent.futures import FIRST_COMPLETED, wait
+from utils.graph_client import obtener_token, graph_json, graph_json_varios, pool_graph
+from utils.cache_ns import cache_data_ns, invalidar
+from utils.memo_dataset import memo_dataset
+from utils.convenios_index import sincronizar as sincronizar_convenios, convenios as convenios_indexados
 
 UPLOAD_FOLDER = "uploaded_admisiones"
+HILOS_AREAS = 4        # áreas de convenios recorridas a la vez (fallback sin índice)
+HILOS_RECORRIDO = 8    # carpetas listadas a la vez dentro de cada área
 ARCHIVO_DESARROLLO = os.path.join(UPLOAD_FOLDER, "desarrollo_profesional.xlsx")
 NBSP = "\u00A0"
 
@@ -204,50 +209,29 @@ def _secrets_ok(sec: dict) -> bool:
     req = ["client_id", "tenant_id", "client_secret", "domain", "site_name"]
     return all(k in sec and str(sec[k]).strip() for k in req)
 
-def _http_get_with_retry(url: str, headers: dict, timeout: int = 30, retries: int = 3) -> requests.Response:
-    for i in range(retries):
-        r = requests.get(url, headers=headers, timeout=timeout)
-        if r.status_code in (429, 500, 502, 503, 504):
-            time.sleep(1.5 * (i + 1))
-            continue
-        r.raise_for_status()
-        return r
-    r.raise_for_status()
-    return r
-
-@st.cache_data(ttl=3300)
 def _graph_get_token(tenant_id: str, client_id: str, client_secret: str) -> str:
-    url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-    data = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "grant_type": "client_credentials",
-        "scope": "https://graph.microsoft.com/.default",
-    }
-    r = requests.post(url, data=data, timeout=30)
-    r.raise_for_status()
-    return r.json()["access_token"]
+    # la app MSAL compartida ya cachea el token hasta que caduca
+    return obtener_token({"tenant_id": tenant_id, "client_id": client_id, "client_secret": client_secret})
 
 def _graph_get(url: str, token: str) -> dict:
-    r = _http_get_with_retry(url, headers={"Authorization": f"Bearer {token}"})
-    return r.json()
+    return graph_json(url, token)
 
-@st.cache_data(ttl=3600)
+@cache_data_ns("convenios", ttl=3600)
 def _get_site_id(domain: str, site_name: str, token: str) -> str:
-    url = f"https://graph.microsoft.com/v1.0/sites/{domain}:/sites/{quote(site_name)}?$select=id,webUrl"
+    url = f"sites/{domain}:/sites/{quote(site_name)}?$select=id,webUrl"
     data = _graph_get(url, token)
     return data["id"]
 
-@st.cache_data(ttl=3600)
+@cache_data_ns("convenios", ttl=3600)
 def _get_drive_id(site_id: str, token: str) -> str:
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive?$select=id,webUrl"
+    url = f"sites/{site_id}/drive?$select=id,webUrl"
     data = _graph_get(url, token)
     return data["id"]
 
-@st.cache_data(ttl=300)
+@cache_data_ns("convenios", ttl=300)
 def _list_folder_children(drive_id: str, folder_path: str, token: str) -> list[dict]:
     encoded_path = quote(folder_path.strip("/"), safe="/")
-    base = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{encoded_path}"
+    base = f"drives/{drive_id}/root:/{encoded_path}"
     _ = _graph_get(base, token)
     url = base + ":/children?$top=200&$select=name,webUrl,lastModifiedDateTime,folder,file,size"
     items = []
@@ -268,17 +252,17 @@ def _list_folder_children(drive_id: str, folder_path: str, token: str) -> list[d
     return items
 
 # ---------- Búsqueda y extracción convenios ----------
-@st.cache_data(ttl=900)
-def _get_item_id_by_path(drive_id: str, folder_path: str, token: str) -> str:
-    encoded_path = quote(folder_path.strip("/"), safe="/")
-    url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{encoded_path}"
-    data = _graph_get(url, token)
-    return data["id"]
-
-@st.cache_data(ttl=300)
+@cache_data_ns("convenios", ttl=900)
+def _get_item_ids_by_paths(drive_id: str, folder_paths: tuple[str, ...], token: str) -> dict[str, str | None]:
+    """item_id de varias carpetas en un solo $batch (None si la ruta no existe)."""
+    rutas = [f"drives/{drive_id}/root:/{quote(p.strip('/'), safe='/')}?$select=id" for p in folder_paths]
+    datos = graph_json_varios(rutas, token)
+    return {p: (d or {}).get("id") for p, d in zip(folder_paths, datos)}
+
+@cache_data_ns("convenios", ttl=300)
 def _search_in_folder(drive_id: str, item_id: str, token: str, query: str) -> list[dict]:
     """Busca `query` dentro de una carpeta por su item_id (si el tenant lo permite)."""
-    url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{item_id}/search(q='{quote(query)}')"
+    url = f"drives/{drive_id}/items/{item_id}/search(q='{quote(query)}')"
     results = []
     while url:
         data = _graph_get(url, token)
@@ -322,96 +306,130 @@ def _extract_company_from_weburl(web_url: str, area_folder: str) -> str:
     except Exception:
         return ""
 
-def _walk_and_collect_convenios(drive_id: str, area_path: str, token: str, kw="CONVENI") -> list[dict]:
+def _walk_and_collect_convenios(drive_id: str, area_path: str, token: str, kw="CONVENI",
+                                max_hilos: int = HILOS_RECORRIDO) -> list[dict]:
     """
     Recorre recursivamente la carpeta `area_path` y devuelve archivos con `kw`
     incluyendo lastModified y la carpeta (empresa) bajo el área.
+    Las carpetas se listan en paralelo (`max_hilos`); el ritmo total hacia Graph
+    lo marca el limitador compartido de graph_client.
     """
-    from collections import deque
-    q = deque([area_path])
     out = []
     area_path_norm = area_path.strip("/")
 
-    while q:
-        current = q.popleft()
-        try:
-            children = _list_folder_children(drive_id, current, token)
-        except Exception:
-            continue
-        # empresa = primer segmento tras el área dentro de 'current'
-        rel = current.strip("/")[len(area_path_norm):].lstrip("/")
-        empresa = rel.split("/")[0] if rel else "(raíz)"
-        for it in children:
-            if it.get("isFolder", False):
-                q.append(f"{current.rstrip('/')}/{it['name']}")
-            else:
-                name_up = (it.get("name") or "").upper()
-                if kw in name_up:
-                    out.append({
-                        "name": it.get("name", ""),
-                        "lastModified": it.get("lastModified", ""),
-                        "webUrl": it.get("webUrl", ""),
-                        "empresa": empresa
-                    })
+    with pool_graph(max_hilos) as pool:
+        pendientes = {pool.submit(_list_folder_children, drive_id, area_path, token): area_path}
+        while pendientes:
+            hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for fut in hechos:
+                current = pendientes.pop(fut)
+                try:
+                    children = fut.result()
+                except Exception:
+                    continue
+                # empresa = primer segmento tras el área dentro de 'current'
+                rel = current.strip("/")[len(area_path_norm):].lstrip("/")
+                empresa = rel.split("/")[0] if rel else "(raíz)"
+                for it in children:
+                    if it.get("isFolder", False):
+                        sub = f"{current.rstrip('/')}/{it['name']}"
+                        pendientes[pool.submit(_list_folder_children, drive_id, sub, token)] = sub
+                    else:
+                        name_up = (it.get("name") or "").upper()
+                        if kw in name_up:
+                            out.append({
+                                "name": it.get("name", ""),
+                                "lastModified": it.get("lastModified", ""),
+                                "webUrl": it.get("webUrl", ""),
+                                "empresa": empresa
+                            })
     return out
 
-@st.cache_data(ttl=600, show_spinner=False)
-def _convenios_por_area_y_ano(drive_id: str, base_path: str, areas_map: dict[str, str],
-                              token: str) -> pd.DataFrame:
+@cache_data_ns("convenios", ttl=600, show_spinner=False)
+def _convenios_sin_indice(drive_id: str, base_path: str, areas_map: dict[str, str],
+                          token: str) -> pd.DataFrame:
     """
-    Devuelve un pivote: filas = Área, columnas = Años, valores = nº de convenios.
-    Usa búsqueda (rápida) y si falla permisos/resultados, recorre recursivamente.
+    Camino antiguo (sin índice): búsqueda por área y, si no da resultados o
+    permisos, recorrido recursivo. Mismas columnas que convenios_index.convenios.
     """
-    rows = []
-    all_years = set()
-    for area_label, area_folder in areas_map.items():
-        area_path = f"{base_path}/{area_folder}"
-        year_counts = {}
+    # ids de todas las carpetas de área en una sola ida y vuelta
+    try:
+        area_ids = _get_item_ids_by_paths(
+            drive_id, tuple(f"{base_path}/{f}" for f in areas_map.values()), token)
+    except Exception:
+        area_ids = {}
 
+    def _area(area_label: str, area_folder: str) -> list[dict]:
+        area_path = f"{base_path}/{area_folder}"
+        hits = []
         # 1) Intento rápido con SEARCH
         try:
-            area_id = _get_item_id_by_path(drive_id, area_path, token)
+            area_id = area_ids.get(area_path)
+            if not area_id:
+                raise LookupError(area_path)
             found = _search_in_folder(drive_id, area_id, token, "conveni")
             hits = [
-                it for it in found
+                {
+                    "Área": area_label,
+                    "Carpeta": _extract_company_from_weburl(it.get("webUrl", ""), area_folder),
+                    "Archivo": it.get("name", ""),
+                    "lastModified": it.get("lastModified", ""),
+                    "Link": it.get("webUrl", ""),
+                }
+                for it in found
                 if it.get("isFile") and ("CONVENI" in (it.get("name", "").upper()))
             ]
-            if hits:
-                years = pd.to_datetime(
-                    [h.get("lastModified") for h in hits],
-                    errors="coerce", utc=True
-                ).dropna().year
-                for y, c in years.value_counts().items():
-                    y = int(y)
-                    year_counts[y] = year_counts.get(y, 0) + int(c)
         except Exception:
             pass
-
         # 2) Fallback si no hubo resultados o permisos
-        if not year_counts:
-            convs = _walk_and_collect_convenios(drive_id, area_path, token, kw="CONVENI")
-            if convs:
-                years = pd.to_datetime(
-                    [c.get("lastModified") for c in convs],
-                    errors="coerce", utc=True
-                ).dropna().year
-                for y, c in years.value_counts().items():
-                    y = int(y)
-                    year_counts[y] = year_counts.get(y, 0) + int(c)
-
-        all_years.update(year_counts.keys())
-        row = {"Área": area_label}
-        row.update({int(y): int(year_counts.get(y, 0)) for y in year_counts})
-        rows.append(row)
-
-    if not rows:
-        return pd.DataFrame(columns=["Área"])
-    df = pd.DataFrame(rows).fillna(0)
-    for y in sorted(all_years):
-        if y not in df.columns:
-            df[y] = 0
-    year_cols = sorted([c for c in df.columns if isinstance(c, int)], reverse=True)
-    df = df[["Área"] + year_cols]
+        if not hits:
+            hits = [
+                {
+                    "Área": area_label,
+                    "Carpeta": c.get("empresa", ""),
+                    "Archivo": c.get("name", ""),
+                    "lastModified": c.get("lastModified", ""),
+                    "Link": c.get("webUrl", ""),
+                }
+                for c in _walk_and_collect_convenios(drive_id, area_path, token, kw="CONVENI")
+            ]
+        return hits
+
+    # las áreas van en paralelo; cada una abre además su propio pool para el recorrido
+    rows = []
+    with pool_graph(HILOS_AREAS) as pool:
+        for hits in pool.map(lambda kv: _area(*kv), areas_map.items()):
+            rows.extend(hits)
+    return pd.DataFrame(rows, columns=["Área", "Carpeta", "Archivo", "lastModified", "Link"])
+
+def _filas_convenios(drive_id: str, base_path: str, areas_map: dict[str, str], token: str) -> pd.DataFrame:
+    """
+    Todos los convenios con su Fecha (lastModified, sin zona). Tira del índice
+    local sincronizado por delta; si Graph no deja usar delta, cae a búsqueda/recorrido.
+    """
+    try:
+        sincronizar_convenios(drive_id, token)
+        df = convenios_indexados(drive_id, base_path, areas_map)
+    except Exception:
+        df = _convenios_sin_indice(drive_id, base_path, areas_map, token)
+    df = df.copy()
+    df["Fecha"] = pd.to_datetime(df["lastModified"], errors="coerce", utc=True).dt.tz_convert(None)
+    return df.dropna(subset=["Fecha"])
+
+def _convenios_por_area_y_ano(drive_id: str, base_path: str, areas_map: dict[str, str],
+                              token: str) -> pd.DataFrame:
+    """
+    Devuelve un pivote: filas = Área, columnas = Años, valores = nº de convenios.
+    """
+    df_conv = _filas_convenios(drive_id, base_path, areas_map, token)
+    if df_conv.empty:
+        tabla = pd.DataFrame(index=pd.Index([], name="Área"))
+    else:
+        tabla = pd.crosstab(df_conv["Área"], df_conv["Fecha"].dt.year.astype(int))
+    tabla = tabla.reindex(list(areas_map), fill_value=0)
+    tabla.columns = [int(c) for c in tabla.columns]
+    year_cols = sorted(tabla.columns, reverse=True)
+    df = tabla[year_cols].rename_axis("Área").reset_index()
     df["Total"] = df[year_cols].sum(axis=1)
     df = df.sort_values(["Total", "Área"], ascending=[False, True]).reset_index(drop=True)
     df = df.astype({c: int for c in year_cols + ["Total"]})
@@ -430,109 +448,36 @@ def _append_total_global_row(df_pivot: pd.DataFrame) -> pd.DataFrame:
     out = pd.concat([out, pd.DataFrame([total_row])], ignore_index=True)
     return out
 
-@st.cache_data(ttl=600, show_spinner=False)
 def _detalle_por_area_y_ano(drive_id: str, base_path: str, areas_map: dict[str, str],
                             token: str, year: int) -> pd.DataFrame:
     """
     Detalle de convenios para un AÑO concreto: Área, Carpeta, Archivo, Fecha, Link.
-    Usa búsqueda y, si no, recorrido recursivo. Intenta obtener la carpeta-empresa.
     """
-    rows = []
-    for area_label, area_folder in areas_map.items():
-        area_path = f"{base_path}/{area_folder}"
-        try:
-            area_id = _get_item_id_by_path(drive_id, area_path, token)
-            found = _search_in_folder(drive_id, area_id, token, "conveni")
-            for it in found:
-                if not it.get("isFile"):
-                    continue
-                name = it.get("name", "")
-                if "CONVENI" not in name.upper():
-                    continue
-                lm = pd.to_datetime(it.get("lastModified"), errors="coerce", utc=True)
-                if pd.isna(lm) or int(lm.year) != int(year):
-                    continue
-                empresa = _extract_company_from_weburl(it.get("webUrl", ""), area_folder)
-                rows.append({
-                    "Área": area_label,
-                    "Carpeta": empresa,
-                    "Archivo": name,
-                    "Fecha": lm.tz_convert(None) if hasattr(lm, "tz_convert") else lm,
-                    "Link": it.get("webUrl", "")
-                })
-        except Exception:
-            convs = _walk_and_collect_convenios(drive_id, area_path, token, kw="CONVENI")
-            for c in convs:
-                lm = pd.to_datetime(c.get("lastModified"), errors="coerce", utc=True)
-                if pd.isna(lm) or int(lm.year) != int(year):
-                    continue
-                rows.append({
-                    "Área": area_label,
-                    "Carpeta": c.get("empresa", ""),
-                    "Archivo": c.get("name", ""),
-                    "Fecha": lm.tz_convert(None) if hasattr(lm, "tz_convert") else lm,
-                    "Link": c.get("webUrl", "")
-                })
-    if not rows:
+    df = _filas_convenios(drive_id, base_path, areas_map, token)
+    df = df[df["Fecha"].dt.year == int(year)]
+    if df.empty:
         return pd.DataFrame(columns=["Área", "Carpeta", "Archivo", "Fecha", "Link"])
-    df = pd.DataFrame(rows)
-    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
+    df = df[["Área", "Carpeta", "Archivo", "Fecha", "Link"]].copy()
+    df["Fecha"] = df["Fecha"].dt.date
     return df.sort_values(["Área", "Carpeta", "Archivo"]).reset_index(drop=True)
 
-@st.cache_data(ttl=600, show_spinner=False)
 def _detalle_area_all_years(drive_id: str, base_path: str, areas_map: dict[str, str],
                             token: str, area_label: str) -> pd.DataFrame:
     """
     Detalle de convenios para un ÁREA concreta en TODOS los años.
     Columnas: Área, Año, Carpeta, Archivo, Fecha, Link.
     """
-    area_folder = areas_map.get(area_label)
-    if not area_folder:
+    if area_label not in areas_map:
         return pd.DataFrame(columns=["Área", "Año", "Carpeta", "Archivo", "Fecha", "Link"])
-    area_path = f"{base_path}/{area_folder}"
-
-    rows = []
-    try:
-        area_id = _get_item_id_by_path(drive_id, area_path, token)
-        found = _search_in_folder(drive_id, area_id, token, "conveni")
-        for it in found:
-            if not it.get("isFile"):
-                continue
-            name = it.get("name", "")
-            if "CONVENI" not in name.upper():
-                continue
-            lm = pd.to_datetime(it.get("lastModified"), errors="coerce", utc=True)
-            if pd.isna(lm):
-                continue
-            empresa = _extract_company_from_weburl(it.get("webUrl", ""), area_folder)
-            rows.append({
-                "Área": area_label,
-                "Año": int(lm.year),
-                "Carpeta": empresa,
-                "Archivo": name,
-                "Fecha": lm.tz_convert(None) if hasattr(lm, "tz_convert") else lm,
-                "Link": it.get("webUrl", "")
-            })
-    except Exception:
-        convs = _walk_and_collect_convenios(drive_id, area_path, token, kw="CONVENI")
-        for c in convs:
-            lm = pd.to_datetime(c.get("lastModified"), errors="coerce", utc=True)
-            if pd.isna(lm):
-                continue
-            rows.append({
-                "Área": area_label,
-                "Año": int(lm.year),
-                "Carpeta": c.get("empresa", ""),
-                "Archivo": c.get("name", ""),
-                "Fecha": lm.tz_convert(None) if hasattr(lm, "tz_convert") else lm,
-                "Link": c.get("webUrl", "")
-            })
-
-    if not rows:
+    df = _filas_convenios(drive_id, base_path, areas_map, token)
+    df = df[df["Área"] == area_label]
+    if df.empty:
         return pd.DataFrame(columns=["Área", "Año", "Carpeta", "Archivo", "Fecha", "Link"])
-    df = pd.DataFrame(rows)
-    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
-    return df.sort_values(["Año", "Fecha"], ascending=[False, False]).reset_index(drop=True)
+    df = df.sort_values("Fecha", ascending=False)
+    df.insert(1, "Año", df["Fecha"].dt.year.astype(int))
+    df = df[["Área", "Año", "Carpeta", "Archivo", "Fecha", "Link"]].copy()
+    df["Fecha"] = df["Fecha"].dt.date
+    return df.reset_index(drop=True)
 
 # ======= Tarjetas KPI (cuadradas) =======
 def _kpi_card(title: str, main: str, sub: str | None = None, tone: str = "blue") -> str:
@@ -559,26 +504,10 @@ def _kpi_card(title: str, main: str, sub: str | None = None, tone: str = "blue")
     </div>
     """
 
-# =============== App principal ===============
-def render(df: pd.DataFrame | None = None):
-    st.title("📊 Principal - Área de Empleo")
-
-    if st.button("🔄 Recargar / limpiar caché"):
-        st.cache_data.clear()
-        st.cache_resource.clear()
-        st.success("Caché limpiada. Datos recargados.")
-
-    # Carga Excel local si no se pasa df
-    if df is None:
-        if not os.path.exists(ARCHIVO_DESARROLLO):
-            st.warning("⚠️ No se encontró el archivo.")
-            return
-        try:
-            df = pd.read_excel(ARCHIVO_DESARROLLO, sheet_name="GENERAL")
-        except Exception:
-            df = pd.read_excel(ARCHIVO_DESARROLLO)
-
-    df = clean_headers(df)
+@memo_dataset("empleo")
+def _base_activos(df: pd.DataFrame) -> tuple[list, pd.DataFrame | None, pd.DataFrame | None]:
+    """(columnas que faltan, Excel normalizado, alumnado activo). Sin widgets: se memoiza por versión del Excel."""
+    df = clean_headers(df.copy())  # el frame de entrada va sellado: no se toca
 
     # Aliases de columnas
     rename_alias = {
@@ -596,8 +525,7 @@ def render(df: pd.DataFrame | None = None):
     ]
     faltantes = [c for c in cols_req if c not in df.columns]
     if faltantes:
-        st.error(f"❌ Faltan columnas: {', '.join(faltantes)}")
-        return
+        return faltantes, None, None
 
     # Activo = las 3 columnas de estado vacías
     df["ES_ACTIVO"] = (
@@ -624,6 +552,30 @@ def render(df: pd.DataFrame | None = None):
         df_base["AREA"].notna() &
         (~df_base["AREA"].isin(["", "NO ENCONTRADO", "NAN", "<NA>"]))
     ]
+    return [], df, df_base
+
+# =============== App principal ===============
+def render(df: pd.DataFrame | None = None):
+    st.title("📊 Principal - Área de Empleo")
+
+    if st.button("🔄 Recargar / limpiar caché"):
+        invalidar("empleo", "convenios")
+        st.success("Caché de Empleo y convenios limpiada. Datos recargados.")
+
+    # Carga Excel local si no se pasa df
+    if df is None:
+        if not os.path.exists(ARCHIVO_DESARROLLO):
+            st.warning("⚠️ No se encontró el archivo.")
+            return
+        try:
+            df = pd.read_excel(ARCHIVO_DESARROLLO, sheet_name="GENERAL")
+        except Exception:
+            df = pd.read_excel(ARCHIVO_DESARROLLO)
+
+    faltantes, df, df_base = _base_activos(df)
+    if faltantes:
+        st.error(f"❌ Faltan columnas: {', '.join(faltantes)}")
+        return
 
     # Filtros que incluyen blancos por defecto
     opciones_practicas = sorted(
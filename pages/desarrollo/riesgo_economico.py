@@ -2,28 +2,15 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import re
-import unicodedata
+
+from utils.cache_ns import invalidar
+from utils.fechas import parsear_fecha_es
+from utils.memo_dataset import memo_dataset
+from utils.normalizacion import normalizar_serie, a_booleano, es_falso_o_vacio
 
 # ===== Helpers de normalización =====
 NBSP = "\u00A0"
 
-def _norm_text(x: object, upper: bool = True, deaccent: bool = True) -> str:
-    if pd.isna(x):
-        s = ""
-    else:
-        s = str(x).replace(NBSP, " ")
-    s = " ".join(s.strip().split())
-    if deaccent:
-        s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-    if upper:
-        s = s.upper()
-    return s
-
-def normalizar_booleano(valor):
-    if pd.isna(valor):
-        return False
-    return str(valor).strip().lower() in ["true", "1", "1.0", "sí", "si", "verdadero", "x"]
-
 def limpiar_riesgo(valor) -> float:
     if isinstance(valor, (int, float)):
         return float(valor)
@@ -36,24 +23,16 @@ def limpiar_riesgo(valor) -> float:
     except Exception:
         return 0.0
 
-def convertir_fecha_excel(valor):
-    try:
-        if pd.isna(valor):
-            return pd.NaT
-        if isinstance(valor, (int, float)):
-            return pd.to_datetime("1899-12-30") + pd.to_timedelta(int(valor), unit="D")
-        return pd.to_datetime(valor, errors="coerce", dayfirst=True)
-    except:
-        return pd.NaT
-
-def render(df: pd.DataFrame):
-    st.title("💰 Riesgo Económico")
+COLUMNAS_REQUERIDAS = [
+    "NOMBRE", "APELLIDOS", "PRÁCTICAS/GE", "CONSULTOR EIP",
+    "CONSECUCIÓN GE", "DEVOLUCIÓN GE", "INAPLICACIÓN GE",
+    "FIN CONV", "RIESGO ECONÓMICO", "EJECUCIÓN GARANTÍA", "AREA", "FECHA CIERRE"
+]
 
-    # 🔄 Botón para recargar / limpiar caché
-    if st.button("🔄 Recargar / limpiar caché"):
-        st.cache_data.clear()
-        st.cache_resource.clear()
-        st.success("Caché limpiada. Datos recargados.")
+@memo_dataset("empleo")
+def _preparar_riesgo(df: pd.DataFrame, hoy: pd.Timestamp) -> dict:
+    """Alumnado en riesgo y devoluciones GE. Sin widgets: se memoiza por versión del Excel y día."""
+    df = df.copy()  # el frame de entrada va sellado: no se toca
 
     # -------- Normalización de encabezados (soporta acentos/alias) --------
     df.columns = (
@@ -73,40 +52,27 @@ def render(df: pd.DataFrame):
     }
     df = df.rename(columns={k: v for k, v in ren.items() if k in df.columns})
 
-    columnas_requeridas = [
-        "NOMBRE", "APELLIDOS", "PRÁCTICAS/GE", "CONSULTOR EIP",
-        "CONSECUCIÓN GE", "DEVOLUCIÓN GE", "INAPLICACIÓN GE",
-        "FIN CONV", "RIESGO ECONÓMICO", "EJECUCIÓN GARANTÍA", "AREA", "FECHA CIERRE"
-    ]
-    faltan = [c for c in columnas_requeridas if c not in df.columns]
+    faltan = [c for c in COLUMNAS_REQUERIDAS if c not in df.columns]
     if faltan:
-        st.error("❌ Faltan columnas: " + ", ".join(faltan))
-        return
+        return {"faltan": faltan}
 
     # -------- Limpieza básica de texto --------
     for c in ["AREA", "CONSULTOR EIP", "PRÁCTICAS/GE"]:
-        df[c] = df[c].map(lambda x: _norm_text(x, upper=True, deaccent=True))
+        df[c] = normalizar_serie(df[c], upper=True, deaccent=True)
 
     # -------- Fechas --------
     df["FIN CONV"] = pd.to_datetime(df["FIN CONV"], errors="coerce", dayfirst=True)
     df["EJECUCIÓN GARANTÍA"] = pd.to_datetime(df["EJECUCIÓN GARANTÍA"], errors="coerce", dayfirst=True)
-    df["FECHA CIERRE"] = df["FECHA CIERRE"].apply(convertir_fecha_excel)
+    df["FECHA CIERRE"] = parsear_fecha_es(df["FECHA CIERRE"])
 
-    hoy = pd.Timestamp.now().normalize()
     df["FECHA_RIESGO"] = df["FIN CONV"] + pd.DateOffset(months=3)
 
     # -------- Filtrado de alumnos en riesgo --------
     # (estados vacíos o falsos) + es GE + FIN CONV definido + fecha de riesgo vencida
-    def _is_false_or_blank(s):
-        if pd.isna(s):
-            return True
-        t = str(s).strip().lower()
-        return t in ("", "nan", "false", "0", "no")
-
     mask_activos = (
-        df["CONSECUCIÓN GE"].map(_is_false_or_blank) &
-        df["DEVOLUCIÓN GE"].map(_is_false_or_blank) &
-        df["INAPLICACIÓN GE"].map(_is_false_or_blank)
+        es_falso_o_vacio(df["CONSECUCIÓN GE"]) &
+        es_falso_o_vacio(df["DEVOLUCIÓN GE"]) &
+        es_falso_o_vacio(df["INAPLICACIÓN GE"])
     )
 
     ge_col = df["PRÁCTICAS/GE"].fillna("")
@@ -118,10 +84,31 @@ def render(df: pd.DataFrame):
         df["FIN CONV"].notna() &
         (df["FECHA_RIESGO"] <= hoy)
     ].copy()
+    df_filtrado["RIESGO ECONÓMICO"] = df_filtrado["RIESGO ECONÓMICO"].map(limpiar_riesgo)
 
-    total_alumnos = len(df_filtrado)
+    # 🔴 DEVOLUCIÓN GE
+    df["DEVOLUCIÓN GE"] = a_booleano(df["DEVOLUCIÓN GE"]).fillna(False).astype(bool)
+    df_devolucion = df[df["DEVOLUCIÓN GE"]].copy()
+    df_devolucion["RIESGO ECONÓMICO"] = df_devolucion["RIESGO ECONÓMICO"].map(limpiar_riesgo)
 
-    df_filtrado["RIESGO ECONÓMICO"] = df_filtrado["RIESGO ECONÓMICO"].map(limpiar_riesgo)
+    return {"faltan": [], "filtrado": df_filtrado, "devolucion": df_devolucion}
+
+def render(df: pd.DataFrame):
+    st.title("💰 Riesgo Económico")
+
+    # 🔄 Botón para recargar / limpiar caché
+    if st.button("🔄 Recargar / limpiar caché"):
+        invalidar("empleo")
+        st.success("Caché de Empleo limpiada. Datos recargados.")
+
+    hoy = pd.Timestamp.now().normalize()
+    prep = _preparar_riesgo(df, hoy)
+    if prep["faltan"]:
+        st.error("❌ Faltan columnas: " + ", ".join(prep["faltan"]))
+        return
+    df_filtrado, df_devolucion = prep["filtrado"], prep["devolucion"]
+
+    total_alumnos = len(df_filtrado)
     suma_riesgo = df_filtrado["RIESGO ECONÓMICO"].sum()
     suma_riesgo_str = f"{suma_riesgo:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " €"
 
@@ -129,11 +116,6 @@ def render(df: pd.DataFrame):
         df_filtrado["EJECUCIÓN GARANTÍA"].notna() & (df_filtrado["EJECUCIÓN GARANTÍA"] < hoy)
     ].shape[0]
 
-    # 🔴 DEVOLUCIÓN GE
-    df["DEVOLUCIÓN GE"] = df["DEVOLUCIÓN GE"].apply(normalizar_booleano)
-    df_devolucion = df[df["DEVOLUCIÓN GE"] == True].copy()
-    df_devolucion["RIESGO ECONÓMICO"] = df_devolucion["RIESGO ECONÓMICO"].map(limpiar_riesgo)
-
     total_devoluciones = df_devolucion.shape[0]
     total_riesgo_devolucion = df_devolucion["RIESGO ECONÓMICO"].sum()
     riesgo_devolucion_str = f"{total_riesgo_devolucion:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") + " €"
@@ -1,78 +1,8 @@
 import streamlit as st
-import pandas as pd
-import io
-import requests
-import msal
 from datetime import datetime
-
-# =========================
-# 🔐 CARGA DESDE SHAREPOINT
-# =========================
-@st.cache_resource
-def _msal_app_empleo():
-    cfg = st.secrets["empleo"]
-    return msal.ConfidentialClientApplication(
-        client_id=cfg["client_id"],
-        client_credential=cfg["client_secret"],
-        authority=f"https://login.microsoftonline.com/{cfg['tenant_id']}",
-    )
-
-def _graph_token_empleo():
-    app = _msal_app_empleo()
-    scopes = ["https://graph.microsoft.com/.default"]
-    result = app.acquire_token_silent(scopes, account=None) or app.acquire_token_for_client(scopes)
-    if "access_token" not in result:
-        raise RuntimeError(result.get("error_description", "No se pudo obtener token de Graph"))
-    return result["access_token"]
-
-@st.cache_data(show_spinner=False)
-def cargar_empleo_sharepoint():
-    """
-    Lee el Excel 'EIP EMPLEO.xlsx' desde SharePoint usando los datos en st.secrets['empleo'].
-    Necesita en secrets:
-      domain = "grupomainjobs.sharepoint.com"
-      site_name = "GrupoMainjobs928"
-      file_path = "/EIP BBDD/EIP EMPLEO.xlsx"
-      worksheet_name = "GENERAL" (o usa worksheet_index)
-    """
-    cfg = st.secrets["empleo"]
-    token = _graph_token_empleo()
-    headers = {"Authorization": f"Bearer {token}"}
-
-    # 1) Obtener siteId a partir de domain + site_name (slug)
-    #    Ejemplo: https://graph.microsoft.com/v1.0/sites/{domain}:/sites/{site_name}
-    site_url = f"https://graph.microsoft.com/v1.0/sites/{cfg['domain']}:/sites/{cfg['site_name']}"
-    site_resp = requests.get(site_url, headers=headers)
-    site_resp.raise_for_status()
-    site_id = site_resp.json()["id"]
-
-    # 2) Listar drives del site y coger "Documentos" (o "Shared Documents" si tu tenant está en inglés)
-    drives_resp = requests.get(f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives", headers=headers)
-    drives_resp.raise_for_status()
-    drives = drives_resp.json().get("value", [])
-    drive = next((d for d in drives if d["name"].lower() in ("documentos", "shared documents")), None)
-    if not drive:
-        raise RuntimeError("No se encontró la biblioteca 'Documentos' (o 'Shared Documents').")
-    drive_id = drive["id"]
-
-    # 3) Descargar el archivo por ruta
-    file_path = cfg["file_path"].lstrip("/")  # "EIP BBDD/EIP EMPLEO.xlsx"
-    content_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{file_path}:/content"
-    bin_resp = requests.get(content_url, headers=headers)
-    bin_resp.raise_for_status()
-    xls = io.BytesIO(bin_resp.content)
-
-    # 4) Leer hoja
-    ws_name = cfg.get("worksheet_name", "")
-    ws_index = int(cfg.get("worksheet_index", 0))
-    if ws_name:
-        df = pd.read_excel(xls, sheet_name=ws_name)
-    else:
-        df = pd.read_excel(xls, sheet_name=ws_index)
-
-    # Normaliza cabeceras como haces en tus páginas
-    df.columns = df.columns.str.strip()
-    return df
+from utils.datos_remotos import pintar_estado
+from utils.cache_ns import invalidar
+from utils.empleo import servir_empleo
 
 # =========================
 # 🚀 PÁGINA
@@ -80,9 +10,9 @@ def cargar_empleo_sharepoint():
 def desarrollo_page():
     fecha_actual = datetime.today().strftime("%d/%m/%Y")
 
-    # Botón de recarga (limpia caché de datos)
+    # Botón de recarga: se sigue viendo la copia actual mientras se descarga la nueva
     if st.button("🔄 Recargar datos desde SharePoint"):
-        st.cache_data.clear()
+        invalidar("empleo")
         st.rerun()
 
     st.markdown(
@@ -91,17 +21,23 @@ def desarrollo_page():
     )
 
     # Cargar datos de EMPLEO (SharePoint)
+    # (última copia buena al instante; si tiene más de max_edad_min se refresca en segundo plano)
+    # (el mismo libro y la misma copia que el panel principal: utils/empleo.py)
     try:
-        df = cargar_empleo_sharepoint()
+        datos = servir_empleo()
     except Exception as e:
         st.error(f"❌ Error al cargar los datos de SharePoint: {e}")
         return
 
+    for aviso in datos["valor"]["avisos"]:
+        st.info(aviso)
+    df = datos["valor"]["df"]  # copia propia (utils/empleo.py)
     if df is None or df.empty:
         st.warning("⚠️ No se pudieron cargar datos del documento.")
         return
 
     st.success("✅ Datos cargados correctamente desde SharePoint (EIP EMPLEO.xlsx / GENERAL).")
+    pintar_estado(datos)
 
     subcategorias = [
         "Principal",
@@ -10,6 +10,9 @@ import plotly.io as pio
 import plotly.graph_objects as go
 import streamlit as st
 
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import EIP, obtener_dataset, clientes_periodo, num_clientes
+
 
 # -------------------- helpers --------------------
 
@@ -39,11 +42,11 @@ def _card(title: str, value: float, tone: str = "green") -> str:
 # -------------------- página --------------------
 
 def render():
-    if "excel_data" not in st.session_state or st.session_state["excel_data"] is None:
+    df = obtener_dataset(EIP)
+    if df is None:
         st.warning("⚠️ No hay archivo cargado. Ve a la sección Gestión de Datos.")
         return
 
-    df = st.session_state["excel_data"].copy()
     if "Forma Pago" not in df.columns:
         st.error("La columna 'Forma Pago' no existe en el archivo.")
         return
@@ -72,14 +75,13 @@ def render():
     )
 
     if seleccion:
-        # A números
-        df_beca[seleccion] = df_beca[seleccion].apply(pd.to_numeric, errors="coerce").fillna(0)
-
+        # Las columnas de periodo ya llegan numéricas desde el registro
         # Sumas y nº de clientes (>0) por año
-        if "Cliente" in df_beca.columns:
-            num_cli_vals = [(df_beca.groupby("Cliente")[c].sum() > 0).sum() for c in seleccion]
+        agg_clientes = clientes_periodo(EIP, {"Forma Pago": ["BECAS ISA"]})
+        if agg_clientes is not None:
+            num_cli_vals = num_clientes(agg_clientes, seleccion, solo_positivos=True)
         else:
-            num_cli_vals = [(pd.to_numeric(df_beca[c], errors="coerce").fillna(0) > 0).sum() for c in seleccion]
+            num_cli_vals = [(df_beca[c] > 0).sum() for c in seleccion]
 
         suma = pd.DataFrame({
             "Año_txt": [c.replace("Total ", "") for c in seleccion],
@@ -194,7 +196,6 @@ def render():
             key="filtro_becas_isa_mes",
         )
         if sel_mes:
-            df_beca[sel_mes] = df_beca[sel_mes].apply(pd.to_numeric, errors="coerce").fillna(0)
             suma_mes = df_beca[sel_mes].sum().reset_index()
             suma_mes.columns = ["Mes", "Suma Total"]
             suma_mes = suma_mes[suma_mes["Suma Total"] > 0]
@@ -266,7 +267,6 @@ def render():
 
     # tarjetas de meses primero
     if sel_meses:
-        df_beca[sel_meses] = df_beca[sel_meses].apply(pd.to_numeric, errors="coerce").fillna(0)
         rest = df_beca[sel_meses].sum().reset_index()
         rest.columns = ["Mes", "Suma Total"]
         st.markdown("#### 📅 Meses restantes")
@@ -288,7 +288,6 @@ def render():
 
     # tarjetas de años después (incluye año actual con meses restantes)
     if sel_anios:
-        df_beca[sel_anios] = df_beca[sel_anios].apply(pd.to_numeric, errors="coerce").fillna(0)
         fut = df_beca[sel_anios].sum().reset_index()
         fut.columns = ["Año", "Suma Total"]
         fut["Año"] = fut["Año"].str.replace("Total ", "")
@@ -328,7 +327,7 @@ def render():
     )
 
     # ---------------- descargas ----------------
-    st.session_state["descarga_becas_isa"] = export_dict
+    guardar_sesion("exportaciones", "descarga_becas_isa", export_dict)
 
     if export_dict:
         buf = io.BytesIO()
@@ -349,7 +348,7 @@ def render():
         "becas_isa_informe.html",
         "text/html",
     )
-    st.session_state["html_becas_isa"] = html.getvalue()
+    guardar_sesion("exportaciones", "html_becas_isa", html.getvalue())
 
     os.makedirs("uploaded", exist_ok=True)
     with open("uploaded/reporte_becas_isa.html", "w", encoding="utf-8") as f:
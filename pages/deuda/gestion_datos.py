@@ -4,6 +4,9 @@ import io
 import os
 from datetime import datetime
 
+from utils.cache_memoria import contiene_sesion, guardar_sesion, leer_sesion
+from utils.cobro_store import EIP, obtener_dataset, obtener_cubo, resumen_cubo
+
 UPLOAD_FOLDER = "uploaded"
 TIEMPO_FILENAME = os.path.join(UPLOAD_FOLDER, "ultima_subida.txt")
 EXCEL_FILENAME = os.path.join(UPLOAD_FOLDER, "archivo_cargado.xlsx")
@@ -23,14 +26,11 @@ def cargar_marca_tiempo():
 # Hidratador: crea descarga_global si falta
 # ===============================
 def _ensure_descarga_global():
-    """Intenta generar st.session_state['descarga_global'] a partir de excel_data."""
-    if "descarga_global" in st.session_state:
+    """Intenta generar la exportación 'descarga_global' a partir del dataset de cobro."""
+    if contiene_sesion("exportaciones", "descarga_global"):
         return  # ya está
-    if "excel_data" not in st.session_state or st.session_state["excel_data"] is None:
-        return
-
-    df = st.session_state["excel_data"].copy()
-    if "Estado" not in df.columns:
+    cubo = obtener_cubo(EIP)
+    if cubo is None or cubo.empty:
         return
 
     anio_actual = st.session_state.get("año_actual", datetime.today().year)
@@ -38,31 +38,25 @@ def _ensure_descarga_global():
     # Columnas candidatas (históricas + meses del año actual)
     cols_hist = [f"Total {a}" for a in range(2018, anio_actual)]
     cols_mes  = [f"{m} {anio_actual}" for m in MESES_ES]
-    columnas_existentes = [c for c in cols_hist + cols_mes if c in df.columns]
+    columnas_existentes = [c for c in cols_hist + cols_mes if c in cubo.columns]
     if not columnas_existentes:
         return
 
-    # Numéricos + agrupación por Estado
-    df[columnas_existentes] = df[columnas_existentes].apply(pd.to_numeric, errors="coerce").fillna(0)
-    df_group = df.groupby("Estado")[columnas_existentes].sum().reset_index()
+    # Agrupación por Estado desde el cubo precalculado
+    df_group = resumen_cubo(cubo, "Estado", columnas_existentes)
     df_group["Total fila"] = df_group[columnas_existentes].sum(axis=1)
 
     # Clave usada para el ✅ en Gestión de Datos
-    st.session_state["descarga_global"] = df_group
+    guardar_sesion("exportaciones", "descarga_global", df_group)
 
 def render():
     st.header("📁 Gestión de Datos – Gestión de Cobro")
 
-    # Asegurar que los datos están en memoria
-    if "excel_data" not in st.session_state or st.session_state["excel_data"] is None:
-        if os.path.exists(EXCEL_FILENAME):
-            with open(EXCEL_FILENAME, "rb") as f:
-                content = f.read()
-                st.session_state["uploaded_excel_bytes"] = content
-                st.session_state["excel_data"] = pd.read_excel(io.BytesIO(content), dtype=str)
-        else:
-            st.warning("⚠️ No hay archivo de datos cargado.")
-            return
+    # Datos compartidos (se leen de disco una sola vez por proceso)
+    df = obtener_dataset(EIP)
+    if df is None:
+        st.warning("⚠️ No hay archivo de datos cargado.")
+        return
 
     # Intentar reconstruir 'descarga_global' si aún no existe
     _ensure_descarga_global()
@@ -72,7 +66,6 @@ def render():
     st.markdown(f"🕒 **Última actualización:** {upload_time}")
 
     # Preview (solo primeras filas por rendimiento)
-    df = st.session_state["excel_data"]
     st.markdown("### Vista previa del archivo cargado")
     st.dataframe(df.head(100), use_container_width=True)
 
@@ -80,8 +73,8 @@ def render():
     st.subheader("📋 Hojas disponibles:")
 
     def _has_any(*keys):
-        """Devuelve True si existe cualquiera de las claves en session_state."""
-        return any(k in st.session_state for k in keys)
+        """Devuelve True si esta sesión ya generó cualquiera de esas exportaciones."""
+        return any(contiene_sesion("exportaciones", k) for k in keys)
 
     def hoja_estado(keys, nombre):
         # Marca ✅ si hay DataFrame o HTML de esa hoja
@@ -107,11 +100,12 @@ def render():
     buffer = io.BytesIO()
     with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
         # Global: si tenemos DataFrame lo metemos; si sólo hay HTML, el hidratador ya habrá intentado crear DF
-        if "descarga_global" in st.session_state:
-            st.session_state["descarga_global"].to_excel(writer, sheet_name="Global", index=False)
+        df_global = leer_sesion("exportaciones", "descarga_global")
+        if df_global is not None:
+            df_global.to_excel(writer, sheet_name="Global", index=False)
 
-        if "descarga_pendiente_total" in st.session_state:
-            pendiente_total = st.session_state["descarga_pendiente_total"]
+        pendiente_total = leer_sesion("exportaciones", "descarga_pendiente_total")
+        if pendiente_total is not None:
             if isinstance(pendiente_total, dict):
                 for nombre, hoja in pendiente_total.items():
                     if isinstance(hoja, pd.DataFrame):
@@ -119,8 +113,8 @@ def render():
             elif isinstance(pendiente_total, pd.DataFrame):
                 pendiente_total.to_excel(writer, sheet_name="pendiente_total", index=False)
 
-        if "descarga_becas_isa" in st.session_state:
-            becas = st.session_state["descarga_becas_isa"]
+        becas = leer_sesion("exportaciones", "descarga_becas_isa")
+        if becas is not None:
             if isinstance(becas, dict):
                 for nombre, hoja in becas.items():
                     if isinstance(hoja, pd.DataFrame):
@@ -128,10 +122,9 @@ def render():
             elif isinstance(becas, pd.DataFrame):
                 becas.to_excel(writer, sheet_name="becas_isa", index=False)
 
-        if "descarga_pendiente_cobro_isa" in st.session_state:
-            d = st.session_state["descarga_pendiente_cobro_isa"]
-            if isinstance(d, pd.DataFrame):
-                d.to_excel(writer, sheet_name="pendiente_cobro_isa", index=False)
+        d = leer_sesion("exportaciones", "descarga_pendiente_cobro_isa")
+        if isinstance(d, pd.DataFrame):
+            d.to_excel(writer, sheet_name="pendiente_cobro_isa", index=False)
 
     buffer.seek(0)
     st.download_button(
@@ -151,7 +144,8 @@ def render():
         "html_pendiente_cobro_isa": "Pendiente Cobro ISA",
     }
 
-    htmls = {k: st.session_state[k] for k in html_claves if k in st.session_state}
+    htmls = {k: leer_sesion("exportaciones", k) for k in html_claves}
+    htmls = {k: v for k, v in htmls.items() if v is not None}
 
     if not htmls:
         st.info("ℹ️ Aún no hay informes HTML generados desde los módulos.")
@@ -9,6 +9,8 @@ import plotly.graph_objects as go
 import streamlit as st
 
 from responsive import get_screen_size
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import EIP, obtener_dataset, obtener_cubo, resumen_cubo
 
 
 # ===================== HELPERS =====================
@@ -87,11 +89,12 @@ def render():
     st.subheader("Estado")
 
     # datos base
-    if 'excel_data' not in st.session_state or st.session_state['excel_data'] is None:
+    df = obtener_dataset(EIP)
+    cubo = obtener_cubo(EIP)
+    if df is None:
         st.warning("⚠️ No hay archivo cargado. Vuelve a la sección Gestión de Cobro.")
         return
 
-    df = st.session_state['excel_data'].copy()
     if 'Estado' not in df.columns:
         st.error("❌ La columna 'Estado' no existe en el archivo.")
         return
@@ -99,7 +102,7 @@ def render():
     anio_actual = st.session_state.get('año_actual', datetime.today().year)
 
     # ===== filtros =====
-    estados_unicos = sorted(df['Estado'].dropna().unique())
+    estados_unicos = sorted(cubo.index.get_level_values("Estado").dropna().unique())
     columnas_totales = [f'Total {a}' for a in range(2018, anio_actual)]
     meses_actuales = [f'{m} {anio_actual}' for m in MESES_ES]
     columnas_disponibles = columnas_totales + meses_actuales
@@ -121,24 +124,22 @@ def render():
         st.info("Selecciona al menos un Estado.")
         return
 
-    columnas_existentes = [c for c in columnas_seleccionadas if c in df.columns]
+    columnas_existentes = [c for c in columnas_seleccionadas if c in cubo.columns]
     if not columnas_existentes:
         st.info("Selecciona al menos una columna válida.")
         return
 
-    # asegurar numéricos en las columnas seleccionadas
-    df[columnas_existentes] = df[columnas_existentes].apply(pd.to_numeric, errors='coerce').fillna(0)
-    df_filtrado = df[df['Estado'].isin(estados_seleccionados)].copy()
-    df_grouped = df_filtrado.groupby("Estado")[columnas_existentes].sum().reset_index()
+    # cortes del cubo precalculado (no se recorre el Excel completo)
+    filtro_estado = {"Estado": estados_seleccionados}
+    df_grouped = resumen_cubo(cubo, "Estado", columnas_existentes, filtro_estado)
 
     prev_year = anio_actual - 1
     prev_months_all = [f"{m} {prev_year}" for m in MESES_ES]
-    prev_months_existing = [c for c in prev_months_all if c in df.columns]
+    prev_months_existing = [c for c in prev_months_all if c in cubo.columns]
 
     df_prev_grouped = None
     if prev_months_existing:
-        df[prev_months_existing] = df[prev_months_existing].apply(pd.to_numeric, errors='coerce').fillna(0)
-        df_prev_grouped = df[df['Estado'].isin(estados_seleccionados)].groupby('Estado')[prev_months_existing].sum().reset_index()
+        df_prev_grouped = resumen_cubo(cubo, "Estado", prev_months_existing, filtro_estado)
 
     # ===== 1) Total acumulado por Estado =====
     width, height = get_screen_size()
@@ -377,7 +378,7 @@ def render():
 
     # ===== 3) Distribución Forma de Pago =====
     if "Forma Pago" in df.columns:
-        df_pago = df[df["Estado"].isin(estados_seleccionados)].copy()
+        df_pago = resumen_cubo(cubo, "Forma Pago", columnas_existentes, filtro_estado, dropna=False)
         df_pago["Total Periodo"] = df_pago[columnas_existentes].sum(axis=1)
 
         resumen_pago = (
@@ -412,7 +413,7 @@ def render():
     df_final = df_grouped.copy()
     df_final["Total fila"] = df_final[columnas_existentes].sum(axis=1)
 
-    st.session_state["descarga_global"] = df_final
+    guardar_sesion("exportaciones", "descarga_global", df_final)
 
     st.markdown("---")
     st.subheader("📥 Exportar esta hoja")
@@ -448,7 +449,7 @@ def render():
     with open("uploaded/reporte_estado.html", "w", encoding="utf-8") as f:
         f.write(html_buffer.getvalue())
 
-    st.session_state["html_global"] = html_buffer.getvalue()
+    guardar_sesion("exportaciones", "html_global", html_buffer.getvalue())
 
 
 # if __name__ == "__main__":
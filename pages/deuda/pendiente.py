@@ -8,6 +8,12 @@ import plotly.express as px
 import streamlit as st
 from plotly.io import to_html
 
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import (
+    EIP, obtener_dataset, motor_pendiente, split_pendiente,
+    clientes_periodo, tabla_clientes, num_clientes, suma_y_clientes,
+)
+
 # ======================================================
 # Utilidades
 # ======================================================
@@ -82,28 +88,25 @@ def vista_clientes_pendientes():
 
     st.header("📄 Clientes con Estado PENDIENTE")
 
-    if "excel_data" not in st.session_state or st.session_state["excel_data"] is None:
+    df = obtener_dataset(EIP)
+    if df is None:
         st.warning("⚠️ No hay archivo cargado. Ve a la sección Gestión de Datos.")
         return
 
-    df = st.session_state["excel_data"].copy()
     df.columns = df.columns.str.strip()
-    df["Estado"] = (
-        df["Estado"].astype(str)
-        .str.replace(r"\s+", " ", regex=True)
-        .str.strip().str.upper()
-    )
 
     df_pendiente = df[df["Estado"] == "PENDIENTE"].copy()
     if df_pendiente.empty:
         st.info("ℹ️ No hay registros con estado PENDIENTE.")
         return
 
+    # Cliente × periodo en un único groupby (cacheado por versión del dataset)
+    agg_clientes = clientes_periodo(EIP, {"Estado": ["PENDIENTE"]})
+
     año_actual = datetime.today().year
     mes_actual = datetime.today().month
     meses = ["Enero","Febrero","Marzo","Abril","Mayo","Junio",
              "Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"]
-    mes_actual_nombre = meses[mes_actual - 1]
 
     total_clientes_unicos = set()
 
@@ -120,11 +123,8 @@ def vista_clientes_pendientes():
     n_cli_18_21 = 0
 
     if cols_18_21:
-        df1 = df_pendiente[["Cliente"] + cols_18_21].copy()
-        df1[cols_18_21] = df1[cols_18_21].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df1 = df1.groupby("Cliente", as_index=False)[cols_18_21].sum()
         # permitir positivos/negativos distintos de 0
-        df1 = df1[df1[cols_18_21].sum(axis=1) != 0]
+        df1 = tabla_clientes(agg_clientes, cols_18_21)
         total_clientes_unicos.update(df1["Cliente"].unique())
 
         st.dataframe(df1, use_container_width=True)
@@ -141,7 +141,7 @@ def vista_clientes_pendientes():
         resumen_18_21 = pd.DataFrame({
             "Periodo": cols_18_21,
             "Total_Deuda": [df1[c].sum() for c in cols_18_21],
-            "Num_Clientes": [(df1.groupby("Cliente")[c].sum() != 0).sum() for c in cols_18_21],
+            "Num_Clientes": num_clientes(df1.set_index("Cliente"), cols_18_21),
         })
         resumen_18_21 = resumen_18_21[~((resumen_18_21["Total_Deuda"] == 0) & (resumen_18_21["Num_Clientes"] == 0))].reset_index(drop=True)
         if not resumen_18_21.empty:
@@ -173,10 +173,7 @@ def vista_clientes_pendientes():
     n_cli_22_25 = 0
 
     if cols_22_25:
-        df2 = df_pendiente[["Cliente"] + cols_22_25].copy()
-        df2[cols_22_25] = df2[cols_22_25].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df2 = df2.groupby("Cliente", as_index=False)[cols_22_25].sum()
-        df2 = df2[df2[cols_22_25].sum(axis=1) != 0]
+        df2 = tabla_clientes(agg_clientes, cols_22_25)
         total_clientes_unicos.update(df2["Cliente"].unique())
 
         st.dataframe(df2, use_container_width=True)
@@ -193,7 +190,7 @@ def vista_clientes_pendientes():
         resumen2 = pd.DataFrame({
             "Periodo": cols_22_25,
             "Total_Deuda": [df2[c].sum() for c in cols_22_25],
-            "Num_Clientes": [(df2.groupby("Cliente")[c].sum() != 0).sum() for c in cols_22_25],
+            "Num_Clientes": num_clientes(df2.set_index("Cliente"), cols_22_25),
         })
         resumen2 = resumen2[~((resumen2["Total_Deuda"] == 0) & (resumen2["Num_Clientes"] == 0))].reset_index(drop=True)
 
@@ -246,20 +243,20 @@ def vista_clientes_pendientes():
                     continue
                 meses_por_año.setdefault(y, []).append((i, c))
 
-    numeric_cols = col_totales[:]
-    for y, lst in meses_por_año.items():
-        numeric_cols += [col for _, col in lst]
-    if numeric_cols:
-        df_pendiente[numeric_cols] = df_pendiente[numeric_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
 
     def _sum_and_clients(cols):
-        if not cols:
-            return 0.0, 0
-        tmp = df_pendiente[["Cliente"] + cols].copy()
-        g = tmp.groupby("Cliente", as_index=False)[cols].sum()
-        total = float(g[cols].sum().sum())
-        ncli = int((g[cols].sum(axis=1) > 0).sum())
-        return total, ncli
+        return suma_y_clientes(agg_clientes, cols)
+
+    # Mes de corte (por defecto, el mes en curso): parte las tarjetas del año
+    # actual y el reparto con deuda / futuro del motor común.
+    mes_corte = st.selectbox(
+        "Mes de referencia (con deuda / futuro)",
+        list(range(1, 13)),
+        index=mes_actual - 1,
+        format_func=lambda m: f"{meses[m - 1]} {año_actual}",
+        key="pendiente_mes_corte",
+    )
+    mes_corte_nombre = meses[mes_corte - 1]
 
     tarjetas = []
 
@@ -277,21 +274,21 @@ def vista_clientes_pendientes():
         if total != 0:
             tarjetas.append(("Total " + str(y), total, ncli))
 
-    # Año actual → tres particiones
+    # Año actual → tres particiones según el mes de corte
     if año_actual in all_years_present:
         cols_mes_año = {m: f"{m} {año_actual}" for m in meses}
         cols_existentes = set(df_pendiente.columns)
 
         # 1) enero..mes-1
-        meses_pasados = meses[:max(mes_actual - 1, 0)]
+        meses_pasados = meses[:max(mes_corte - 1, 0)]
         cols_pasados = [cols_mes_año[m] for m in meses_pasados if cols_mes_año[m] in cols_existentes]
 
-        # 2) mes actual
-        col_mes_actual = cols_mes_año[mes_actual_nombre]
+        # 2) mes de corte
+        col_mes_actual = cols_mes_año[mes_corte_nombre]
         cols_mes_actual = [col_mes_actual] if col_mes_actual in cols_existentes else []
 
         # 3) mes+1..diciembre
-        meses_fut = meses[mes_actual:]
+        meses_fut = meses[mes_corte:]
         cols_futuro = [cols_mes_año[m] for m in meses_fut if cols_mes_año[m] in cols_existentes]
 
         tiene_mensuales_actual = any(c.endswith(f" {año_actual}") for c in cols_existentes)
@@ -307,7 +304,7 @@ def vista_clientes_pendientes():
             if cols_mes_actual:
                 total_act, ncli_act = _sum_and_clients(cols_mes_actual)
                 if total_act != 0:
-                    tarjetas.append((f"Pendiente {mes_actual_nombre}", total_act, ncli_act, "red"))
+                    tarjetas.append((f"Pendiente {mes_corte_nombre}", total_act, ncli_act, "red"))
             if cols_futuro:
                 total_fut, ncli_fut = _sum_and_clients(cols_futuro)
                 if total_fut != 0:
@@ -347,21 +344,10 @@ def vista_clientes_pendientes():
     # Suma de importes de todas las tarjetas
     suma_tarjetas = sum(item[1] for item in tarjetas)
 
-    # Pendiente con deuda
-    pendiente_con_deuda = 0.0
-    for item in tarjetas:
-        title = item[0]
-        if title.startswith("Total ") or title == "Pendiente actual" or title == f"Pendiente {mes_actual_nombre}":
-            pendiente_con_deuda += item[1]
-
-    # Pendiente futuro
-    pendiente_futuro = 0.0
-    for item in tarjetas:
-        title = item[0]
-        if title.startswith("Pendiente ") and title not in ("Pendiente actual", f"Pendiente {mes_actual_nombre}"):
-            pendiente_futuro += item[1]
-
-    total_pendiente = pendiente_con_deuda + pendiente_futuro
+    # Mismo mes de corte que las tarjetas del año actual
+    pendiente_con_deuda, pendiente_futuro, total_pendiente = split_pendiente(
+        motor_pendiente(EIP), año_actual, mes_corte
+    )
 
     st.markdown(
         f"**📌 Pendiente con deuda:** {_eu(pendiente_con_deuda)} €  &nbsp;&nbsp;|&nbsp;&nbsp; "
@@ -420,13 +406,9 @@ def vista_clientes_pendientes():
 
     df_detalle = df_pendiente[final_cols].copy()
 
-    # Detectar columnas numéricas (mensuales + totales + Importe Total Factura si existe) y convertir
-    numeric_candidates = set(mensual_cols + total_cols)
+    # Meses/totales ya son numéricos (esquema del registro); solo falta el importe de factura
     if "Importe Total Factura" in df_detalle.columns:
-        numeric_candidates.add("Importe Total Factura")
-    numeric_cols_present = [c for c in numeric_candidates if c in df_detalle.columns]
-    if numeric_cols_present:
-        df_detalle[numeric_cols_present] = df_detalle[numeric_cols_present].apply(pd.to_numeric, errors="coerce").fillna(0)
+        df_detalle["Importe Total Factura"] = pd.to_numeric(df_detalle["Importe Total Factura"], errors="coerce").fillna(0)
 
     # Total deuda por fila (suma de todos los meses+totales presentes)
     cols_suma_fila = [c for c in (mensual_cols + total_cols) if c in df_detalle.columns]
@@ -455,7 +437,8 @@ def vista_clientes_pendientes():
     column_config = {
         "Total deuda (fila)": st.column_config.NumberColumn("Total deuda (fila)", format="€ %.2f"),
     }
-    for c in numeric_cols_present:
+    cols_euros = [c for c in mensual_cols + total_cols + ["Importe Total Factura"] if c in df_detalle.columns]
+    for c in cols_euros:
         column_config[c] = st.column_config.NumberColumn(c, format="€ %.2f")
 
     st.dataframe(
@@ -504,10 +487,10 @@ def _card(title, amount, ncli, variant="blue"):
 
 def vista_año_2025():
     """Solo prepara datos para exportación (sin gráfico)."""
-    if "excel_data" not in st.session_state or st.session_state["excel_data"] is None:
+    df = obtener_dataset(EIP)
+    if df is None:
         return
 
-    df = st.session_state["excel_data"].copy()
     df_pendiente = df[df["Estado"].astype(str).str.strip().str.upper() == "PENDIENTE"]
 
     año_actual = datetime.today().year
@@ -516,12 +499,11 @@ def vista_año_2025():
                         and int(c.split()[-1]) <= año_actual]
     if not columnas_totales:
         return
-
-    df_pendiente[columnas_totales] = df_pendiente[columnas_totales].apply(pd.to_numeric, errors="coerce").fillna(0)
     resumen_total = pd.DataFrame({
         "Periodo": columnas_totales,
         "Suma_Total": [df_pendiente[c].sum() for c in columnas_totales],
-        "Num_Clientes": [(df_pendiente.groupby("Cliente")[c].sum() > 0).sum() for c in columnas_totales]
+        "Num_Clientes": num_clientes(clientes_periodo(EIP, {"Estado": ["PENDIENTE"]}), columnas_totales,
+                                     solo_positivos=True),
     })
     st.session_state["total_deuda_barras"] = float(resumen_total["Suma_Total"].sum())
     resultado_exportacion["Totales_Años_Meses"] = resumen_total
@@ -532,7 +514,7 @@ def render():
     vista_año_2025()
 
     if resultado_exportacion:
-        st.session_state["descarga_pendiente_total"] = resultado_exportacion
+        guardar_sesion("exportaciones", "descarga_pendiente_total", resultado_exportacion)
 
         # Excel
         buffer_excel = io.BytesIO()
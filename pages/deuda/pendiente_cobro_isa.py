@@ -7,6 +7,9 @@ import plotly.io as pio
 import io
 import os
 
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import EIP, obtener_dataset, clientes_periodo, tabla_clientes
+
 # ---------------- Utilidad formato €
 def _eu(n):
     try:
@@ -28,13 +31,12 @@ def render():
 
     st.header("📄 Pendientes de Cobro – Becas ISA")
 
-    if "excel_data" not in st.session_state or st.session_state["excel_data"] is None:
+    df = obtener_dataset(EIP)
+    if df is None:
         st.warning("⚠️ No hay archivo cargado. Ve a la sección Gestión de Cobro.")
         return
 
-    df = st.session_state["excel_data"].copy()
     df.columns = df.columns.str.strip()
-    df["Estado"] = df["Estado"].astype(str).str.strip().str.upper()
     df["Forma Pago"] = df["Forma Pago"].astype(str).str.strip().str.upper()
 
     # Filtrado PENDIENTE + BECAS ISA
@@ -82,10 +84,9 @@ def render():
     # ---- Tabla y gráfico por periodo (2022–2025 seleccionados) ----
     fig2 = None
     if cols_22_25:
-        df2 = df_pendiente[["Cliente"] + cols_22_25].copy()
-        df2[cols_22_25] = df2[cols_22_25].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df2 = df2.groupby("Cliente", as_index=False)[cols_22_25].sum()
-        df2 = df2[df2[cols_22_25].sum(axis=1) > 0]
+        # Cliente × periodo desde el agregado cacheado por versión (un único groupby)
+        agg_clientes = clientes_periodo(EIP, {"Estado": ["PENDIENTE"], "Forma Pago": ["BECAS ISA"]})
+        df2 = tabla_clientes(agg_clientes, cols_22_25, solo_positivos=True)
 
         if not df2.empty:
             # Suma hasta la última seleccionada como "Total Cliente"
@@ -161,7 +162,6 @@ def render():
     if columnas_sumatorias:
         columnas_finales = list(dict.fromkeys(columnas_info + columnas_sumatorias))
         df_detalle = df_pendiente[columnas_finales].copy()
-        df_detalle[columnas_sumatorias] = df_detalle[columnas_sumatorias].apply(pd.to_numeric, errors="coerce").fillna(0)
         df_detalle["Total deuda"] = df_detalle[columnas_sumatorias].sum(axis=1)
 
         # Agrupar por cliente (texto -> conjuntos únicos; totales -> suma)
@@ -229,7 +229,7 @@ def render():
 
         # Para exportaciones
         resultado_html_tabla = df_detalle.to_html(index=False)
-        st.session_state["descarga_pendiente_cobro_isa"] = df_detalle
+        guardar_sesion("exportaciones", "descarga_pendiente_cobro_isa", df_detalle)
 
         # ---- Descarga Excel ----
         buffer = io.BytesIO()
@@ -266,7 +266,7 @@ def render():
         file_name="becas_isa_pendientes.html",
         mime="text/html"
     )
-    st.session_state["html_pendiente_cobro_isa"] = html_content
+    guardar_sesion("exportaciones", "html_pendiente_cobro_isa", html_content)
 
     os.makedirs("uploaded", exist_ok=True)
     with open("uploaded/reporte_pendiente_cobro_isa.html", "w", encoding="utf-8") as f:
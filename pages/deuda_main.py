@@ -6,6 +6,11 @@ import pytz
 import os
 import io
 
+from utils.cobro_store import (
+    guardar_excel_subido, cargar_snapshot, borrar_snapshot,
+    EIP, publicar_dataset, version_dataset, retirar_dataset,
+)
+
 # Evita SettingWithCopyWarning globalmente
 pd.options.mode.copy_on_write = True
 
@@ -14,10 +19,9 @@ UPLOAD_FOLDER = "uploaded"
 EXCEL_FILENAME = "archivo_cargado.xlsx"
 TIEMPO_FILENAME = os.path.join(UPLOAD_FOLDER, "ultima_subida.txt")
 
-def guardar_excel(df):
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    ruta = os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME)
-    df.to_excel(ruta, index=False)
+def guardar_excel(contenido: bytes):
+    # el .xlsx tal cual se subió; el snapshot Parquet tipado lo escribe publicar_dataset
+    guardar_excel_subido(contenido, os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME))
 
 def guardar_marca_tiempo():
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -29,9 +33,7 @@ def guardar_marca_tiempo():
 
 def cargar_excel_guardado():
     ruta = os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME)
-    if os.path.exists(ruta):
-        return pd.read_excel(ruta, dtype=str)
-    return None
+    return cargar_snapshot(ruta)
 
 def cargar_marca_tiempo():
     if os.path.exists(TIEMPO_FILENAME):
@@ -51,19 +53,17 @@ from pages.deuda import estado_restante      # ✅ NUEVO: Estados restantes (con
 # ==============================================================================================
 
 def deuda_page():
-    if 'excel_data' not in st.session_state:
-        st.session_state['excel_data'] = None
     if 'excel_filename' not in st.session_state:
         st.session_state['excel_filename'] = None
     if 'upload_time' not in st.session_state:
         st.session_state['upload_time'] = None
 
-    if st.session_state['excel_data'] is None:
-        df_guardado = cargar_excel_guardado()
-        if df_guardado is not None:
-            st.session_state['excel_data'] = df_guardado
-            st.session_state['excel_filename'] = EXCEL_FILENAME
-            st.session_state['upload_time'] = cargar_marca_tiempo()
+    # El DataFrame vive en el registro compartido; la sesión solo guarda la versión
+    version_previa = st.session_state.get(f"{EIP}_version")
+    version = version_dataset(EIP)
+    if version is not None and (version != version_previa or st.session_state['excel_filename'] is None):
+        st.session_state['excel_filename'] = st.session_state['excel_filename'] or EXCEL_FILENAME
+        st.session_state['upload_time'] = cargar_marca_tiempo()
 
     col1, col2 = st.columns([0.8, 0.2])
     with col1:
@@ -83,30 +83,22 @@ def deuda_page():
                 df = pd.read_excel(xls, sheet_name=xls.sheet_names[0], dtype=str)
                 hora_local = guardar_marca_tiempo()
 
-                st.session_state['excel_data'] = df
+                guardar_excel(archivo.getvalue())
+                publicar_dataset(EIP, df, os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME))
+
                 st.session_state['excel_filename'] = archivo.name
                 st.session_state['upload_time'] = hora_local
 
-                guardar_excel(df)
-
                 st.success(f"✅ Archivo cargado y guardado: {archivo.name}")
                 st.rerun()
             except Exception as e:
                 st.error(f"❌ Error al procesar el archivo: {e}")
     else:
-        if st.session_state.get("excel_data") is None:
-            ruta_excel = os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME)
-            if os.path.exists(ruta_excel):
-                with open(ruta_excel, "rb") as f:
-                    content = f.read()
-                    st.session_state["uploaded_excel_bytes"] = content
-                    st.session_state["excel_data"] = pd.read_excel(io.BytesIO(content), dtype=str)
-                    st.session_state["upload_time"] = cargar_marca_tiempo()
-            else:
-                st.warning("⚠️ El administrador aún no ha subido el archivo.")
-                return
-
-    if st.session_state['excel_data'] is not None:
+        if version is None:
+            st.warning("⚠️ El administrador aún no ha subido el archivo.")
+            return
+
+    if version is not None:
         st.success(f"📎 Archivo cargado: {st.session_state['excel_filename']}")
 
     subcategorias = [
@@ -132,11 +124,10 @@ def deuda_page():
     with col2:
         if st.session_state.get('role') == "admin":
             if st.button("🗑️", key="trash_reset", help="Eliminar archivo y reiniciar"):
-                st.session_state['excel_data'] = None
                 st.session_state['excel_filename'] = None
                 st.session_state['upload_time'] = None
-                if os.path.exists(os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME)):
-                    os.remove(os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME))
+                borrar_snapshot(os.path.join(UPLOAD_FOLDER, EXCEL_FILENAME))
+                retirar_dataset(EIP)
                 if os.path.exists(TIEMPO_FILENAME):
                     os.remove(TIEMPO_FILENAME)
                 st.rerun()
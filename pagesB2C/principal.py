@@ -2,12 +2,18 @@
 
 import os
 import re
-import unicodedata
 from datetime import datetime
 
 import pandas as pd
 import streamlit as st
 
+from utils.normalizacion import quitar_tildes
+from utils.cache_ns import invalidar
+from utils.cobro_store import (
+    EIP, EIM, obtener_dataset, obtener_cubo, resumen_cubo,
+    motor_pendiente, split_pendiente,
+)
+
 # ===================== UTILIDADES UI =====================
 
 def format_euro(value: float) -> str:
@@ -43,35 +49,18 @@ MESES_NOMBRE = {
     7: "Julio", 8: "Agosto", 9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
 }
 MONTH_NAME_TO_NUM = {v: k for k, v in MESES_NOMBRE.items()}
-MESES_LIST = ["Enero","Febrero","Marzo","Abril","Mayo","Junio",
-              "Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"]
-
-def _strip_accents(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
 
 def _norm_key(s: str) -> str:
-    s = _strip_accents(str(s)).upper()
+    s = quitar_tildes(str(s)).upper()
     s = re.sub(r'[^A-Z0-9 ]', ' ', s)
     s = re.sub(r'\s+', ' ', s).strip()
     return s
 
-@st.cache_data(show_spinner=False)
-def _read_excel_cached(path: str, mtime: float) -> pd.DataFrame:
-    return pd.read_excel(path, dtype=str)
-
-def _load_any_from_session_or_files(session_key: str, fallbacks: list[str]) -> pd.DataFrame | None:
-    df = st.session_state.get(session_key)
-    if isinstance(df, pd.DataFrame) and not df.empty:
-        return df.copy()
-    for path in fallbacks:
-        if os.path.exists(path):
-            try:
-                mtime = os.path.getmtime(path)
-                df = _read_excel_cached(path, mtime)
-                st.session_state[session_key] = df.copy()
-                return df
-            except Exception:
-                continue
+def _load_dataset(clave: str) -> pd.DataFrame | None:
+    # Vista del dataset compartido (EIP/EIM); sin copias por sesión
+    df = obtener_dataset(clave)
+    if df is not None and not df.empty:
+        return df
     return None
 
 def _detect_period_columns(df: pd.DataFrame, anio_actual: int) -> list[str]:
@@ -86,108 +75,38 @@ def _detect_period_columns(df: pd.DataFrame, anio_actual: int) -> list[str]:
             cols.append(c)
     return cols
 
-def _sum_by_state_aliases(df: pd.DataFrame, anio_actual: int, aliases: list[str]) -> float:
-    """Suma por estado (para NO pendiente)."""
-    if df is None or df.empty or ("Estado" not in df.columns):
+def _sum_by_state_aliases(cubo: pd.DataFrame | None, anio_actual: int, aliases: list[str]) -> float:
+    """Suma por estado (para NO pendiente) a partir del cubo Estado × periodo."""
+    if cubo is None or cubo.empty:
         return 0.0
-    cols = _detect_period_columns(df, anio_actual)
+    cols = _detect_period_columns(cubo, anio_actual)
     if not cols:
         return 0.0
-    tmp = df.copy()
-    tmp["__ESTADO__"] = tmp["Estado"].apply(_norm_key)
-    tmp[cols] = tmp[cols].apply(pd.to_numeric, errors="coerce").fillna(0)
-    mask = tmp["__ESTADO__"].isin([_norm_key(a) for a in aliases])
+    por_estado = resumen_cubo(cubo, "Estado", cols)
+    # solo hay unas pocas filas (una por estado): el alias se resuelve sobre ellas
+    mask = por_estado["Estado"].map(_norm_key).isin([_norm_key(a) for a in aliases])
     if not mask.any():
         return 0.0
-    return float(tmp.loc[mask, cols].sum().sum())
+    return float(por_estado.loc[mask, cols].sum().sum())
 
 # --------- PENDIENTE ---------
 
-def _split_pending_like_pages(df: pd.DataFrame, anio_actual: int, aliases: list[str]) -> tuple[float, float, float]:
-    if df is None or df.empty or ("Estado" not in df.columns):
+def _split_pending_like_pages(clave: str, cubo: pd.DataFrame | None, anio_actual: int,
+                              aliases: list[str]) -> tuple[float, float, float]:
+    """Pendiente con deuda / futuro con el motor común de cobro (cacheado por versión)."""
+    if cubo is None or cubo.empty:
         return 0.0, 0.0, 0.0
-
-    tmp = df.copy()
-    tmp["__ESTADO__"] = tmp["Estado"].apply(_norm_key)
-    mask_pend = tmp["__ESTADO__"].isin([_norm_key(a) for a in aliases])
-    if not mask_pend.any():
+    objetivo = {_norm_key(a) for a in aliases}
+    estados = [e for e in cubo.index.get_level_values("Estado").unique()
+               if pd.notna(e) and _norm_key(e) in objetivo]
+    if not estados:
         return 0.0, 0.0, 0.0
-
-    all_cols = list(tmp.columns)
-
-    def _year_from_total(col):
-        try:
-            return int(col.split()[-1])
-        except Exception:
-            return None
-
-    col_totales = [c for c in all_cols if c.startswith("Total ") and c.split()[-1].isdigit()]
-    years_totales = sorted({_year_from_total(c) for c in col_totales if _year_from_total(c) is not None})
-
-    meses_por_año = {}
-    for c in all_cols:
-        for i, m in enumerate(MESES_LIST, start=1):
-            if c.startswith(f"{m} "):
-                try:
-                    y = int(c.split()[-1])
-                except Exception:
-                    continue
-                meses_por_año.setdefault(y, []).append((i, c))
-
-    numeric_cols = col_totales[:]
-    for y, lst in meses_por_año.items():
-        numeric_cols += [col for _, col in lst]
-    if numeric_cols:
-        tmp[numeric_cols] = tmp[numeric_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
-
-    mes_actual = datetime.now().month
-
-    def _sum_cols(cols) -> float:
-        if not cols:
-            return 0.0
-        return float(tmp.loc[mask_pend, cols].sum().sum())
-
-    con_deuda = 0.0
-    futuro    = 0.0
-
-    all_years_present = sorted(set(years_totales) | set(meses_por_año.keys()))
-
-    # Pasados
-    for y in [yy for yy in all_years_present if yy < anio_actual]:
-        if f"Total {y}" in tmp.columns:
-            con_deuda += _sum_cols([f"Total {y}"])
-        elif y in meses_por_año:
-            cols = [col for _, col in sorted(meses_por_año[y])]
-            con_deuda += _sum_cols(cols)
-
-    # Año actual
-    if anio_actual in all_years_present:
-        cols_aa = [col for _, col in sorted(meses_por_año.get(anio_actual, []))]
-        cols_actual  = [f"{m} {anio_actual}" for m in MESES_LIST[:mes_actual] if f"{m} {anio_actual}" in tmp.columns]
-        cols_futuro  = [f"{m} {anio_actual}" for m in MESES_LIST[mes_actual:] if f"{m} {anio_actual}" in tmp.columns]
-
-        if not cols_aa and f"Total {anio_actual}" in tmp.columns:
-            con_deuda += _sum_cols([f"Total {anio_actual}"])
-        else:
-            con_deuda += _sum_cols(cols_actual)
-            futuro    += _sum_cols(cols_futuro)
-
-    # Futuros
-    for y in [yy for yy in all_years_present if yy > anio_actual]:
-        cols = []
-        if y in meses_por_año:
-            cols += [col for _, col in sorted(meses_por_año[y])]
-        if f"Total {y}" in tmp.columns:
-            cols.append(f"Total {y}")
-        futuro += _sum_cols(cols)
-
-    total = con_deuda + futuro
-    return con_deuda, futuro, total
+    return split_pendiente(motor_pendiente(clave, tuple(estados)), anio_actual, datetime.now().month)
 
 # ===================== PV-FE (detector y totales) =====================
 
 def _norm_filename(s: str) -> str:
-    return _strip_accents(str(s)).lower().replace(" ", "")
+    return quitar_tildes(str(s)).lower().replace(" ", "")
 
 def _find_pvfe_file(candidates: list[str], folders_for_pattern: list[str]) -> str | None:
     for p in candidates:
@@ -314,10 +233,7 @@ def principal_page():
     st.title("Mainjobs B2C")
 
     if st.button("🔄 Recargar datos (B2C)"):
-        for k in ("excel_data", "excel_data_eim"):
-            if k in st.session_state:
-                del st.session_state[k]
-        st.cache_data.clear()
+        invalidar("cobro_eip", "cobro_eim")  # se relee de disco en la siguiente carga
         st.success("Caché limpiada. Datos recargados al vuelo.")
 
     COLORS = {
@@ -335,14 +251,8 @@ def principal_page():
 
     anio_actual = datetime.now().year
 
-    EIP_FALLBACKS = [os.path.join("uploaded", "archivo_cargado.xlsx")]
-    EIM_FALLBACKS = [
-        os.path.join("uploaded_eim", "archivo_cargado.xlsx"),
-        os.path.join("uploaded", "archivo_cargado_eim.xlsx"),
-    ]
-
-    df_eip = _load_any_from_session_or_files("excel_data", EIP_FALLBACKS)
-    df_eim = _load_any_from_session_or_files("excel_data_eim", EIM_FALLBACKS)
+    df_eip = _load_dataset(EIP)
+    df_eim = _load_dataset(EIM)
 
     STATE_ALIASES = {
         "COBRADO": ["COBRADO", "COBRADO TRANSFERENCIA", "COBRADO TARJETA", "COBRO RECIBIDO"],
@@ -354,26 +264,29 @@ def principal_page():
         "INCOBRABLE": ["INCOBRABLE", "INCROBRABLE"],
         "NO COBRADO": ["NO COBRADO", "NOCOBRADO"],
     }
-    def total_estado_b2x(df: pd.DataFrame, estado_key: str) -> float:
+    cubo_eip = obtener_cubo(EIP) if df_eip is not None else None
+    cubo_eim = obtener_cubo(EIM) if df_eim is not None else None
+
+    def total_estado_b2x(cubo: pd.DataFrame | None, estado_key: str) -> float:
         aliases = STATE_ALIASES.get(estado_key, [estado_key])
-        return _sum_by_state_aliases(df, anio_actual, aliases)
-
-    cob_eip   = total_estado_b2x(df_eip, "COBRADO")
-    conf_eip  = total_estado_b2x(df_eip, "DOMICILIACION CONFIRMADA")
-    emit_eip  = total_estado_b2x(df_eip, "DOMICILIACION EMITIDA")
-    dudo_eip  = total_estado_b2x(df_eip, "DUDOSO COBRO")
-    inco_eip  = total_estado_b2x(df_eip, "INCOBRABLE")
-    noco_eip  = total_estado_b2x(df_eip, "NO COBRADO")
-
-    cob_eim   = total_estado_b2x(df_eim, "COBRADO")
-    conf_eim  = total_estado_b2x(df_eim, "DOMICILIACION CONFIRMADA")
-    emit_eim  = total_estado_b2x(df_eim, "DOMICILIACION EMITIDA")
-    dudo_eim  = total_estado_b2x(df_eim, "DUDOSO COBRO")
-    inco_eim  = total_estado_b2x(df_eim, "INCOBRABLE")
-    noco_eim  = total_estado_b2x(df_eim, "NO COBRADO")
-
-    p_con_eip, p_fut_eip, p_tot_eip = _split_pending_like_pages(df_eip, anio_actual, STATE_ALIASES["PENDIENTE"])
-    p_con_eim, p_fut_eim, p_tot_eim = _split_pending_like_pages(df_eim, anio_actual, STATE_ALIASES["PENDIENTE"])
+        return _sum_by_state_aliases(cubo, anio_actual, aliases)
+
+    cob_eip   = total_estado_b2x(cubo_eip, "COBRADO")
+    conf_eip  = total_estado_b2x(cubo_eip, "DOMICILIACION CONFIRMADA")
+    emit_eip  = total_estado_b2x(cubo_eip, "DOMICILIACION EMITIDA")
+    dudo_eip  = total_estado_b2x(cubo_eip, "DUDOSO COBRO")
+    inco_eip  = total_estado_b2x(cubo_eip, "INCOBRABLE")
+    noco_eip  = total_estado_b2x(cubo_eip, "NO COBRADO")
+
+    cob_eim   = total_estado_b2x(cubo_eim, "COBRADO")
+    conf_eim  = total_estado_b2x(cubo_eim, "DOMICILIACION CONFIRMADA")
+    emit_eim  = total_estado_b2x(cubo_eim, "DOMICILIACION EMITIDA")
+    dudo_eim  = total_estado_b2x(cubo_eim, "DUDOSO COBRO")
+    inco_eim  = total_estado_b2x(cubo_eim, "INCOBRABLE")
+    noco_eim  = total_estado_b2x(cubo_eim, "NO COBRADO")
+
+    p_con_eip, p_fut_eip, p_tot_eip = _split_pending_like_pages(EIP, cubo_eip, anio_actual, STATE_ALIASES["PENDIENTE"])
+    p_con_eim, p_fut_eim, p_tot_eim = _split_pending_like_pages(EIM, cubo_eim, anio_actual, STATE_ALIASES["PENDIENTE"])
 
     cob_sum   = (cob_eip or 0.0)  + (cob_eim or 0.0)
     conf_sum  = (conf_eip or 0.0) + (conf_eim or 0.0)
@@ -5,11 +5,11 @@ import streamlit.components.v1 as components
 import pandas as pd
 import plotly.express as px
 import os
-import unicodedata
-import re
 from datetime import datetime
 from io import BytesIO
 from responsive import get_screen_size
+from utils.normalizacion import sin_tildes_lower, norm_clave, mapear_unicos
+from utils.programas import abreviar_programa, abreviar_programas, unificar_nombres
 
 # =========================
 # RUTAS / CONSTANTES (EIM)
@@ -46,24 +46,12 @@ PROGRAM_COLOR_MAP = {
 # =========================
 # UTILIDADES
 # =========================
-def _strip_accents_lower(s: str) -> str:
-    if not isinstance(s, str): return ""
-    s = s.strip().lower()
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-
-def _norm(s: str) -> str:
-    s = s or ""
-    s = str(s).strip().lower()
-    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-    s = re.sub(r"\s+", " ", s)
-    return s
-
 def _alias_comercial(s: str) -> str:
     if not isinstance(s, str): return ""
     raw = s.strip()
     if " " not in raw:
         return raw.lower()
-    parts = _norm(raw).split()
+    parts = norm_clave(raw).split()
     if len(parts) >= 2:
         return (parts[0][0] + parts[1]).lower()
     return parts[0].lower()
@@ -95,51 +83,11 @@ def lighten_hex(hex_color: str, factor: float = 0.85) -> str:
     except Exception:
         return "#f5f7fa"
 
-# ========= Abreviar nombres de programa (para tiles y gráficos) EN MAYÚSCULAS =========
-def abreviar_programa(nombre: str) -> str:
-    base = _strip_accents_lower(nombre)
-    if "ciber" in base or "hacking" in base or "ofensiva" in base:
-        return "CIBER"
-    if "sap" in base or "s/4hana" in base or "s 4 hana" in base:
-        return "SAP"
-    if "inteligencia artificial" in base or base.startswith("master ia") or base.startswith("máster ia") or base == "ia":
-        return "IA"
-    if "dpo" in base or "proteccion de datos" in base or "compliance" in base:
-        return "DPO"
-    if "rrhh" in base or "recursos humanos" in base:
-        return "RRHH"
-    if "energ" in base or "eerr" in base or "renovabl" in base:
-        return "EERR"
-    if "blackwell" in base:
-        return "BLACKWELL"
-    return nombre.upper() if isinstance(nombre, str) else nombre
-
-# =========================
-# CATEGORÍAS (para nombre_unificado)
-# =========================
-CATEGORIAS_KEYWORDS = {
-    "MÁSTER CIBERSEGURIDAD": ["ciber","ciberseguridad","hacking","etico","seguridad ofensiva","seguridad informatica","ethical hacking","ofensiva"],
-    "MÁSTER RRHH": ["rrhh","recursos humanos","gestion laboral","human resources"],
-    "MÁSTER EERR": ["eerr","energias","energia","renovables","energetica"],
-    "MÁSTER DPO": ["dpo","delegado de proteccion de datos","proteccion de datos","privacidad","rgpd","gdpr"],
-    "MÁSTER IA": ["ia","inteligencia artificial","machine learning","aprendizaje automatico"],
-    "CERTIFICACIÓN SAP S/4HANA": ["sap","s/4hana","certificacion sap","sap s4hana","sap s 4 hana"],
-    "MBA + RRHH": ["mba rrhh","mba + rrhh","mba y rrhh","mba recursos humanos"],
-    "PROGRAMA CALIFORNIA": ["california","programa california"],
-}
-def unificar_nombre(valor_original: str) -> str:
-    if not isinstance(valor_original, str) or not valor_original.strip(): return valor_original
-    base = _strip_accents_lower(valor_original)
-    for categoria, kws in CATEGORIAS_KEYWORDS.items():
-        for kw in kws:
-            if kw in base: return categoria
-    return valor_original
-
 # =========================
 # RESOLVER COLUMNAS PV-FE (robusto)
 # =========================
 def _resolver_columnas(cols):
-    norm_map = {_norm(c): c for c in cols}
+    norm_map = {norm_clave(c): c for c in cols}
     keys = list(norm_map.keys())
 
     def find_any(patterns):
@@ -167,7 +115,7 @@ def _encontrar_archivo_pvfe():
     if os.path.exists(PVFE_FILE): return PVFE_FILE
     if os.path.isdir(UPLOAD_FOLDER):
         for fn in os.listdir(UPLOAD_FOLDER):
-            if _norm(fn).startswith("listadofacturacionficticia"):
+            if norm_clave(fn).startswith("listadofacturacionficticia"):
                 return os.path.join(UPLOAD_FOLDER, fn)
     return None
 
@@ -207,7 +155,7 @@ def _pvfe_only_mode():
 
     # Comercial (alias)
     if cols["comer"]:
-        vista["_alias"] = vista[cols["comer"]].astype(str).apply(_alias_comercial)
+        vista["_alias"] = mapear_unicos(vista[cols["comer"]].astype(str), _alias_comercial)
     else:
         vista["_alias"] = "-"
 
@@ -352,7 +300,7 @@ def app():
 
     # ======= VENTAS =======
     df_ventas = pd.read_excel(VENTAS_FILE)
-    df_ventas.rename(columns={c: _strip_accents_lower(c) for c in df_ventas.columns}, inplace=True)
+    df_ventas.rename(columns={c: sin_tildes_lower(c) for c in df_ventas.columns}, inplace=True)
     if "nombre" not in df_ventas.columns or "propietario" not in df_ventas.columns:
         st.warning("❌ El archivo de ventas (EIM) debe tener columnas 'nombre' y 'propietario'.")
         return
@@ -372,13 +320,13 @@ def app():
 
     df_ventas["mes"]     = df_ventas["fecha de cierre"].dt.month_name().map(traducciones_meses)
     df_ventas["mes_num"] = df_ventas["fecha de cierre"].dt.month
-    df_ventas["nombre_unificado"] = df_ventas["nombre"].apply(unificar_nombre)
-    df_ventas["prog_corto"] = df_ventas["nombre_unificado"].apply(abreviar_programa)
+    df_ventas["nombre_unificado"] = unificar_nombres(df_ventas["nombre"])
+    df_ventas["prog_corto"] = abreviar_programas(df_ventas["nombre_unificado"])
 
     # ======= PREVENTAS (opcional) =======
     if os.path.exists(PREVENTAS_FILE):
         df_preventas = pd.read_excel(PREVENTAS_FILE)
-        df_preventas.rename(columns={c: _strip_accents_lower(c) for c in df_preventas.columns}, inplace=True)
+        df_preventas.rename(columns={c: sin_tildes_lower(c) for c in df_preventas.columns}, inplace=True)
         columnas_importe = [col for col in df_preventas.columns if "importe" in col]
     else:
         df_preventas = None
@@ -437,7 +385,7 @@ def app():
 
             # Filtrado por propietario (alias)
             if _cols_prev["comer"] and not is_all:
-                _dfp_prev["_alias"] = _dfp_prev[_cols_prev["comer"]].astype(str).apply(_alias_comercial)
+                _dfp_prev["_alias"] = mapear_unicos(_dfp_prev[_cols_prev["comer"]].astype(str), _alias_comercial)
                 _dfp_prev = _dfp_prev[_dfp_prev["_alias"] == selected_alias]
 
             if _cols_prev["total"]:
@@ -490,7 +438,7 @@ def app():
             owner_cols_prev = [c for c in dft_prev.columns if any(x in c for x in ["propietario","comercial","asesor","owner","vendedor","responsable"])]
             if owner_cols_prev:
                 ocol_prev = owner_cols_prev[0]
-                dft_prev["_alias"] = dft_prev[ocol_prev].astype(str).apply(_alias_comercial)
+                dft_prev["_alias"] = mapear_unicos(dft_prev[ocol_prev].astype(str), _alias_comercial)
                 if not is_all:
                     dft_prev = dft_prev[dft_prev["_alias"] == selected_alias]
             columnas_importe_prev = [col for col in dft_prev.columns if "importe" in col]
@@ -508,7 +456,7 @@ def app():
         """, unsafe_allow_html=True)
 
     # ======= RESUMEN & COLORES =======
-    df_ventas_filtrado["prog_corto"] = df_ventas_filtrado["nombre_unificado"].apply(abreviar_programa)
+    df_ventas_filtrado["prog_corto"] = abreviar_programas(df_ventas_filtrado["nombre_unificado"])
     resumen = df_ventas_filtrado.groupby(["prog_corto","propietario"]).size().reset_index(name="Total Matrículas")
     totales_propietario = resumen.groupby("propietario")["Total Matrículas"].sum().reset_index()
     totales_propietario["propietario_display"] = totales_propietario.apply(
@@ -706,7 +654,7 @@ def app():
         # ---------- Suma de PVP por Forma de Pago ----------
         fp_col = None
         for c in base_df.columns:
-            if _norm(str(c)) == "forma de pago":
+            if norm_clave(str(c)) == "forma de pago":
                 fp_col = c
                 break
 
@@ -839,7 +787,7 @@ def app():
 
     # Ventas/Preventas por alias
     ventas_by_alias = (
-        df_ventas_filtrado.assign(_alias=df_ventas_filtrado["propietario"].astype(str).apply(_alias_comercial))
+        df_ventas_filtrado.assign(_alias=mapear_unicos(df_ventas_filtrado["propietario"].astype(str), _alias_comercial))
                  .groupby("_alias")
                  .agg(ventas_count=("propietario","size"), ventas_importe=("importe","sum"))
                  .reset_index()
@@ -852,7 +800,7 @@ def app():
         if owner_cols:
             ocol = owner_cols[0]
             dft = df_preventas.copy()
-            dft["_alias"] = dft[ocol].astype(str).apply(_alias_comercial)
+            dft["_alias"] = mapear_unicos(dft[ocol].astype(str), _alias_comercial)
             if not is_all:
                 dft = dft[dft["_alias"] == selected_alias]
             imp_cols = [c for c in dft.columns if "importe" in c]
@@ -879,7 +827,7 @@ def app():
             dfp["_mes_es"] = ""
 
         if cols["comer"]:
-            dfp["_alias"] = dfp[cols["comer"]].astype(str).apply(_alias_comercial)
+            dfp["_alias"] = mapear_unicos(dfp[cols["comer"]].astype(str), _alias_comercial)
         else:
             dfp["_alias"] = "-"
 
@@ -10,6 +10,11 @@ import streamlit as st
 from plotly.io import to_html
 
 # Normalizador de EIM (el mismo que usas en pendiente_eim)
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import (
+    EIM, obtener_dataset, motor_pendiente, split_pendiente,
+    clientes_periodo, tabla_clientes, num_clientes, suma_y_clientes,
+)
 from utils.eim_normalizer import prepare_eim_df
 
 # ======================================================
@@ -23,7 +28,7 @@ ESTADOS_OPCIONES = [
     "INCOBRABLE",
 ]
 
-DATA_KEY = "excel_data_eim"  # <- clave de sesión para EIM
+DATA_KEY = EIM  # <- dataset compartido de EIM
 
 # ======================================================
 # Utilidades
@@ -98,26 +103,19 @@ def vista_estado_unico_eim():
 
     st.header("📄 Estados")
 
-    if DATA_KEY not in st.session_state or st.session_state[DATA_KEY] is None:
+    df_raw = obtener_dataset(DATA_KEY)
+    if df_raw is None:
         st.warning("⚠️ No hay archivo EIM cargado. Ve a la sección Gestión de Datos (EIM).")
         return
 
     # Normaliza el Excel EIM
-    df_raw = st.session_state[DATA_KEY]
-    df = prepare_eim_df(df_raw).copy()
+    df = prepare_eim_df(df_raw)
     df.columns = df.columns.str.strip()
 
     if "Estado" not in df.columns:
         st.error("❌ Falta la columna 'Estado' tras la normalización de EIM.")
         return
 
-    # Normaliza estado (mayúsculas, tildes preservadas)
-    df["Estado"] = (
-        df["Estado"].astype(str)
-        .str.replace(r"\s+", " ", regex=True)
-        .str.strip().str.upper()
-    )
-
     # ---------- Selector de estado (uno solo) ----------
     st.markdown("### 🎯 Selecciona el estado a analizar")
     estado_default = st.session_state.get("estado_restante_eim_sel", ESTADOS_OPCIONES[0])
@@ -133,6 +131,9 @@ def vista_estado_unico_eim():
         st.info(f"ℹ️ No hay registros para el estado seleccionado: **{estado_sel}**.")
         return
 
+    # Cliente × periodo en un único groupby (cacheado por versión y estado)
+    agg_clientes = clientes_periodo(EIM, {"Estado": [estado_sel]})
+
     # Etiqueta (para tarjetas)
     LABEL = estado_sel.title()
 
@@ -159,10 +160,7 @@ def vista_estado_unico_eim():
     n_cli_18_21 = 0
 
     if cols_18_21:
-        df1 = df_target[["Cliente"] + cols_18_21].copy()
-        df1[cols_18_21] = df1[cols_18_21].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df1 = df1.groupby("Cliente", as_index=False)[cols_18_21].sum()
-        df1 = df1[df1[cols_18_21].sum(axis=1) != 0]  # permitir negativos/positivos
+        df1 = tabla_clientes(agg_clientes, cols_18_21)  # permitir negativos/positivos ≠ 0
         total_clientes_unicos.update(df1["Cliente"].unique())
 
         st.dataframe(df1, use_container_width=True)
@@ -178,7 +176,7 @@ def vista_estado_unico_eim():
         resumen_18_21 = pd.DataFrame({
             "Periodo": cols_18_21,
             "Total_Deuda": [df1[c].sum() for c in cols_18_21],
-            "Num_Clientes": [(df1.groupby("Cliente")[c].sum() != 0).sum() for c in cols_18_21],
+            "Num_Clientes": num_clientes(df1.set_index("Cliente"), cols_18_21),
         })
         resumen_18_21 = resumen_18_21[~((resumen_18_21["Total_Deuda"] == 0) & (resumen_18_21["Num_Clientes"] == 0))].reset_index(drop=True)
         if not resumen_18_21.empty:
@@ -209,10 +207,7 @@ def vista_estado_unico_eim():
     n_cli_22_25 = 0
 
     if cols_22_25:
-        df2 = df_target[["Cliente"] + cols_22_25].copy()
-        df2[cols_22_25] = df2[cols_22_25].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df2 = df2.groupby("Cliente", as_index=False)[cols_22_25].sum()
-        df2 = df2[df2[cols_22_25].sum(axis=1) != 0]  # permitir negativos
+        df2 = tabla_clientes(agg_clientes, cols_22_25)  # permitir negativos/positivos ≠ 0
         total_clientes_unicos.update(df2["Cliente"].unique())
 
         st.dataframe(df2, use_container_width=True)
@@ -228,7 +223,7 @@ def vista_estado_unico_eim():
         resumen2 = pd.DataFrame({
             "Periodo": cols_22_25,
             "Total_Deuda": [df2[c].sum() for c in cols_22_25],
-            "Num_Clientes": [(df2.groupby("Cliente")[c].sum() != 0).sum() for c in cols_22_25],
+            "Num_Clientes": num_clientes(df2.set_index("Cliente"), cols_22_25),
         })
         resumen2 = resumen2[~((resumen2["Total_Deuda"] == 0) & (resumen2["Num_Clientes"] == 0))].reset_index(drop=True)
 
@@ -282,20 +277,9 @@ def vista_estado_unico_eim():
                     continue
                 meses_por_año.setdefault(y, []).append((i, c))
 
-    numeric_cols = col_totales[:]
-    for y, lst in meses_por_año.items():
-        numeric_cols += [col for _, col in lst]
-    if numeric_cols:
-        df_target[numeric_cols] = df_target[numeric_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
 
     def _sum_and_clients(cols):
-        if not cols:
-            return 0.0, 0
-        tmp = df_target[["Cliente"] + cols].copy()
-        g = tmp.groupby("Cliente", as_index=False)[cols].sum()
-        total = float(g[cols].sum().sum())
-        ncli = int((g[cols].sum(axis=1) != 0).sum())
-        return total, ncli
+        return suma_y_clientes(agg_clientes, cols, solo_positivos=False)
 
     tarjetas = []
 
@@ -379,16 +363,10 @@ def vista_estado_unico_eim():
     # ---------------- Totales consolidados ----------------
     total_clientes_unicos |= set(df_target["Cliente"].unique())
 
-    importe_actual = 0.0
-    importe_futuro = 0.0
-    for item in tarjetas:
-        title, amount = item[0], item[1]
-        if title.startswith("Total ") or title.endswith(" actual") or title.endswith(f" {mes_actual_nombre}"):
-            importe_actual += amount
-        elif title.endswith(" futuro") or title.split()[-1].isdigit():
-            importe_futuro += amount
-
-    total_importe = importe_actual + importe_futuro
+    # “actual” = Total YYYY + bloque actual + mes actual (motor común, cacheado por versión)
+    importe_actual, importe_futuro, total_importe = split_pendiente(
+        motor_pendiente(EIM, (estado_sel,)), año_actual, mes_actual
+    )
 
     st.markdown(
         f"**📌 {LABEL} — actual:** € {_eu(importe_actual)}  &nbsp;&nbsp;|&nbsp;&nbsp; "
@@ -417,7 +395,6 @@ def vista_estado_unico_eim():
     if columnas_sumatorias:
         columnas_finales = list(dict.fromkeys(columnas_info + columnas_sumatorias))
         df_detalle = df_target[columnas_finales].copy()
-        df_detalle[columnas_sumatorias] = df_detalle[columnas_sumatorias].apply(pd.to_numeric, errors="coerce").fillna(0)
         df_detalle["Total importe"] = df_detalle[columnas_sumatorias].sum(axis=1)
 
         # ===== Filtros del detalle =====
@@ -506,14 +483,14 @@ def _card(title, amount, ncli, variant="blue"):
 
 def vista_export_resumen_eim():
     """Solo prepara datos para exportación (sin gráfico)."""
-    if DATA_KEY not in st.session_state or st.session_state[DATA_KEY] is None:
+    df_raw = obtener_dataset(DATA_KEY)
+    if df_raw is None:
         return
 
-    df = prepare_eim_df(st.session_state[DATA_KEY]).copy()
+    df = prepare_eim_df(df_raw)
     df.columns = df.columns.str.strip()
     if "Estado" not in df.columns:
         return
-    df["Estado"] = df["Estado"].astype(str).str.replace(r"\s+", " ", regex=True).str.strip().str.upper()
 
     estado_sel = st.session_state.get("estado_restante_eim_sel", ESTADOS_OPCIONES[0])
     df_target = df[df["Estado"] == estado_sel]
@@ -524,12 +501,10 @@ def vista_export_resumen_eim():
                         and int(c.split()[-1]) <= año_actual]
     if not columnas_totales:
         return
-
-    df_target[columnas_totales] = df_target[columnas_totales].apply(pd.to_numeric, errors="coerce").fillna(0)
     resumen_total = pd.DataFrame({
         "Periodo": columnas_totales,
         "Suma_Total": [df_target[c].sum() for c in columnas_totales],
-        "Num_Clientes": [(df_target.groupby("Cliente")[c].sum() != 0).sum() for c in columnas_totales]
+        "Num_Clientes": num_clientes(clientes_periodo(EIM, {"Estado": [estado_sel]}), columnas_totales),
     })
     resultado_exportacion["Totales_Años_Meses"] = resumen_total
 
@@ -539,7 +514,7 @@ def render():
     vista_export_resumen_eim()
 
     if resultado_exportacion:
-        st.session_state["descarga_estado_restante_eim"] = resultado_exportacion
+        guardar_sesion("exportaciones", "descarga_estado_restante_eim", resultado_exportacion)
 
         # Excel
         buffer_excel = io.BytesIO()
@@ -3,6 +3,9 @@ import os
 import pandas as pd
 import streamlit as st
 
+from utils.cache_memoria import contiene_sesion, leer_sesion
+from utils.cobro_store import EIM, obtener_dataset
+
 # ===== Rutas (alineadas con deuda_main.py de EIM) =====
 UPLOAD_FOLDER_EIM   = "uploaded"
 EXCEL_FILENAME_EIM  = os.path.join(UPLOAD_FOLDER_EIM, "archivo_cargado_eim.xlsx")
@@ -36,28 +39,25 @@ def render():
     st.header("📁 Gestión de Datos – Gestión de Cobro (EIM)")
 
     # Asegurar datos en memoria para la vista previa
-    if "excel_data_eim" not in st.session_state or st.session_state["excel_data_eim"] is None:
-        if os.path.exists(EXCEL_FILENAME_EIM):
-            st.session_state["excel_data_eim"] = pd.read_excel(EXCEL_FILENAME_EIM, dtype=str)
-        else:
-            st.warning("⚠️ No hay archivo de datos cargado (EIM).")
-            return
+    df = obtener_dataset(EIM)
+    if df is None:
+        st.warning("⚠️ No hay archivo de datos cargado (EIM).")
+        return
 
     # Mostrar hora de carga
     upload_time = st.session_state.get("upload_time_eim", _cargar_marca_tiempo_eim())
     st.markdown(f"🕒 **Última actualización:** {upload_time}")
 
     # Vista previa (primeras filas)
-    df = st.session_state["excel_data_eim"]
     st.markdown("### Vista previa del archivo cargado")
     st.dataframe(df.head(100), use_container_width=True)
 
     st.markdown("---")
     st.subheader("📋 Hojas disponibles:")
 
-    # ✅ claves de sesión EIM
+    # ✅ exportaciones EIM de esta sesión
     def hoja_estado(clave, nombre):
-        return f"✅ {nombre}" if clave in st.session_state else f"❌ {nombre} aún no generado"
+        return f"✅ {nombre}" if contiene_sesion("exportaciones", clave) else f"❌ {nombre} aún no generado"
 
     hojas_disponibles = [
         hoja_estado("descarga_global_eim", "Global"),
@@ -71,10 +71,10 @@ def render():
 
     buffer = io.BytesIO()
     with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        if "descarga_global_eim" in st.session_state:
-            _safe_write_sheet(writer, "Global", st.session_state["descarga_global_eim"])
-        if "descarga_pendiente_total_eim" in st.session_state:
-            _safe_write_sheet(writer, "Pendiente_Total", st.session_state["descarga_pendiente_total_eim"])
+        for clave, hoja in (("descarga_global_eim", "Global"), ("descarga_pendiente_total_eim", "Pendiente_Total")):
+            datos = leer_sesion("exportaciones", clave)
+            if datos is not None:
+                _safe_write_sheet(writer, hoja, datos)
 
     buffer.seek(0)
     st.download_button(
@@ -92,7 +92,8 @@ def render():
         "html_global_eim": "Global",
         "html_pendiente_total_eim": "Pendiente Total",
     }
-    htmls = {k: st.session_state[k] for k in html_claves_eim if k in st.session_state}
+    htmls = {k: leer_sesion("exportaciones", k) for k in html_claves_eim}
+    htmls = {k: v for k, v in htmls.items() if v is not None}
 
     if not htmls:
         st.info("ℹ️ Aún no hay informes HTML generados desde los módulos (EIM).")
@@ -10,6 +10,8 @@ import plotly.graph_objects as go
 import streamlit as st
 
 from responsive import get_screen_size
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import EIP, EIM, obtener_dataset, obtener_cubo, resumen_cubo
 
 
 # ===================== HELPERS =====================
@@ -98,27 +100,29 @@ def render():
     st.subheader("Estado (EIM)")
 
     # cargamos df específico EIM o fallback genérico
-    df = st.session_state.get("excel_data_eim", None)
+    clave = EIM
+    df = obtener_dataset(EIM)
     if df is None:
-        df = st.session_state.get("excel_data", None)
+        clave = EIP
+        df = obtener_dataset(EIP)
 
-    if df is None or (isinstance(df, pd.DataFrame) and df.empty):
+    if df is None or df.empty:
         st.warning("⚠️ No hay archivo cargado. Vuelve a la sección Gestión de Datos (EIM).")
         return
 
-    df = df.copy()
     if "Estado" not in df.columns:
         st.error("❌ La columna 'Estado' no existe en el archivo.")
         return
+    cubo = obtener_cubo(clave)
 
     anio_actual = st.session_state.get('año_actual', datetime.today().year)
 
     # ===== filtros =====
-    estados_unicos = sorted(df['Estado'].dropna().unique())
+    estados_unicos = sorted(cubo.index.get_level_values("Estado").dropna().unique())
     columnas_totales = [f'Total {a}' for a in range(2018, anio_actual)]
     meses_actuales = [f'{m} {anio_actual}' for m in MESES_ES]
     # Solo mostrar columnas disponibles
-    columnas_disponibles = [c for c in (columnas_totales + meses_actuales) if c in df.columns]
+    columnas_disponibles = [c for c in (columnas_totales + meses_actuales) if c in cubo.columns]
 
     estados_seleccionados = st.multiselect(
         "Filtrar por Estado",
@@ -137,25 +141,23 @@ def render():
         st.info("Selecciona al menos un Estado.")
         return
 
-    columnas_existentes = [c for c in columnas_seleccionadas if c in df.columns]
+    columnas_existentes = [c for c in columnas_seleccionadas if c in cubo.columns]
     if not columnas_existentes:
         st.info("Selecciona al menos una columna válida.")
         return
 
-    # aseguramos numéricos en las columnas seleccionadas
-    df[columnas_existentes] = df[columnas_existentes].apply(pd.to_numeric, errors='coerce').fillna(0)
-    df_filtrado = df[df['Estado'].isin(estados_seleccionados)].copy()
-    df_grouped = df_filtrado.groupby("Estado")[columnas_existentes].sum().reset_index()
+    # cortes del cubo precalculado (no se recorre el Excel completo)
+    filtro_estado = {"Estado": estados_seleccionados}
+    df_grouped = resumen_cubo(cubo, "Estado", columnas_existentes, filtro_estado)
 
     # columnas mes año anterior disponibles (para comparar)
     prev_year = anio_actual - 1
     prev_months_all = [f"{m} {prev_year}" for m in MESES_ES]
-    prev_months_existing = [c for c in prev_months_all if c in df.columns]
+    prev_months_existing = [c for c in prev_months_all if c in cubo.columns]
 
     df_prev_grouped = None
     if prev_months_existing:
-        df[prev_months_existing] = df[prev_months_existing].apply(pd.to_numeric, errors='coerce').fillna(0)
-        df_prev_grouped = df[df['Estado'].isin(estados_seleccionados)].groupby('Estado')[prev_months_existing].sum().reset_index()
+        df_prev_grouped = resumen_cubo(cubo, "Estado", prev_months_existing, filtro_estado)
 
     # ===== 1) Total acumulado por Estado =====
     width, height = get_screen_size()
@@ -377,7 +379,7 @@ def render():
 
     # ===== 3) Distribución Forma de Pago (filtrada por Estado + columnas) =====
     if "Forma Pago" in df.columns:
-        df_pago = df[df["Estado"].isin(estados_seleccionados)].copy()
+        df_pago = resumen_cubo(cubo, "Forma Pago", columnas_existentes, filtro_estado, dropna=False)
         df_pago["Total Periodo"] = df_pago[columnas_existentes].sum(axis=1)
 
         resumen_pago = (
@@ -413,8 +415,8 @@ def render():
     df_final["Total fila"] = df_final[columnas_existentes].sum(axis=1)
 
     # Guardar con claves EIM y genérica
-    st.session_state["descarga_global_eim"] = df_final
-    st.session_state["descarga_global"] = df_final
+    guardar_sesion("exportaciones", "descarga_global_eim", df_final)
+    guardar_sesion("exportaciones", "descarga_global", df_final)
 
     st.markdown("---")
     st.subheader("📥 Exportar esta hoja")
@@ -503,7 +505,7 @@ def render():
 
     # Pie (filtrado) en HTML
     if "Forma Pago" in df.columns:
-        df_pago = df[df["Estado"].isin(estados_seleccionados)].copy()
+        df_pago = resumen_cubo(cubo, "Forma Pago", columnas_existentes, filtro_estado, dropna=False)
         df_pago["Total Periodo"] = df_pago[columnas_existentes].sum(axis=1)
         resumen_pago = (
             df_pago.groupby("Forma Pago", dropna=False)["Total Periodo"].sum().reset_index()
@@ -525,8 +527,8 @@ def render():
 
     html_value = html_buffer.getvalue()
     # Guardar HTML en session_state (EIM y genérico)
-    st.session_state["html_global_eim"] = html_value
-    st.session_state["html_global"] = html_value
+    guardar_sesion("exportaciones", "html_global_eim", html_value)
+    guardar_sesion("exportaciones", "html_global", html_value)
 
     st.download_button(
         label="📄 Descargar informe HTML",
@@ -9,12 +9,17 @@ import plotly.express as px
 import streamlit as st
 from plotly.io import to_html
 
+from utils.cache_memoria import guardar_sesion
+from utils.cobro_store import (
+    EIM, obtener_dataset, motor_pendiente, split_pendiente,
+    clientes_periodo, tabla_clientes, num_clientes, suma_y_clientes,
+)
 from utils.eim_normalizer import prepare_eim_df  # normalizador EIM
 
 # ===========================
 # Claves y utilidades
 # ===========================
-DATA_KEY = "excel_data_eim"
+DATA_KEY = EIM
 SAVE_KEY_XLS  = "descarga_pendiente_total_eim"
 SAVE_KEY_HTML = "html_pendiente_total_eim"
 
@@ -43,36 +48,33 @@ def vista_clientes_pendientes():
 
     st.header("📄 Clientes con Estado PENDIENTE")
 
-    if DATA_KEY not in st.session_state or st.session_state[DATA_KEY] is None:
+    df_raw = obtener_dataset(DATA_KEY)
+    if df_raw is None:
         st.warning("⚠️ No hay archivo cargado. Ve a la sección Gestión de Datos (EIM).")
         return
 
     # Normaliza EIM
-    df_raw = st.session_state[DATA_KEY]
-    df = prepare_eim_df(df_raw).copy()
+    df = prepare_eim_df(df_raw)
     df.columns = df.columns.str.strip()
 
     if "Estado" not in df.columns:
         st.error("❌ La columna 'Estado' no existe tras la normalización.")
         return
 
-    df["Estado"] = (
-        df["Estado"].astype(str)
-        .str.replace(r"\s+", " ", regex=True)
-        .str.strip().str.upper()
-    )
 
     df_pendiente = df[df["Estado"] == "PENDIENTE"].copy()
     if df_pendiente.empty:
         st.info("ℹ️ No hay registros con estado PENDIENTE.")
         return
 
+    # Cliente × periodo en un único groupby (cacheado por versión del dataset)
+    agg_clientes = clientes_periodo(EIM, {"Estado": ["PENDIENTE"]})
+
     # Fechas
     año_actual = datetime.today().year
     mes_actual = datetime.today().month
     meses = ["Enero","Febrero","Marzo","Abril","Mayo","Junio",
              "Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"]
-    mes_actual_nombre = meses[mes_actual - 1]
 
     total_clientes_unicos = set()
 
@@ -86,10 +88,7 @@ def vista_clientes_pendientes():
     n_cli_18_21 = 0
 
     if cols_18_21:
-        df1 = df_pendiente[["Cliente"] + cols_18_21].copy()
-        df1[cols_18_21] = df1[cols_18_21].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df1 = df1.groupby("Cliente", as_index=False)[cols_18_21].sum()
-        df1 = df1[df1[cols_18_21].sum(axis=1) > 0]
+        df1 = tabla_clientes(agg_clientes, cols_18_21, solo_positivos=True)
         total_clientes_unicos.update(df1["Cliente"].unique())
 
         st.dataframe(df1, use_container_width=True)
@@ -126,10 +125,7 @@ def vista_clientes_pendientes():
     n_cli_22_25 = 0
 
     if cols_22_25:
-        df2 = df_pendiente[["Cliente"] + cols_22_25].copy()
-        df2[cols_22_25] = df2[cols_22_25].apply(pd.to_numeric, errors="coerce").fillna(0)
-        df2 = df2.groupby("Cliente", as_index=False)[cols_22_25].sum()
-        df2 = df2[df2[cols_22_25].sum(axis=1) > 0]
+        df2 = tabla_clientes(agg_clientes, cols_22_25, solo_positivos=True)
         total_clientes_unicos.update(df2["Cliente"].unique())
 
         st.dataframe(df2, use_container_width=True)
@@ -148,7 +144,7 @@ def vista_clientes_pendientes():
         resumen2 = pd.DataFrame({
             "Periodo": cols_22_25,
             "Total_Deuda": [df2[c].sum() for c in cols_22_25],
-            "Num_Clientes": [(df2.groupby("Cliente")[c].sum() > 0).sum() for c in cols_22_25],
+            "Num_Clientes": num_clientes(df2.set_index("Cliente"), cols_22_25, solo_positivos=True),
         })
 
         # quitar periodos sin datos
@@ -227,21 +223,19 @@ def vista_clientes_pendientes():
                     continue
                 meses_por_año.setdefault(y, []).append((i, c))
 
-    # Fuerza numéricos
-    numeric_cols = col_totales[:]
-    for y, lst in meses_por_año.items():
-        numeric_cols += [col for _, col in lst]
-    if numeric_cols:
-        df_pendiente[numeric_cols] = df_pendiente[numeric_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
-
     def _sum_and_clients(cols):
-        if not cols:
-            return 0.0, 0
-        tmp = df_pendiente[["Cliente"] + cols].copy()
-        g = tmp.groupby("Cliente", as_index=False)[cols].sum()
-        total = float(g[cols].sum().sum())
-        ncli = int((g[cols].sum(axis=1) > 0).sum())
-        return total, ncli
+        return suma_y_clientes(agg_clientes, cols)
+
+    # Mes de corte (por defecto, el mes en curso): parte las tarjetas del año
+    # actual y el reparto con deuda / futuro del motor común.
+    mes_corte = st.selectbox(
+        "Mes de referencia (con deuda / futuro)",
+        list(range(1, 13)),
+        index=mes_actual - 1,
+        format_func=lambda m: f"{meses[m - 1]} {año_actual}",
+        key="pendiente_eim_mes_corte",
+    )
+    mes_corte_nombre = meses[mes_corte - 1]
 
     tarjetas = []
 
@@ -259,24 +253,24 @@ def vista_clientes_pendientes():
         if total != 0:
             tarjetas.append(("Total " + str(y), total, ncli))
 
-    # Año actual → 3 particiones:
+    # Año actual → 3 particiones según el mes de corte:
     #   1) "Pendiente actual" = enero..mes-1
-    #   2) "Pendiente {MesActual}" = solo mes actual (card roja)
+    #   2) "Pendiente {MesCorte}" = solo el mes de corte (card roja)
     #   3) "Pendiente {AñoActual} futuro" = mes+1..diciembre
     if año_actual in all_years_present:
         cols_mes_año = {m: f"{m} {año_actual}" for m in meses}
         cols_existentes = set(df_pendiente.columns)
 
         # 1) enero..mes-1
-        meses_pasados = meses[:max(mes_actual - 1, 0)]
+        meses_pasados = meses[:max(mes_corte - 1, 0)]
         cols_pasados = [cols_mes_año[m] for m in meses_pasados if cols_mes_año[m] in cols_existentes]
 
-        # 2) mes actual
-        col_mes_actual = cols_mes_año[mes_actual_nombre]
+        # 2) mes de corte
+        col_mes_actual = cols_mes_año[mes_corte_nombre]
         cols_mes_actual = [col_mes_actual] if col_mes_actual in cols_existentes else []
 
         # 3) mes+1..diciembre
-        meses_fut = meses[mes_actual:]
+        meses_fut = meses[mes_corte:]
         cols_futuro = [cols_mes_año[m] for m in meses_fut if cols_mes_año[m] in cols_existentes]
 
         # Si no hay mensuales pero sí Total del año → único bloque "Pendiente actual"
@@ -293,7 +287,7 @@ def vista_clientes_pendientes():
             if cols_mes_actual:
                 total_mes, ncli_mes = _sum_and_clients(cols_mes_actual)
                 if total_mes != 0:
-                    tarjetas.append((f"Pendiente {mes_actual_nombre}", total_mes, ncli_mes, "red"))
+                    tarjetas.append((f"Pendiente {mes_corte_nombre}", total_mes, ncli_mes, "red"))
             if cols_futuro:
                 total_fut, ncli_fut = _sum_and_clients(cols_futuro)
                 if total_fut != 0:
@@ -330,18 +324,10 @@ def vista_clientes_pendientes():
     total_clientes_unicos |= set(df_pendiente["Cliente"].unique())
     num_clientes_total = len(total_clientes_unicos)
 
-    # Pendiente con deuda y futuro (sumando por tarjetas)
-    pendiente_con_deuda = 0.0
-    pendiente_futuro = 0.0
-    for item in tarjetas:
-        title = item[0]
-        amount = item[1]
-        if title.startswith("Total ") or title == "Pendiente actual" or title == f"Pendiente {mes_actual_nombre}":
-            pendiente_con_deuda += amount
-        elif title.startswith("Pendiente "):
-            pendiente_futuro += amount
-
-    total_pendiente = pendiente_con_deuda + pendiente_futuro
+    # Mismo mes de corte que las tarjetas del año actual
+    pendiente_con_deuda, pendiente_futuro, total_pendiente = split_pendiente(
+        motor_pendiente(EIM), año_actual, mes_corte
+    )
 
     st.markdown(
         f"**📌 Pendiente con deuda:** {_eu(pendiente_con_deuda)} €  &nbsp;&nbsp;|&nbsp;&nbsp; "
@@ -392,13 +378,9 @@ def vista_clientes_pendientes():
 
     df_detalle = df_pendiente[final_cols].copy()
 
-    # Detectar columnas numéricas y convertir
-    numeric_candidates = set(mensual_cols + total_cols)
+    # Meses/totales ya son numéricos (esquema del registro); solo falta el importe de factura
     if "Importe Total Factura" in df_detalle.columns:
-        numeric_candidates.add("Importe Total Factura")
-    numeric_cols_present = [c for c in numeric_candidates if c in df_detalle.columns]
-    if numeric_cols_present:
-        df_detalle[numeric_cols_present] = df_detalle[numeric_cols_present].apply(pd.to_numeric, errors="coerce").fillna(0)
+        df_detalle["Importe Total Factura"] = pd.to_numeric(df_detalle["Importe Total Factura"], errors="coerce").fillna(0)
 
     # Total deuda por fila
     cols_suma_fila = [c for c in (mensual_cols + total_cols) if c in df_detalle.columns]
@@ -427,7 +409,8 @@ def vista_clientes_pendientes():
     column_config = {
         "Total deuda (fila)": st.column_config.NumberColumn("Total deuda (fila)", format="€ %.2f"),
     }
-    for c in numeric_cols_present:
+    cols_euros = [c for c in mensual_cols + total_cols + ["Importe Total Factura"] if c in df_detalle.columns]
+    for c in cols_euros:
         column_config[c] = st.column_config.NumberColumn(c, format="€ %.2f")
 
     st.dataframe(
@@ -468,9 +451,10 @@ def _card(title, amount, ncli, variant="blue"):
 
 def vista_totales_anuales():
     """Solo para exportación (sin gráfico)."""
-    if DATA_KEY not in st.session_state or st.session_state[DATA_KEY] is None:
+    df_raw = obtener_dataset(DATA_KEY)
+    if df_raw is None:
         return
-    df = prepare_eim_df(st.session_state[DATA_KEY]).copy()
+    df = prepare_eim_df(df_raw)
     if "Estado" not in df.columns:
         return
     df_pend = df[df["Estado"].astype(str).str.strip().str.upper() == "PENDIENTE"]
@@ -481,12 +465,11 @@ def vista_totales_anuales():
                         and int(c.split()[-1]) <= año_actual]
     if not columnas_totales:
         return
-
-    df_pend[columnas_totales] = df_pend[columnas_totales].apply(pd.to_numeric, errors="coerce").fillna(0)
     resumen_total = pd.DataFrame({
         "Periodo": columnas_totales,
         "Suma_Total": [df_pend[c].sum() for c in columnas_totales],
-        "Num_Clientes": [(df_pend.groupby("Cliente")[c].sum() > 0).sum() for c in columnas_totales]
+        "Num_Clientes": num_clientes(clientes_periodo(EIM, {"Estado": ["PENDIENTE"]}), columnas_totales,
+                                     solo_positivos=True),
     })
     st.session_state["total_deuda_barras_eim"] = float(resumen_total["Suma_Total"].sum())
     resultado_exportacion["Totales_Años_Meses"] = resumen_total
@@ -498,7 +481,7 @@ def render():
 
     # Exportaciones
     if resultado_exportacion:
-        st.session_state[SAVE_KEY_XLS] = resultado_exportacion
+        guardar_sesion("exportaciones", SAVE_KEY_XLS, resultado_exportacion)
 
         # Excel
         buffer_excel = io.BytesIO()
@@ -543,7 +526,7 @@ def render():
         html_buffer.write("</body></html>")
 
         html_str = html_buffer.getvalue()
-        st.session_state[SAVE_KEY_HTML] = html_str
+        guardar_sesion("exportaciones", SAVE_KEY_HTML, html_str)
         st.download_button(
             label="🌐 Descargar reporte HTML completo (EIM)",
             data=html_str,
@@ -6,6 +6,11 @@ import pytz
 from datetime import datetime
 import streamlit as st
 
+from utils.cobro_store import (
+    guardar_excel_subido, cargar_snapshot, borrar_snapshot,
+    EIM, publicar_dataset, version_dataset, retirar_dataset,
+)
+
 # ✅ importa los módulos reales, NO desde __init__.py
 from pagesEIM.deuda import gestion_datos_eim, global_eim, pendiente_eim
 from pagesEIM.deuda import estado_restante_eim   # ⬅️ nuevo import
@@ -16,9 +21,9 @@ EXCEL_FILENAME_EIM  = os.path.join(UPLOAD_FOLDER_EIM, "archivo_cargado.xlsx")
 TIEMPO_FILENAME_EIM = os.path.join(UPLOAD_FOLDER_EIM, "ultima_subida.txt")
 
 
-def _guardar_excel_eim(df: pd.DataFrame):
-    os.makedirs(UPLOAD_FOLDER_EIM, exist_ok=True)
-    df.to_excel(EXCEL_FILENAME_EIM, index=False)
+def _guardar_excel_eim(contenido: bytes):
+    # el .xlsx tal cual se subió; el snapshot Parquet tipado lo escribe publicar_dataset
+    guardar_excel_subido(contenido, EXCEL_FILENAME_EIM)
 
 
 def _guardar_marca_tiempo_eim():
@@ -31,9 +36,7 @@ def _guardar_marca_tiempo_eim():
 
 
 def _cargar_excel_guardado_eim():
-    if os.path.exists(EXCEL_FILENAME_EIM):
-        return pd.read_excel(EXCEL_FILENAME_EIM, dtype=str)
-    return None
+    return cargar_snapshot(EXCEL_FILENAME_EIM)
 
 
 def _cargar_marca_tiempo_eim():
@@ -46,20 +49,17 @@ def _cargar_marca_tiempo_eim():
 def deuda_eim_page():
     """Página principal: Gestión de Cobro · EIM"""
     # estado inicial
-    if "excel_data_eim" not in st.session_state:
-        st.session_state["excel_data_eim"] = None
     if "excel_filename_eim" not in st.session_state:
         st.session_state["excel_filename_eim"] = None
     if "upload_time_eim" not in st.session_state:
         st.session_state["upload_time_eim"] = None
 
-    # intenta cargar desde disco si no hay nada en sesión
-    if st.session_state["excel_data_eim"] is None:
-        df_guardado = _cargar_excel_guardado_eim()
-        if df_guardado is not None:
-            st.session_state["excel_data_eim"] = df_guardado
-            st.session_state["excel_filename_eim"] = "archivo_cargado.xlsx"
-            st.session_state["upload_time_eim"] = _cargar_marca_tiempo_eim()
+    # el DataFrame vive en el registro compartido; en sesión solo la versión
+    version_previa = st.session_state.get(f"{EIM}_version")
+    version = version_dataset(EIM)
+    if version is not None and (version != version_previa or st.session_state["excel_filename_eim"] is None):
+        st.session_state["excel_filename_eim"] = st.session_state["excel_filename_eim"] or "archivo_cargado.xlsx"
+        st.session_state["upload_time_eim"] = _cargar_marca_tiempo_eim()
 
     col_t, col_time = st.columns([0.8, 0.2])
     with col_t:
@@ -80,11 +80,11 @@ def deuda_eim_page():
                 df  = pd.read_excel(xls, sheet_name=xls.sheet_names[0], dtype=str)
                 hora = _guardar_marca_tiempo_eim()
 
-                # guarda en sesión + disco para todos
-                st.session_state["excel_data_eim"]     = df
+                # guarda en disco + registro compartido para todos
+                _guardar_excel_eim(archivo.getvalue())
+                publicar_dataset(EIM, df, EXCEL_FILENAME_EIM)
                 st.session_state["excel_filename_eim"] = archivo.name
                 st.session_state["upload_time_eim"]    = hora
-                _guardar_excel_eim(df)
 
                 st.success(f"✅ Archivo cargado y guardado: {archivo.name}")
                 st.rerun()
@@ -92,11 +92,11 @@ def deuda_eim_page():
                 st.error(f"❌ Error al procesar el archivo: {e}")
     else:
         # si no hay nada y tampoco hay archivo en disco
-        if st.session_state["excel_data_eim"] is None and not os.path.exists(EXCEL_FILENAME_EIM):
+        if version is None:
             st.info("⚠️ El administrador aún no ha subido el archivo.")
             return
 
-    if st.session_state["excel_data_eim"] is not None:
+    if version is not None:
         st.success(f"📎 Archivo cargado: {st.session_state['excel_filename_eim']}")
 
     # selector subpáginas (añadimos "Estado restante")
@@ -115,11 +115,10 @@ def deuda_eim_page():
     with c2:
         if st.session_state.get("role") == "admin":
             if st.button("🗑️", help="Eliminar archivo y reiniciar EIM", key="trash_reset_eim"):
-                st.session_state["excel_data_eim"] = None
                 st.session_state["excel_filename_eim"] = None
                 st.session_state["upload_time_eim"] = None
-                if os.path.exists(EXCEL_FILENAME_EIM):
-                    os.remove(EXCEL_FILENAME_EIM)
+                borrar_snapshot(EXCEL_FILENAME_EIM)
+                retirar_dataset(EIM)
                 if os.path.exists(TIEMPO_FILENAME_EIM):
                     os.remove(TIEMPO_FILENAME_EIM)
                 st.rerun()
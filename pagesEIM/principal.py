@@ -1,18 +1,15 @@
 # pagesEIM/principal.py
 
-import os
 import re
-import unicodedata
 from datetime import datetime
 
 import pandas as pd
 import streamlit as st
-import folium
-from streamlit_folium import folium_static
 
-from utils.geo_utils import (
-    normalize_text, PROVINCIAS_COORDS, PAISES_COORDS, geolocalizar_pais
-)
+from utils.normalizacion import quitar_tildes
+from utils.cache_ns import invalidar
+from utils.mapa_alumnos import pintar_mapa
+from utils.cobro_store import EIM, RUTAS_DATASET, obtener_dataset, obtener_cubo, resumen_cubo, motor_pendiente, split_pendiente
 
 # =========================================================
 # Utils
@@ -44,34 +41,20 @@ def render_bar_card(title: str, value: float, bg: str, emoji: str = "") -> str:
     """
 
 # =========================================================
-# Carga EIM: sesión -> disco (dos rutas compatibles)
+# Carga EIM: registro compartido (lee de disco una vez por proceso)
 # =========================================================
-EIM_UPLOAD_FALLBACKS = [
-    os.path.join("uploaded_eim", "archivo_cargado.xlsx"),   # donde guarda la sección EIM
-    os.path.join("uploaded", "archivo_cargado_eim.xlsx"),   # compatibilidad
-]
-
 def load_eim_df_from_session_or_file() -> pd.DataFrame | None:
-    """Prioriza session_state; si no, busca excel en disco (dos rutas)."""
-    df = st.session_state.get("excel_data_eim")
-    if isinstance(df, pd.DataFrame) and not df.empty:
+    """Dataset EIM compartido (uploaded_eim/ o la ruta de compatibilidad en uploaded/)."""
+    df = obtener_dataset(EIM)
+    if df is not None and not df.empty:
         return df
-    for path in EIM_UPLOAD_FALLBACKS:
-        if os.path.exists(path):
-            try:
-                return pd.read_excel(path, dtype=str)
-            except Exception:
-                pass
     return None
 
 # =========================================================
 # Normalizadores
 # =========================================================
-def _strip_accents(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-
 def _norm_estado(s: str) -> str:
-    s = _strip_accents(str(s)).upper()
+    s = quitar_tildes(str(s)).upper()
     s = re.sub(r'\s+', ' ', s).strip()
     return s
 
@@ -80,96 +63,6 @@ MESES_NOMBRE = {
     7: "Julio", 8: "Agosto", 9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
 }
 
-# =========================================================
-# Split pendiente (misma lógica que Deuda/EIP)
-# =========================================================
-def _split_pending_like_deuda(df_gestion: pd.DataFrame, anio_actual: int) -> tuple[float, float, float]:
-    """
-    Devuelve (pendiente_con_deuda, pendiente_futuro, total_pendiente)
-    replicando la lógica de pages/deuda/pendiente.py:
-      - 'Pendiente con deuda': Totales de años pasados + meses transcurridos del año actual
-        (si solo hay 'Total año actual', se considera "actual"/con deuda)
-      - 'Pendiente futuro': Meses futuros del año actual + años futuros
-    """
-    if df_gestion is None or df_gestion.empty or ("Estado" not in df_gestion.columns):
-        return 0.0, 0.0, 0.0
-
-    df = df_gestion.copy()
-    df.columns = [c.strip() for c in df.columns]
-    df["Estado"] = (
-        df["Estado"].astype(str)
-        .str.replace(r"\s+", " ", regex=True)
-        .str.strip().str.upper()
-    )
-
-    df_p = df[df["Estado"] == "PENDIENTE"].copy()
-    if df_p.empty:
-        return 0.0, 0.0, 0.0
-
-    # Detectar columnas de totales y meses por año
-    all_cols = list(df_p.columns)
-    cols_totales = [c for c in all_cols if c.startswith("Total ") and c.split()[-1].isdigit()]
-
-    meses_por_anio: dict[int, list[str]] = {}
-    for c in all_cols:
-        for m in MESES_NOMBRE.values():
-            if c.startswith(f"{m} "):
-                try:
-                    y = int(c.split()[-1])
-                except Exception:
-                    continue
-                meses_por_anio.setdefault(y, []).append(c)
-
-    # Convertir a numérico
-    num_cols = cols_totales[:]
-    for lst in meses_por_anio.values():
-        num_cols += lst
-    num_cols = list(dict.fromkeys(num_cols))
-    if num_cols:
-        df_p[num_cols] = df_p[num_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
-
-    def _sum_cols(cols: list[str]) -> float:
-        if not cols:
-            return 0.0
-        return float(df_p[cols].sum().sum())
-
-    mes_actual = datetime.now().month
-    con_deuda = 0.0
-    futuro = 0.0
-
-    # Años pasados (2018..anio_actual-1)
-    for y in range(2018, anio_actual):
-        if f"Total {y}" in df_p.columns:
-            con_deuda += _sum_cols([f"Total {y}"])
-        elif y in meses_por_anio:
-            con_deuda += _sum_cols(meses_por_anio[y])
-
-    # Año actual: meses transcurridos vs futuros
-    meses_aa = meses_por_anio.get(anio_actual, [])
-    if meses_aa:
-        cols_act = [f"{MESES_NOMBRE[m]} {anio_actual}" for m in range(1, mes_actual + 1)
-                    if f"{MESES_NOMBRE[m]} {anio_actual}" in df_p.columns]
-        cols_fut = [f"{MESES_NOMBRE[m]} {anio_actual}" for m in range(mes_actual + 1, 13)
-                    if f"{MESES_NOMBRE[m]} {anio_actual}" in df_p.columns]
-        con_deuda += _sum_cols(cols_act)
-        futuro += _sum_cols(cols_fut)
-    elif f"Total {anio_actual}" in df_p.columns:
-        # Si no hay columnas por meses pero existe "Total {anio_actual}",
-        # lo consideramos "actual" (con deuda)
-        con_deuda += _sum_cols([f"Total {anio_actual}"])
-
-    # Años futuros (por si existieran columnas futuras)
-    for y in range(anio_actual + 1, anio_actual + 10):
-        cols = []
-        if y in meses_por_anio:
-            cols += meses_por_anio[y]
-        if f"Total {y}" in df_p.columns:
-            cols.append(f"Total {y}")
-        futuro += _sum_cols(cols)
-
-    total = con_deuda + futuro
-    return con_deuda, futuro, total
-
 # =========================================================
 # Página principal EIM
 # =========================================================
@@ -178,11 +71,7 @@ def principal_page():
 
     # Botón recargar / limpiar
     if st.button("🔄 Recargar datos (EIM)"):
-        for k in ["excel_data_eim", "upload_time_eim", "coords_cache"]:
-            if k in st.session_state:
-                del st.session_state[k]
-        st.cache_data.clear()
-        st.cache_resource.clear()
+        invalidar("cobro_eim")
         st.success("Caché limpiada.")
 
     anio_actual = datetime.now().year
@@ -194,7 +83,7 @@ def principal_page():
     df_gestion = load_eim_df_from_session_or_file()
 
     if df_gestion is None or df_gestion.empty:
-        rutas_txt = " o ".join([f"`{p}`" for p in EIM_UPLOAD_FALLBACKS])
+        rutas_txt = " o ".join([f"`{p}`" for p in RUTAS_DATASET[EIM]])
         st.info(
             f"No hay datos de Gestión de Cobro disponibles. "
             f"Sube el Excel en la sección **EIM** o publica un archivo en {rutas_txt}."
@@ -221,13 +110,8 @@ def principal_page():
             if not columnas_validas:
                 st.info("No se encontraron columnas de totales/meses en el archivo de Gestión de Cobro.")
             else:
-                df_gestion[columnas_validas] = df_gestion[columnas_validas].apply(pd.to_numeric, errors="coerce").fillna(0)
-                df_resumen = (
-                    df_gestion.groupby(col_estado)[columnas_validas]
-                              .sum()
-                              .reset_index()
-                              .rename(columns={col_estado: "Estado"})
-                )
+                # corte Estado × periodo del cubo compartido (una vez por versión)
+                df_resumen = resumen_cubo(obtener_cubo(EIM), "Estado", columnas_validas)
                 df_resumen["Total"] = df_resumen[columnas_validas].sum(axis=1)
 
                 # === Totales por estado (robusto con acentos) ===
@@ -249,7 +133,10 @@ def principal_page():
                     total_pend     = float(pending_ss.get("total", pend_con_deuda + pend_futuro))
                 else:
                     # Calcula aquí con la misma lógica que en DEUDA/EIP
-                    pend_con_deuda, pend_futuro, total_pend = _split_pending_like_deuda(df_gestion, anio_actual)
+                    # mismo criterio que Deuda/EIP (motor compartido, cacheado por versión)
+                    pend_con_deuda, pend_futuro, total_pend = split_pendiente(
+                        motor_pendiente(EIM), anio_actual, datetime.now().month
+                    )
 
                 # ✅ Total Generado = Cobrado + Confirmada + Emitida
                 total_generado = cobrado + domic_confirmada + domic_emitida
@@ -292,88 +179,7 @@ def principal_page():
     st.markdown("---")
     st.markdown("## 🌍 Global Alumnos")
 
-    df_mapa = load_eim_df_from_session_or_file()
-    if df_mapa is None or df_mapa.empty:
-        st.warning("⚠️ No hay archivo cargado para el mapa (EIM).")
-    else:
-        required_cols = ['Cliente', 'Provincia', 'País']
-        if not all(col in df_mapa.columns for col in required_cols):
-            st.error("❌ El archivo debe tener columnas: Cliente, Provincia, País.")
-        else:
-            if "coords_cache" not in st.session_state:
-                st.session_state["coords_cache"] = {}
-
-            df_u = df_mapa.drop_duplicates(subset=['Cliente', 'Provincia', 'País']).copy()
-            df_u['Provincia'] = df_u['Provincia'].apply(normalize_text).str.title().str.strip()
-            df_u['País'] = df_u['País'].apply(normalize_text).str.title().str.strip()
-
-            df_esp = df_u[(df_u['País'].str.upper() == 'ESPAÑA') & (df_u['Provincia'].isin(PROVINCIAS_COORDS))]
-            df_ext = df_u[(df_u['Provincia'].isna()) | (~df_u['Provincia'].isin(PROVINCIAS_COORDS)) | (df_u['País'] == "Gibraltar")]
-
-            count_prov = df_esp['Provincia'].value_counts().reset_index()
-            count_prov.columns = ['Entidad', 'Alumnos']
-
-            count_pais = df_ext['País'].value_counts().reset_index()
-            count_pais.columns = ['Entidad', 'Alumnos']
-
-            total_alumnos = int(count_prov['Alumnos'].sum() + count_pais['Alumnos'].sum())
-            st.markdown(
-                f"<div style='padding:4px 12px;display:inline-block;background:#e3f2fd;border-radius:6px;"
-                f"font-weight:700;color:#1565c0;'>👥 Total: {total_alumnos}</div>",
-                unsafe_allow_html=True
-            )
-
-            mapa = folium.Map(location=[25, 0], zoom_start=2, width="100%", height="700px", max_bounds=True)
-
-            # Provincias 🇪🇸
-            for _, row in count_prov.iterrows():
-                entidad, alumnos = row['Entidad'], int(row['Alumnos'])
-                coords = PROVINCIAS_COORDS.get(entidad)
-                if coords:
-                    folium.Marker(
-                        location=coords,
-                        popup=f"<b>{entidad}</b><br>Alumnos: {alumnos}",
-                        tooltip=f"{entidad} ({alumnos})",
-                        icon=folium.Icon(color="blue", icon="user", prefix="fa")
-                    ).add_to(mapa)
-
-            total_espana = int(count_prov['Alumnos'].sum())
-            folium.Marker(
-                location=[40.4268, -3.7138],
-                popup=f"<b>España (provincias)</b><br>Total alumnos: {total_espana}",
-                tooltip=f"España (provincias) ({total_espana})",
-                icon=folium.Icon(color="red", icon="flag", prefix="fa")
-            ).add_to(mapa)
-
-            def get_flag_emoji(pais_nombre):
-                FLAGS = {
-                    "Francia":"🇫🇷","Portugal":"🇵🇹","Italia":"🇮🇹","Alemania":"🇩🇪","Reino Unido":"🇬🇧",
-                    "Marruecos":"🇲🇦","Argentina":"🇦🇷","México":"🇲🇽","Colombia":"🇨🇴","Chile":"🇨🇱",
-                    "Brasil":"🇧🇷","Perú":"🇵🇪","Uruguay":"🇺🇾","Venezuela":"🇻🇪","Ecuador":"🇪🇨",
-                    "Gibraltar":"🇬🇮"
-                }
-                return FLAGS.get(pais_nombre.title(), "🌍")
-
-            # Países 🌍
-            for _, row in count_pais.iterrows():
-                entidad, alumnos = row['Entidad'], int(row['Alumnos'])
-                if entidad.upper() == "ESPAÑA":
-                    continue
-                coords = PAISES_COORDS.get(entidad) or st.session_state["coords_cache"].get(entidad)
-                if not coords:
-                    coords = geolocalizar_pais(entidad)
-                    if coords:
-                        st.session_state["coords_cache"][entidad] = coords
-                if coords:
-                    bandera = get_flag_emoji(entidad)
-                    folium.Marker(
-                        location=coords,
-                        popup=f"<b>{bandera} {entidad}</b><br>Alumnos: {alumnos}",
-                        tooltip=f"{bandera} {entidad} ({alumnos})",
-                        icon=folium.Icon(color="red", icon="globe", prefix="fa")
-                    ).add_to(mapa)
-
-            folium_static(mapa)
+    pintar_mapa(EIM)  # conteos y HTML del mapa por versión del dataset (utils/mapa_alumnos.py)
 
     # ===================== CLIENTES ESPAÑA INCOMPLETOS =====================
     st.markdown("---")
@@ -2,6 +2,10 @@
 import os
 import streamlit as st
 
+from utils.cache_memoria import metricas
+from utils.cache_ns import invalidar_pagina
+
+
 @st.cache_resource
 def _logo_path(unidad: str) -> str:
     """
@@ -156,28 +160,25 @@ def show_sidebar():
 
         # Recargar / limpiar caché
         if st.button("🔄 Recargar / limpiar caché", use_container_width=True, key="reload_cache"):
-            for k in [
-                "academica_excel_data",
-                "excel_data",
-                "excel_data_eim",
-                "df_ventas",
-                "df_preventas",
-                "df_gestion",
-                "df_empleo_informe",
-            ]:
-                if k in st.session_state:
-                    del st.session_state[k]
-            st.cache_data.clear()
-            st.cache_resource.clear()
+            # solo los datasets de la página activa; el resto de usuarios no se entera
+            invalidar_pagina(unidad_sel, st.session_state.get("current_page", ""))
             st.success("Caché limpiada. Volviendo a cargar…")
             st.rerun()
 
+        # Estado de la caché en memoria (compartida por todo el servidor)
+        with st.expander("📈 Uso de caché", expanded=False):
+            df_cache = metricas()
+            usado = df_cache.attrs["total_bytes"] / 1024 ** 2
+            presupuesto = df_cache.attrs["presupuesto_bytes"] / 1024 ** 2
+            st.caption(f"{usado:,.1f} MB de {presupuesto:,.0f} MB")
+            st.dataframe(df_cache, hide_index=True, use_container_width=True)
+
         # Cerrar sesión
         if st.button("🚪 Cerrar Sesión", use_container_width=True, key="logout_btn"):
             st.session_state["logged_in"] = False
             st.session_state["username"] = ""
-            st.session_state["excel_data"] = None
-            st.session_state["excel_data_eim"] = None
+            st.session_state["excel_data_version"] = None
+            st.session_state["excel_data_eim_version"] = None
             st.session_state["excel_filename"] = ""
             st.session_state["upload_time"] = None
             st.session_state["current_page"] = "Inicio"
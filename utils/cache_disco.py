@@ -0,0 +1,88 @@
+# utils/cache_disco.py
+# Caché en disco direccionada por contenido para los ficheros bajados de SharePoint.
+# - El nombre del fichero es su sha256: dos descargas iguales comparten fichero y
+#   un fichero ya publicado no se reescribe nunca (los lectores abren inmutables).
+# - Se escribe por trozos a un .tmp y se publica con os.replace (rename atómico),
+#   así que nadie ve un Excel a medias aunque haya varias sesiones descargando.
+# - Presupuesto de tamaño con desalojo LRU (mtime = último uso).
+import hashlib
+import os
+import tempfile
+import threading
+
+DIR_CACHE = os.environ.get("CACHE_DESCARGAS_DIR", os.path.join("cache_graph", "blobs"))
+MAX_BYTES = int(os.environ.get("CACHE_DESCARGAS_MAX_MB", "512")) * 1024 * 1024
+TAM_TROZO = 1024 * 1024
+
+_lock = threading.Lock()
+
+
+def ruta_blob(sha: str, ext: str = "") -> str:
+    return os.path.join(DIR_CACHE, sha[:2], sha + ext)
+
+
+def tocar(ruta: str) -> bool:
+    """Marca el blob como usado (LRU). False si ya no existe (desalojado)."""
+    try:
+        os.utime(ruta)
+        return True
+    except OSError:
+        return False
+
+
+def guardar_stream(trozos, ext: str = "") -> str:
+    """
+    Vuelca un iterable de bytes a la caché y devuelve la ruta inmutable del blob.
+    Pensado para `resp.iter_content(TAM_TROZO)` con stream=True: el fichero nunca
+    está entero en memoria.
+    """
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=DIR_CACHE, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for trozo in trozos:
+                if trozo:
+                    h.update(trozo)
+                    f.write(trozo)
+        final = ruta_blob(h.hexdigest(), ext)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        if os.path.exists(final):
+            os.remove(tmp)  # mismo contenido ya publicado
+            tocar(final)
+        else:
+            os.replace(tmp, final)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    desalojar(proteger=final)
+    return final
+
+
+def desalojar(max_bytes: int | None = None, proteger: str | None = None) -> None:
+    """Borra los blobs menos usados hasta quedar por debajo de `max_bytes` (MAX_BYTES por defecto)."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    with _lock:
+        blobs = []
+        for actual, _, ficheros in os.walk(DIR_CACHE):
+            for n in ficheros:
+                if n.endswith(".tmp"):
+                    continue
+                ruta = os.path.join(actual, n)
+                try:
+                    st_ = os.stat(ruta)
+                except OSError:
+                    continue
+                blobs.append((st_.st_mtime, st_.st_size, ruta))
+        total = sum(b[1] for b in blobs)
+        for _, tam, ruta in sorted(blobs):
+            if total <= max_bytes:
+                break
+            if ruta == proteger:
+                continue
+            try:
+                os.remove(ruta)  # quien ya lo tenga abierto lo sigue leyendo (POSIX)
+                total -= tam
+            except OSError:
+                pass
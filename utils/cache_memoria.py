@@ -0,0 +1,229 @@
+# utils/cache_memoria.py
+# Caché en memoria con presupuesto global de bytes y LRU por espacio.
+# Sustituye a los cachés ad hoc en st.session_state (coords_cache,
+# df_empleo_informe, academica_excel_data, descarga_*, html_*) y al de libros
+# parseados de graph_client, que crecían sin límite hasta que el contenedor
+# moría por memoria sin poder saber cuál había crecido.
+# - Todo el proceso comparte un único presupuesto (CACHE_MEMORIA_MAX_MB).
+# - Al pasarse se desaloja la entrada usada hace más tiempo de cualquier
+#   espacio; dentro de cada espacio el orden es LRU.
+# - metricas() da aciertos, fallos, desalojos y bytes residentes por espacio.
+# - Los registros de proceso que no pueden desalojarse (dataset de cobro vigente,
+#   referencias del stale-while-revalidate, descargas) declaran su tamaño con
+#   fijar_externo: cuentan en el presupuesto y en metricas(), y lo que ocupan se
+#   le quita a las entradas desalojables.
+# Los valores se guardan tal cual (sin copiar): quien los lea no debe mutarlos.
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+PRESUPUESTO_BYTES = int(os.environ.get("CACHE_MEMORIA_MAX_MB", "768")) * 1024 * 1024
+
+# Tope propio de algunos espacios, además del global
+LIMITES_NS = {
+    "exportaciones": PRESUPUESTO_BYTES // 4,
+}
+
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> dict:
+    return {"lock": threading.Lock(), "espacios": {}, "metricas": {}, "total": 0, "reloj": 0,
+            "calculando": {}, "externos": {}}
+
+
+def _espacio(reg: dict, ns: str) -> OrderedDict:
+    if ns not in reg["espacios"]:
+        reg["espacios"][ns] = OrderedDict()
+        reg["metricas"][ns] = {"aciertos": 0, "fallos": 0, "desalojos": 0, "bytes": 0}
+    return reg["espacios"][ns]
+
+
+def tamano(valor, _vistos=None) -> int:
+    """Bytes aproximados de `valor` (DataFrames con memory_usage(deep=True))."""
+    _vistos = set() if _vistos is None else _vistos
+    if id(valor) in _vistos:
+        return 0
+    _vistos.add(id(valor))
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(
+            tamano(k, _vistos) + tamano(v, _vistos) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valor) + sum(tamano(v, _vistos) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def _quitar(reg: dict, ns: str, clave, desalojo: bool) -> None:
+    _, n, _ = reg["espacios"][ns].pop(clave)
+    reg["total"] -= n
+    m = reg["metricas"][ns]
+    m["bytes"] -= n
+    if desalojo:
+        m["desalojos"] += 1
+
+
+def _desalojar(reg: dict, ns: str) -> None:
+    # primero el tope del espacio (sus entradas más viejas)...
+    limite = LIMITES_NS.get(ns)
+    esp = reg["espacios"][ns]
+    while limite is not None and reg["metricas"][ns]["bytes"] > limite and esp:
+        _quitar(reg, ns, next(iter(esp)), desalojo=True)
+    # ...y después el global
+    _desalojar_global(reg)
+
+
+def _desalojar_global(reg: dict) -> None:
+    # la entrada menos reciente de todos los espacios hasta caber junto a los externos
+    externos = sum(n for _, n in reg["externos"].values())
+    while reg["total"] + externos > PRESUPUESTO_BYTES:
+        candidatos = [(next(iter(e.values()))[2], n) for n, e in reg["espacios"].items() if e]
+        if not candidatos:
+            break
+        _, victima = min(candidatos)
+        _quitar(reg, victima, next(iter(reg["espacios"][victima])), desalojo=True)
+
+
+_FALTA = object()
+
+
+def leer(ns: str, clave, defecto=None):
+    reg = _registro()
+    with reg["lock"]:
+        esp = _espacio(reg, ns)
+        ent = esp.get(clave, _FALTA)
+        if ent is _FALTA:
+            reg["metricas"][ns]["fallos"] += 1
+            return defecto
+        reg["reloj"] += 1
+        esp[clave] = (ent[0], ent[1], reg["reloj"])
+        esp.move_to_end(clave)
+        reg["metricas"][ns]["aciertos"] += 1
+        return ent[0]
+
+
+def contiene(ns: str, clave) -> bool:
+    """Sin tocar métricas ni el orden LRU."""
+    reg = _registro()
+    with reg["lock"]:
+        return clave in _espacio(reg, ns)
+
+
+def guardar(ns: str, clave, valor) -> None:
+    n = tamano(valor)
+    reg = _registro()
+    with reg["lock"]:
+        esp = _espacio(reg, ns)
+        if clave in esp:
+            _quitar(reg, ns, clave, desalojo=False)
+        if n > LIMITES_NS.get(ns, PRESUPUESTO_BYTES):
+            reg["metricas"][ns]["desalojos"] += 1  # no cabe: ni se intenta
+            return
+        reg["reloj"] += 1
+        esp[clave] = (valor, n, reg["reloj"])
+        reg["total"] += n
+        reg["metricas"][ns]["bytes"] += n
+        _desalojar(reg, ns)
+
+
+def memo(ns: str, clave, calcular):
+    """Valor de `clave` o `calcular()` guardado (dos sesiones pueden calcularlo a la vez)."""
+    valor = leer(ns, clave, _FALTA)
+    if valor is _FALTA:
+        valor = calcular()
+        guardar(ns, clave, valor)
+    return valor
+
+
+def memo_unico(ns: str, clave, calcular):
+    """Como memo(), pero si varias sesiones piden la misma clave a la vez solo una calcula."""
+    valor = leer(ns, clave, _FALTA)
+    if valor is not _FALTA:
+        return valor
+    reg = _registro()
+    with reg["lock"]:
+        candado = reg["calculando"].setdefault((ns, clave), threading.Lock())
+    try:
+        with candado:
+            # la que llegó primero ya lo ha guardado mientras esperábamos
+            if contiene(ns, clave):
+                valor = leer(ns, clave, _FALTA)
+            if valor is _FALTA:
+                valor = calcular()
+                guardar(ns, clave, valor)
+    finally:
+        with reg["lock"]:
+            reg["calculando"].pop((ns, clave), None)
+    return valor
+
+
+def borrar(ns: str, clave=_FALTA) -> None:
+    """Quita `clave` de `ns`, o el espacio entero si no se indica."""
+    reg = _registro()
+    with reg["lock"]:
+        esp = _espacio(reg, ns)
+        claves = list(esp) if clave is _FALTA else [clave] if clave in esp else []
+        for c in claves:
+            _quitar(reg, ns, c, desalojo=False)
+
+
+def fijar_externo(espacio: str, n_bytes: int, entradas: int) -> None:
+    """
+    Declara lo que ocupa ahora un registro de fuera de esta caché (sustituye a lo
+    declarado antes por `espacio`). No se desaloja desde aquí, pero entra en el
+    presupuesto: si hace falta sitio se desalojan entradas de los espacios normales.
+    """
+    reg = _registro()
+    with reg["lock"]:
+        reg["externos"][espacio] = (entradas, int(n_bytes))
+        _desalojar_global(reg)
+
+
+def metricas() -> pd.DataFrame:
+    """
+    Una fila por espacio: entradas, bytes, aciertos, fallos, desalojos y tasa de
+    acierto; los registros externos (fijar_externo) van con externo=True.
+    """
+    reg = _registro()
+    with reg["lock"]:
+        filas = [{"espacio": ns, "entradas": len(reg["espacios"][ns]), **m, "externo": False}
+                 for ns, m in reg["metricas"].items()]
+        filas += [{"espacio": ns, "entradas": entradas, "bytes": n, "aciertos": 0, "fallos": 0,
+                   "desalojos": 0, "externo": True}
+                  for ns, (entradas, n) in reg["externos"].items()]
+        total = reg["total"] + sum(n for _, n in reg["externos"].values())
+    df = pd.DataFrame(filas, columns=["espacio", "entradas", "bytes", "aciertos", "fallos", "desalojos",
+                                      "externo"])
+    consultas = df["aciertos"] + df["fallos"]
+    df["tasa_acierto"] = (df["aciertos"] / consultas.where(consultas > 0)).fillna(0.0)
+    df.attrs["total_bytes"] = total
+    df.attrs["presupuesto_bytes"] = PRESUPUESTO_BYTES
+    return df
+
+
+# ===================== Entradas por sesión =====================
+# Exportaciones y demás datos propios de un usuario: misma caché (y mismo
+# presupuesto) pero con la sesión en la clave.
+
+def _id_sesion() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "-"
+
+
+def leer_sesion(ns: str, clave, defecto=None):
+    return leer(ns, (_id_sesion(), clave), defecto)
+
+
+def contiene_sesion(ns: str, clave) -> bool:
+    return contiene(ns, (_id_sesion(), clave))
+
+
+def guardar_sesion(ns: str, clave, valor) -> None:
+    guardar(ns, (_id_sesion(), clave), valor)
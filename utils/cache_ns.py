@@ -0,0 +1,104 @@
+# utils/cache_ns.py
+# Espacios de caché por dataset. En lugar de st.cache_data.clear() /
+# st.cache_resource.clear() (que vacían todo el servidor para todos los
+# usuarios), cada botón de recarga invalida solo el dataset que enseña su página:
+# - sube la versión del espacio (para cachés que se indexan por versión),
+# - limpia las funciones st.cache_data registradas en ese espacio,
+# - ejecuta los ganchos que hayan registrado los módulos (registros de proceso),
+# - vacía su espacio homónimo de utils/cache_memoria.py,
+# - y borra de la sesión actual las claves de st.session_state asociadas.
+import threading
+
+import streamlit as st
+
+from utils.cache_memoria import borrar
+
+NAMESPACES = ("cobro_eip", "cobro_eim", "ventas", "leads", "empleo", "academica", "convenios")
+
+CLAVES_SESION = {
+    "cobro_eip": ["df_gestion"],
+    "cobro_eim": ["upload_time_eim"],
+    "ventas": ["df_ventas", "df_preventas"],
+    "leads": [],
+    "empleo": [],
+    "academica": [],
+    "convenios": [],
+}
+
+# Datasets que enseña cada página (unidad, página) para los botones de recarga genéricos
+DATASETS_PAGINA = {
+    ("EIP", "Principal"): ("cobro_eip", "ventas", "empleo", "academica"),
+    ("EIP", "Admisiones"): ("ventas", "leads"),
+    ("EIP", "Academica"): ("academica",),
+    ("EIP", "Desarrollo"): ("empleo", "convenios"),
+    ("EIP", "Gestión de Cobro"): ("cobro_eip",),
+    ("EIM", "Principal"): ("cobro_eim",),
+    ("EIM", "Admisiones"): ("ventas", "leads"),
+    ("EIM", "Gestión de Cobro"): ("cobro_eim",),
+    ("Mainjobs B2C", "Principal"): ("cobro_eip", "cobro_eim"),
+}
+
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> dict:
+    return {
+        "lock": threading.Lock(),
+        "versiones": {ns: 0 for ns in NAMESPACES},
+        "funciones": {ns: {} for ns in NAMESPACES},
+        "ganchos": {ns: {} for ns in NAMESPACES},
+    }
+
+
+def _validar(ns: str) -> None:
+    if ns not in NAMESPACES:
+        raise KeyError(f"Espacio de caché desconocido: {ns}")
+
+
+def version(ns: str) -> int:
+    _validar(ns)
+    return _registro()["versiones"][ns]
+
+
+def cache_data_ns(ns: str, **kwargs):
+    """st.cache_data(**kwargs) que además queda registrada en el espacio `ns`."""
+    _validar(ns)
+
+    def deco(func):
+        cacheada = st.cache_data(**kwargs)(func)
+        reg = _registro()
+        with reg["lock"]:
+            reg["funciones"][ns][f"{func.__module__}.{func.__qualname__}"] = cacheada
+        return cacheada
+    return deco
+
+
+def registrar_invalidador(ns: str, nombre: str, func) -> None:
+    """`func()` se ejecuta al invalidar `ns`. Idempotente por `nombre` (reimportar no duplica)."""
+    _validar(ns)
+    reg = _registro()
+    with reg["lock"]:
+        reg["ganchos"][ns][nombre] = func
+
+
+def invalidar(*namespaces: str) -> None:
+    reg = _registro()
+    for ns in namespaces:
+        _validar(ns)
+        with reg["lock"]:
+            reg["versiones"][ns] += 1
+            funciones = list(reg["funciones"][ns].values())
+            ganchos = list(reg["ganchos"][ns].values())
+        for f in funciones:
+            f.clear()
+        for g in ganchos:
+            g()
+        borrar(ns)
+        for k in CLAVES_SESION.get(ns, []):
+            st.session_state.pop(k, None)
+
+
+def invalidar_pagina(unidad: str, pagina: str) -> tuple:
+    """Invalida los datasets de la página activa; devuelve cuáles."""
+    datasets = DATASETS_PAGINA.get((unidad, pagina), ())
+    invalidar(*datasets)
+    return datasets
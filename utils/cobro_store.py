@@ -0,0 +1,529 @@
+# utils/cobro_store.py
+# Snapshot columnar (Parquet) del Excel de Gestión de Cobro.
+# El .xlsx se guarda tal cual lo sube el admin (sin pasar por df.to_excel), y
+# al lado va el .parquet ya tipado (aplicar_esquema): las lecturas posteriores
+# lo abren memory-mapped sin volver a parsear el libro ni repetir to_numeric.
+#
+# Además mantiene un registro compartido por todo el proceso: una única copia
+# (inmutable, versionada) de cada Excel para todas las sesiones. En la sesión
+# solo se guarda el id de versión.
+import os
+import re
+import threading
+from bisect import bisect_left
+import unicodedata
+import uuid
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.cache_memoria import fijar_externo, memo_unico, tamano
+from utils.cache_ns import registrar_invalidador
+
+# Las vistas que devuelve obtener_dataset comparten memoria con el registro;
+# con copy-on-write cualquier escritura de una página copia solo lo que toca.
+pd.options.mode.copy_on_write = True
+
+try:
+    import pyarrow  # noqa: F401
+    _HAS_PARQUET = True
+except Exception:
+    _HAS_PARQUET = False
+
+
+def ruta_snapshot(ruta_xlsx: str) -> str:
+    base, _ = os.path.splitext(ruta_xlsx)
+    return base + ".parquet"
+
+
+def guardar_excel_subido(contenido: bytes, ruta_xlsx: str) -> None:
+    """Escribe los bytes subidos tal cual (rename atómico, como el snapshot)."""
+    os.makedirs(os.path.dirname(ruta_xlsx) or ".", exist_ok=True)
+    tmp = ruta_xlsx + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(contenido)
+        os.replace(tmp, ruta_xlsx)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def guardar_snapshot(df: pd.DataFrame, ruta_xlsx: str) -> str | None:
+    """
+    Escribe el snapshot Parquet junto al Excel. `df` debe venir ya con el esquema
+    aplicado. Devuelve la ruta o None si no se pudo.
+    """
+    if not _HAS_PARQUET:
+        return None
+    # Parquet exige cabeceras de texto; si el Excel trae alguna numérica no se toca
+    if not all(isinstance(c, str) for c in df.columns):
+        return None
+    ruta = ruta_snapshot(ruta_xlsx)
+    tmp = ruta + ".tmp"
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, ruta)  # rename atómico: nadie lee un parquet a medias
+        return ruta
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+
+
+def _snapshot_vigente(ruta_xlsx: str) -> bool:
+    ruta = ruta_snapshot(ruta_xlsx)
+    if not _HAS_PARQUET or not os.path.exists(ruta):
+        return False
+    # si alguien ha dejado un .xlsx más nuevo a mano, el snapshot no vale
+    if os.path.exists(ruta_xlsx) and os.path.getmtime(ruta_xlsx) > os.path.getmtime(ruta):
+        return False
+    return True
+
+
+def cargar_snapshot(ruta_xlsx: str) -> pd.DataFrame | None:
+    """
+    Carga el Excel de cobro, ya tipado, priorizando el snapshot Parquet
+    (memory-mapped). Si no existe (o está desfasado) se lee el .xlsx como texto,
+    se le aplica el esquema y se regenera el snapshot.
+    """
+    if _snapshot_vigente(ruta_xlsx):
+        try:
+            df = pd.read_parquet(ruta_snapshot(ruta_xlsx), memory_map=True)
+            if _esquema_aplicado(df):
+                return df
+            # snapshot antiguo (todo texto): se tipa y se reescribe una vez
+            df = aplicar_esquema(df)
+            guardar_snapshot(df, ruta_xlsx)
+            return df
+        except Exception:
+            pass  # snapshot corrupto -> caemos al Excel
+
+    if not os.path.exists(ruta_xlsx):
+        return None
+    df = aplicar_esquema(pd.read_excel(ruta_xlsx, dtype=str))
+    guardar_snapshot(df, ruta_xlsx)
+    return df
+
+
+def borrar_snapshot(ruta_xlsx: str) -> None:
+    for ruta in (ruta_xlsx, ruta_snapshot(ruta_xlsx)):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+# =========================================================
+# Esquema tipado (se aplica una vez al entrar en el registro)
+# =========================================================
+MESES_ES = [
+    "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+    "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+]
+NBSP = "\u00A0"
+
+_RE_PERIODO = re.compile(r"^(?:Total|" + "|".join(MESES_ES) + r") (\d{4})$")
+
+
+def _norm_cabecera(c) -> str:
+    return " ".join(unicodedata.normalize("NFKC", str(c)).replace(NBSP, " ").split())
+
+
+def es_columna_periodo(col) -> bool:
+    """'Total 2021', 'Enero 2025'... (tolera espacios raros en la cabecera)."""
+    return bool(_RE_PERIODO.match(_norm_cabecera(col)))
+
+
+def columnas_periodo(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if es_columna_periodo(c)]
+
+
+def normalizar_estado(s: pd.Series) -> pd.Series:
+    # mismo criterio que las páginas: sin espacios raros y en mayúsculas (conserva tildes)
+    out = (
+        s.astype("string")
+         .str.normalize("NFKC")
+         .str.replace(NBSP, " ", regex=False)
+         .str.replace(r"\s+", " ", regex=True)
+         .str.strip()
+         .str.upper()
+    )
+    return out.astype(object).where(s.notna())
+
+
+def aplicar_esquema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columnas de periodo -> float64 (vacíos/no numéricos = 0) y 'Estado' normalizado.
+    Los consumidores del registro ya no tienen que repetir to_numeric en cada rerun.
+    """
+    d = df.copy(deep=False)
+    cols = columnas_periodo(d)
+    if cols:
+        d[cols] = d[cols].apply(pd.to_numeric, errors="coerce").fillna(0).astype("float64")
+    col_estado = next((c for c in d.columns if _norm_cabecera(c) == "Estado"), None)
+    if col_estado is not None:
+        d[col_estado] = normalizar_estado(d[col_estado])
+    return d
+
+
+def _esquema_aplicado(df: pd.DataFrame) -> bool:
+    return all(df[c].dtype == "float64" for c in columnas_periodo(df))
+
+
+# =========================================================
+# Registro compartido de datasets (uno por fichero subido)
+# =========================================================
+EIP = "excel_data"
+EIM = "excel_data_eim"
+# espacio de utils/cache_ns.py / cache_memoria.py de cada dataset
+NS_DATASET = {EIP: "cobro_eip", EIM: "cobro_eim"}
+
+RUTAS_DATASET = {
+    EIP: [os.path.join("uploaded", "archivo_cargado.xlsx")],
+    EIM: [
+        os.path.join("uploaded_eim", "archivo_cargado.xlsx"),  # donde guarda la sección EIM
+        os.path.join("uploaded", "archivo_cargado_eim.xlsx"),  # compatibilidad
+    ],
+}
+
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> dict:
+    # clave -> {"version", "df", "ruta", "mtime", "bytes"} (+ "cubo" y motores, ver más abajo)
+    return {"lock": threading.Lock(), "datos": {}}
+
+
+def _nueva_entrada(version: str, df: pd.DataFrame, ruta: str | None) -> dict:
+    return {"version": version, "df": df, "ruta": ruta, "mtime": _mtime(ruta), "bytes": tamano(df)}
+
+
+def _contabilizar(reg: dict) -> None:
+    # el registro no se desaloja, pero lo que ocupa cuenta en el presupuesto de utils/cache_memoria.py
+    with reg["lock"]:
+        entradas = list(reg["datos"].values())
+    fijar_externo("cobro_store", sum(e["bytes"] for e in entradas), len(entradas))
+
+
+def _mtime(ruta: str | None) -> float | None:
+    if ruta and os.path.exists(ruta):
+        return os.path.getmtime(ruta)
+    return None
+
+
+def _entrada_vigente(ent: dict | None) -> bool:
+    if ent is None:
+        return False
+    # el fichero se ha borrado o reemplazado desde otro proceso -> recargar
+    return ent["ruta"] is None or _mtime(ent["ruta"]) == ent["mtime"]
+
+
+def publicar_dataset(clave: str, df: pd.DataFrame, ruta: str | None = None) -> str:
+    """
+    Registra una nueva versión del dataset para todas las sesiones y devuelve su id.
+    Con `ruta` (el .xlsx ya escrito) guarda además el snapshot tipado a su lado.
+    """
+    reg = _registro()
+    version = uuid.uuid4().hex[:12]
+    df = aplicar_esquema(df)
+    if ruta is not None:
+        guardar_snapshot(df, ruta)
+    ent = _nueva_entrada(version, df, ruta)
+    with reg["lock"]:
+        reg["datos"][clave] = ent
+    _contabilizar(reg)
+    st.session_state[f"{clave}_version"] = version
+    return version
+
+
+def _cargar_en_registro(clave: str) -> dict | None:
+    reg = _registro()
+    with reg["lock"]:
+        ent = reg["datos"].get(clave)
+        if _entrada_vigente(ent):
+            return ent  # otra sesión lo cargó mientras esperábamos el lock
+        reg["datos"].pop(clave, None)
+        ent = None
+        for ruta in RUTAS_DATASET.get(clave, []):
+            if not os.path.exists(ruta):
+                continue
+            try:
+                df = cargar_snapshot(ruta)
+            except Exception:
+                continue
+            if df is None:
+                continue
+            ent = _nueva_entrada(uuid.uuid4().hex[:12], df, ruta)
+            reg["datos"][clave] = ent
+            break
+    _contabilizar(reg)
+    return ent
+
+
+def obtener_dataset(clave: str) -> pd.DataFrame | None:
+    """
+    Vista de solo lectura (copy-on-write) del dataset compartido.
+    Si nadie lo ha cargado aún en este proceso se lee de disco una sola vez.
+    """
+    ent = _registro()["datos"].get(clave)
+    if not _entrada_vigente(ent):
+        ent = _cargar_en_registro(clave)
+    if ent is None:
+        st.session_state.pop(f"{clave}_version", None)
+        return None
+    st.session_state[f"{clave}_version"] = ent["version"]
+    return ent["df"].copy(deep=False)
+
+
+def version_dataset(clave: str) -> str | None:
+    """Id de la versión vigente (sirve como clave de caché en lugar del DataFrame)."""
+    ent = _registro()["datos"].get(clave)
+    if not _entrada_vigente(ent):
+        ent = _cargar_en_registro(clave)
+    if ent is None:
+        st.session_state.pop(f"{clave}_version", None)
+        return None
+    st.session_state[f"{clave}_version"] = ent["version"]
+    return ent["version"]
+
+
+def retirar_dataset(clave: str) -> None:
+    reg = _registro()
+    with reg["lock"]:
+        reg["datos"].pop(clave, None)
+    _contabilizar(reg)
+    st.session_state.pop(f"{clave}_version", None)
+
+
+registrar_invalidador("cobro_eip", "cobro_store", lambda: retirar_dataset(EIP))
+registrar_invalidador("cobro_eim", "cobro_store", lambda: retirar_dataset(EIM))
+
+
+# =========================================================
+# Cubo Estado × Forma Pago × Comercial × periodo
+# =========================================================
+DIMENSIONES_CUBO = ["Estado", "Forma Pago", "Comercial"]
+
+
+def _construir_cubo(df: pd.DataFrame) -> pd.DataFrame:
+    cabeceras = {c: _norm_cabecera(c) for c in df.columns}
+    periodos = [c for c in df.columns if es_columna_periodo(c)]
+    d = df[[c for c in df.columns if cabeceras[c] in DIMENSIONES_CUBO] + periodos]
+    d = d.rename(columns=cabeceras)
+    d = d.loc[:, ~d.columns.duplicated()]
+    for dim in DIMENSIONES_CUBO:
+        if dim not in d.columns:
+            d[dim] = ""  # dimensión ausente en el Excel: un único valor
+    cols = [cabeceras[c] for c in periodos]
+    return d.groupby(DIMENSIONES_CUBO, dropna=False, sort=True)[list(dict.fromkeys(cols))].sum()
+
+
+def obtener_cubo(clave: str) -> pd.DataFrame | None:
+    """
+    Cubo agregado (índice Estado/Forma Pago/Comercial, una columna por periodo)
+    materializado una sola vez por versión del dataset y compartido entre sesiones.
+    """
+    ent = _entrada(clave)
+    return None if ent is None else _cubo_de(ent)
+
+
+def _entrada(clave: str) -> dict | None:
+    # una sola lectura: lo que se derive de ella va a esa misma versión aunque se republique
+    if version_dataset(clave) is None:
+        return None
+    return _registro()["datos"].get(clave)
+
+
+def _cubo_de(ent: dict) -> pd.DataFrame:
+    if "cubo" not in ent:
+        reg = _registro()
+        with reg["lock"]:
+            if "cubo" not in ent:
+                ent["cubo"] = _construir_cubo(ent["df"])
+                ent["bytes"] += tamano(ent["cubo"])
+        _contabilizar(reg)
+    return ent["cubo"]
+
+
+def resumen_cubo(cubo: pd.DataFrame, por, columnas: list, filtros: dict | None = None,
+                 dropna: bool = True) -> pd.DataFrame:
+    """
+    Corte del cubo: filtra dimensiones ({dim: valores}) y agrega por `por`
+    sobre las columnas de periodo pedidas. Devuelve un DataFrame plano.
+    """
+    por = [por] if isinstance(por, str) else list(por)
+    cols = [c for c in columnas if c in cubo.columns]
+    sub = cubo
+    for dim, valores in (filtros or {}).items():
+        sub = sub[sub.index.get_level_values(dim).isin(list(valores))]
+    return sub[cols].groupby(level=por, dropna=dropna).sum().reset_index()
+
+
+# =========================================================
+# Motor de "pendiente con deuda / futuro" (sumas prefijas por periodo)
+# =========================================================
+# Criterio común a Deuda, Panel Principal EIP/EIM y B2C, con fecha de corte
+# (anio, mes):
+#   - años anteriores: 'Total AAAA' si existe; si no, la suma de sus meses
+#   - año de corte: meses 1..mes = con deuda, mes+1..12 = futuro
+#     (si solo hay 'Total AAAA', todo cuenta como con deuda)
+#   - años posteriores: meses + 'Total AAAA' = futuro
+
+def _periodo(col) -> tuple[int, int] | None:
+    """(año, mes) de una columna de periodo; mes=0 para 'Total AAAA'."""
+    nombre = _norm_cabecera(col)
+    m = _RE_PERIODO.match(nombre)
+    if not m:
+        return None
+    etiqueta = nombre.split(" ")[0]
+    mes = 0 if etiqueta == "Total" else MESES_ES.index(etiqueta) + 1
+    return int(m.group(1)), mes
+
+
+def construir_motor_pendiente(totales: pd.Series) -> dict:
+    """
+    `totales`: importe por columna de periodo (ya filtrado por estado).
+    Precalcula acumulados por año y por mes para resolver cualquier corte en O(1).
+    """
+    por_anio: dict[int, dict] = {}
+    for col, valor in totales.items():
+        p = _periodo(col)
+        if p is None:
+            continue
+        anio, mes = p
+        d = por_anio.setdefault(anio, {"total": None, "meses": np.zeros(12), "tiene_meses": False})
+        if mes == 0:
+            d["total"] = (d["total"] or 0.0) + float(valor)
+        else:
+            d["meses"][mes - 1] += float(valor)
+            d["tiene_meses"] = True
+
+    anios = sorted(por_anio)
+    pasado = [por_anio[a]["total"] if por_anio[a]["total"] is not None else por_anio[a]["meses"].sum()
+              for a in anios]
+    futuro = [por_anio[a]["meses"].sum() + (por_anio[a]["total"] or 0.0) for a in anios]
+    return {
+        "anios": anios,
+        "por_anio": por_anio,
+        # acum_pasado[i] = suma de 'pasado' de los años anteriores al i-ésimo
+        "acum_pasado": np.concatenate([[0.0], np.cumsum(pasado)]),
+        # acum_futuro[i] = suma de 'futuro' desde el i-ésimo año en adelante
+        "acum_futuro": np.concatenate([np.cumsum(futuro[::-1])[::-1], [0.0]]) if anios else np.zeros(1),
+        # acum_meses[a][m] = meses 1..m del año a
+        "acum_meses": {a: np.concatenate([[0.0], np.cumsum(por_anio[a]["meses"])]) for a in anios},
+    }
+
+
+def split_pendiente(motor: dict, anio: int, mes: int) -> tuple[float, float, float]:
+    """(con_deuda, futuro, total) a fecha de corte anio/mes."""
+    anios = motor["anios"]
+    i = bisect_left(anios, anio)
+    presente = i < len(anios) and anios[i] == anio
+    con_deuda = float(motor["acum_pasado"][i])
+    futuro = float(motor["acum_futuro"][i + 1 if presente else i])
+    if presente:
+        d = motor["por_anio"][anio]
+        if d["tiene_meses"]:
+            acum = motor["acum_meses"][anio]
+            mes = min(max(int(mes), 0), 12)
+            con_deuda += float(acum[mes])
+            futuro += float(acum[12] - acum[mes])
+        elif d["total"] is not None:
+            con_deuda += float(d["total"])
+    return con_deuda, futuro, con_deuda + futuro
+
+
+def importe_meses(motor: dict, anio: int, desde: int, hasta: int) -> float:
+    """Suma de los meses desde..hasta (ambos incluidos) de un año."""
+    acum = motor["acum_meses"].get(anio)
+    if acum is None or hasta < desde:
+        return 0.0
+    return float(acum[min(hasta, 12)] - acum[max(desde, 1) - 1])
+
+
+def motor_pendiente(clave: str, estados=("PENDIENTE",)) -> dict | None:
+    """Motor del dataset para los estados indicados, cacheado por versión."""
+    ent = _entrada(clave)
+    if ent is None:
+        return None
+    clave_motor = ("motor", tuple(sorted(str(e) for e in estados)))
+    if clave_motor not in ent:
+        cubo = _cubo_de(ent)  # el cubo de esta misma entrada, no el de la vigente
+        sub = cubo[cubo.index.get_level_values("Estado").isin(list(estados))]
+        motor = construir_motor_pendiente(sub.sum())
+        reg = _registro()
+        with reg["lock"]:
+            if clave_motor not in ent:
+                ent[clave_motor] = motor
+                ent["bytes"] += tamano(motor)
+        _contabilizar(reg)
+    return ent[clave_motor]
+
+
+# =========================================================
+# Agregado Cliente × periodo (Num_Clientes, tarjetas, tablas por cliente)
+# =========================================================
+def _clave_filtros(filtros: dict | None) -> tuple:
+    return tuple(sorted((str(dim), tuple(sorted(str(v) for v in valores)))
+                        for dim, valores in (filtros or {}).items()))
+
+
+def _construir_clientes(df: pd.DataFrame, filtros: dict | None) -> pd.DataFrame | None:
+    cabeceras = {c: _norm_cabecera(c) for c in df.columns}
+    col_cliente = next((c for c in df.columns if cabeceras[c] == "Cliente"), None)
+    if col_cliente is None:
+        return None
+    mask = pd.Series(True, index=df.index)
+    for dim, valores in (filtros or {}).items():
+        col = next((c for c in df.columns if cabeceras[c] == dim), None)
+        if col is None:
+            return None
+        # mismo criterio que las páginas (strip + upper) para Estado / Forma Pago
+        mask &= normalizar_estado(df[col]).isin([str(v) for v in valores])
+    periodos = columnas_periodo(df)
+    d = df.loc[mask, [col_cliente] + periodos].rename(columns=cabeceras)
+    d = d.loc[:, ~d.columns.duplicated()]
+    return d.groupby("Cliente", sort=True)[[c for c in d.columns if c != "Cliente"]].sum()
+
+
+def clientes_periodo(clave: str, filtros: dict | None = None) -> pd.DataFrame | None:
+    """
+    Importe por Cliente (índice) y columna de periodo, en un único groupby
+    por versión del dataset y filtro ({columna: valores}). Compartido entre sesiones
+    a través de utils/cache_memoria.py (presupuesto y LRU como el resto).
+    """
+    ent = _entrada(clave)
+    if ent is None:
+        return None
+    # sin el lock del registro: el groupby no bloquea las lecturas de otros datasets
+    return memo_unico(NS_DATASET[clave], ("clientes", ent["version"], _clave_filtros(filtros)),
+                      lambda: _construir_clientes(ent["df"], filtros))
+
+
+def _columnas_agregado(agg: pd.DataFrame, cols) -> pd.DataFrame:
+    return agg.reindex(columns=[_norm_cabecera(c) for c in cols], fill_value=0.0)
+
+
+def tabla_clientes(agg: pd.DataFrame, cols, solo_positivos: bool = False) -> pd.DataFrame:
+    """Tabla Cliente + columnas pedidas, solo clientes con suma ≠0 (o >0)."""
+    sub = _columnas_agregado(agg, cols)
+    sub.columns = list(cols)
+    fila = sub.sum(axis=1)
+    sub = sub[(fila > 0) if solo_positivos else (fila != 0)]
+    return sub.reset_index()
+
+
+def num_clientes(agg: pd.DataFrame, cols, solo_positivos: bool = False) -> list[int]:
+    """Nº de clientes con importe (≠0, o >0) en cada columna."""
+    sub = _columnas_agregado(agg, cols)
+    cuenta = (sub > 0) if solo_positivos else (sub != 0)
+    return [int(v) for v in cuenta.sum().to_numpy()]
+
+
+def suma_y_clientes(agg: pd.DataFrame | None, cols, solo_positivos: bool = True) -> tuple[float, int]:
+    """(importe total, nº de clientes con saldo >0, o ≠0) sobre un conjunto de columnas."""
+    if agg is None or not cols:
+        return 0.0, 0
+    fila = _columnas_agregado(agg, cols).sum(axis=1)
+    cuenta = (fila > 0) if solo_positivos else (fila != 0)
+    return float(fila.sum()), int(cuenta.sum())
@@ -0,0 +1,190 @@
+# utils/convenios_index.py
+# Índice local (SQLite) de los convenios firmados que viven en SharePoint.
+# Se alimenta con la API delta de Graph: la primera vez enumera el drive entero y
+# a partir de ahí solo pide los cambios desde el último deltaLink guardado, así
+# que abrir el área de Empleo cuesta una o dos peticiones en vez de recorrer
+# todas las carpetas de empresa.
+#
+# La API delta de SharePoint no devuelve parentReference.path, por eso se guardan
+# todas las carpetas (id, nombre, padre) y las rutas se reconstruyen al consultar.
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import pandas as pd
+import streamlit as st
+
+from utils.cache_ns import registrar_invalidador
+from utils.graph_client import peticion
+
+RUTA_INDICE = os.path.join("cache_graph", "convenios_index.sqlite")
+INTERVALO_SYNC_S = 300  # como mucho una sincronización cada 5 min por drive
+PALABRA_CLAVE = "CONVENI"
+_SELECT_DELTA = "id,name,parentReference,file,folder,root,deleted,lastModifiedDateTime,webUrl"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    drive_id      TEXT NOT NULL,
+    id            TEXT NOT NULL,
+    name          TEXT,
+    parent_id     TEXT,
+    es_carpeta    INTEGER NOT NULL,
+    es_raiz       INTEGER NOT NULL DEFAULT 0,
+    last_modified TEXT,
+    web_url       TEXT,
+    PRIMARY KEY (drive_id, id)
+);
+CREATE TABLE IF NOT EXISTS estado (
+    drive_id     TEXT PRIMARY KEY,
+    delta_link   TEXT,
+    sincronizado REAL
+);
+"""
+
+
+def _conectar(ruta: str = RUTA_INDICE) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    con = sqlite3.connect(ruta, timeout=30)
+    con.executescript(_ESQUEMA)
+    return con
+
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> dict:
+    return {"lock": threading.Lock(), "ultimo": {}}
+
+
+def caducar() -> None:
+    """La próxima consulta sincroniza aunque no hayan pasado INTERVALO_SYNC_S."""
+    reg = _registro()
+    with reg["lock"]:
+        reg["ultimo"].clear()
+
+
+registrar_invalidador("convenios", "convenios_index", caducar)
+
+
+def _url_delta_inicial(drive_id: str) -> str:
+    return f"drives/{drive_id}/root/delta?$select={_SELECT_DELTA}"
+
+
+def _aplicar_cambios(con: sqlite3.Connection, drive_id: str, items: list[dict]) -> None:
+    borrar, guardar = [], []
+    for it in items:
+        es_carpeta = "folder" in it or "root" in it
+        if "deleted" in it:
+            borrar.append((drive_id, it["id"]))
+            continue
+        # de los ficheros solo interesan los convenios (un renombrado puede sacarlo del índice)
+        if not es_carpeta and PALABRA_CLAVE not in (it.get("name") or "").upper():
+            borrar.append((drive_id, it["id"]))
+            continue
+        guardar.append((
+            drive_id, it["id"], it.get("name", ""),
+            (it.get("parentReference") or {}).get("id"),
+            int(es_carpeta), int("root" in it),
+            it.get("lastModifiedDateTime", ""), it.get("webUrl", ""),
+        ))
+    con.executemany("DELETE FROM items WHERE drive_id = ? AND id = ?", borrar)
+    con.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)", guardar)
+
+
+def sincronizar(drive_id: str, token: str, forzar: bool = False) -> None:
+    """
+    Trae los cambios del drive desde el último deltaLink (o lo enumera entero la
+    primera vez). Si Graph responde 410 el deltaLink caducó y se rehace el índice.
+    """
+    reg = _registro()
+    with reg["lock"]:
+        if not forzar and time.time() - reg["ultimo"].get(drive_id, 0) < INTERVALO_SYNC_S:
+            return
+        con = _conectar()
+        try:
+            fila = con.execute("SELECT delta_link FROM estado WHERE drive_id = ?", (drive_id,)).fetchone()
+            url = fila[0] if fila and fila[0] else _url_delta_inicial(drive_id)
+            rehecho = False
+            while url:
+                r = peticion("GET", url, token)
+                if r.status_code == 410 and not rehecho:
+                    with con:
+                        con.execute("DELETE FROM items WHERE drive_id = ?", (drive_id,))
+                    url, rehecho = _url_delta_inicial(drive_id), True
+                    continue
+                r.raise_for_status()
+                data = r.json()
+                with con:  # una transacción por página: reanudar tras un fallo es idempotente
+                    _aplicar_cambios(con, drive_id, data.get("value", []))
+                    if "@odata.deltaLink" in data:
+                        con.execute("INSERT OR REPLACE INTO estado VALUES (?, ?, ?)",
+                                    (drive_id, data["@odata.deltaLink"], time.time()))
+                url = data.get("@odata.nextLink")
+        finally:
+            con.close()
+        reg["ultimo"][drive_id] = time.time()
+
+
+def _clave(nombre: str) -> str:
+    return unicodedata.normalize("NFC", str(nombre)).strip().casefold()
+
+
+def convenios(drive_id: str, base_path: str, areas_map: dict[str, str]) -> pd.DataFrame:
+    """
+    Convenios indexados bajo `base_path/<área>`.
+    Columnas: Área, Carpeta (empresa: primer nivel bajo el área), Archivo, lastModified, Link.
+    """
+    con = _conectar()
+    try:
+        filas = pd.read_sql_query(
+            "SELECT id, name, parent_id, es_carpeta, es_raiz, last_modified, web_url "
+            "FROM items WHERE drive_id = ?", con, params=(drive_id,))
+    finally:
+        con.close()
+
+    carpetas = filas[filas["es_carpeta"] == 1]
+    info = dict(zip(carpetas["id"], zip(carpetas["name"], carpetas["parent_id"], carpetas["es_raiz"])))
+    rutas: dict = {}
+
+    def _ruta(id_carpeta) -> tuple | None:
+        # sube por los padres hasta la raíz; None si la cadena está rota (carpeta borrada)
+        cadena, actual = [], id_carpeta
+        while True:
+            if actual in rutas:
+                pref = rutas[actual]
+                break
+            ent = info.get(actual)
+            if ent is None or len(cadena) > 64:
+                pref = None
+                break
+            if ent[2]:
+                pref = ()
+                rutas[actual] = pref
+                break
+            cadena.append(actual)
+            actual = ent[1]
+        for i in reversed(cadena):
+            pref = None if pref is None else pref + (info[i][0],)
+            rutas[i] = pref
+        return rutas.get(id_carpeta, pref)
+
+    base = tuple(_clave(s) for s in base_path.strip("/").split("/"))
+    area_por_carpeta = {_clave(carpeta): area for area, carpeta in areas_map.items()}
+    n = len(base)
+    out = []
+    for r in filas[filas["es_carpeta"] == 0].itertuples(index=False):
+        segs = _ruta(r.parent_id)
+        if segs is None or len(segs) <= n or tuple(_clave(s) for s in segs[:n]) != base:
+            continue
+        area = area_por_carpeta.get(_clave(segs[n]))
+        if area is None:
+            continue
+        resto = segs[n + 1:]
+        out.append({
+            "Área": area,
+            "Carpeta": resto[0] if resto else "(raíz)",
+            "Archivo": r.name,
+            "lastModified": r.last_modified,
+            "Link": r.web_url,
+        })
+    return pd.DataFrame(out, columns=["Área", "Carpeta", "Archivo", "lastModified", "Link"])
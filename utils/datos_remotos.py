@@ -0,0 +1,189 @@
+# utils/datos_remotos.py
+# Stale-while-revalidate para datasets que vienen de SharePoint.
+# Cada clave guarda la última copia buena a nivel de proceso: se sirve al
+# momento y, si es más vieja que `max_edad_s`, se refresca en un hilo aparte.
+# Solo la primera carga de cada clave espera a la descarga, y una sola vez: si
+# llegan varias sesiones a la vez, las demás esperan a la primera (lock por clave).
+# Lo que se guarda debe ser ligero (rutas de la caché de disco, versiones); los
+# DataFrames se sacan al leer, de utils/cache_memoria.py, que sí tiene presupuesto.
+# Los cargadores no pintan nada (pueden ir en otro hilo): si fallan, lanzan y
+# el error se enseña con pintar_estado.
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.cache_memoria import fijar_externo, tamano
+
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> dict:
+    return {"lock": threading.Lock(), "datos": {}, "cargando": {}}
+
+
+def _candado(reg: dict, clave: str) -> threading.Lock:
+    with reg["lock"]:
+        return reg["cargando"].setdefault(clave, threading.Lock())
+
+
+def _contabilizar(reg: dict) -> None:
+    # pocas referencias, pero cuentan en el presupuesto de utils/cache_memoria.py como el resto
+    with reg["lock"]:
+        n, entradas = tamano(reg["datos"]), len(reg["datos"])
+    fijar_externo("datos_remotos", n, entradas)
+
+
+def _nueva(valor) -> dict:
+    return {"valor": valor, "ts": time.time(), "refrescando": False, "error": None}
+
+
+def _servible(ent: dict | None, valido) -> bool:
+    # `valido(valor)` descarta copias que ya no se pueden leer (p. ej. blob desalojado del disco)
+    return ent is not None and (valido is None or valido(ent["valor"]))
+
+
+def _refrescar(clave: str, cargar) -> None:
+    reg = _registro()
+    try:
+        valor, error = cargar(), None
+    except Exception as e:
+        valor, error = None, e
+    with reg["lock"]:
+        ent = reg["datos"][clave]
+        if error is None:
+            ent.update(valor=valor, ts=time.time())
+        ent.update(refrescando=False, error=error)
+    _contabilizar(reg)
+
+
+def servir(clave: str, cargar, max_edad_s: float = 900, valido=None) -> dict:
+    """
+    {"valor", "ts", "refrescando", "error"} de `clave`. `cargar()` solo se llama
+    en línea la primera vez (o si `valido(valor)` dice que la copia ya no sirve);
+    después, los refrescos van en segundo plano y si fallan se sigue sirviendo la
+    copia anterior (con la excepción en "error").
+    """
+    reg = _registro()
+    ent = reg["datos"].get(clave)
+    if not _servible(ent, valido):
+        with _candado(reg, clave):
+            ent = reg["datos"].get(clave)
+            if not _servible(ent, valido):  # nadie la cargó mientras esperábamos
+                valor = cargar()  # primera carga: no hay nada que servir todavía
+                with reg["lock"]:
+                    ent = reg["datos"][clave] = _nueva(valor)
+                _contabilizar(reg)
+        return dict(ent)
+    with reg["lock"]:
+        lanzar = not ent["refrescando"] and time.time() - ent["ts"] > max_edad_s
+        if lanzar:
+            ent["refrescando"] = True
+    if lanzar:
+        _lanzar(_refrescar, clave, cargar)
+    return dict(ent)
+
+
+def _lanzar(objetivo, *args) -> None:
+    hilo = threading.Thread(target=objetivo, args=args, daemon=True)
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        add_script_run_ctx(hilo, ctx)
+    hilo.start()
+
+
+def _refrescar_varios(claves: list, cargar_varios) -> None:
+    reg = _registro()
+    try:
+        res = cargar_varios(claves)
+    except Exception as e:
+        res = {c: e for c in claves}
+    with reg["lock"]:
+        for c in claves:
+            valor = res.get(c)
+            ent = reg["datos"][c]
+            if valor is None or isinstance(valor, Exception):
+                ent.update(refrescando=False, error=valor or RuntimeError("sin datos"))
+            else:
+                ent.update(valor=valor, ts=time.time(), refrescando=False, error=None)
+    _contabilizar(reg)
+
+
+def servir_varios(claves, cargar_varios, max_edad_s: float = 900, cargar_primera=None, valido=None) -> dict:
+    """
+    servir() de varias claves que se descargan juntas (p. ej. en paralelo):
+    `cargar_varios(claves)` devuelve {clave: valor | Exception}. Las claves sin
+    copia (o con una que no pasa `valido`) se cargan en línea en una sola llamada
+    (con `cargar_primera` si se da, p. ej. con barra de progreso); las viejas se
+    refrescan juntas en segundo plano. Si la primera carga de una clave falla no
+    se guarda nada y esa clave vuelve con {"valor": None, "error": <excepción>}.
+    """
+    reg = _registro()
+    faltan = [c for c in claves if not _servible(reg["datos"].get(c), valido)]
+    fallidas = {}
+    if faltan:
+        with ExitStack() as pila:
+            # en orden fijo: dos sesiones con claves en común no se bloquean entre sí
+            for c in sorted(faltan):
+                pila.enter_context(_candado(reg, c))
+            faltan = [c for c in faltan if not _servible(reg["datos"].get(c), valido)]
+            try:
+                res = (cargar_primera or cargar_varios)(faltan) if faltan else {}
+            except Exception as e:
+                res = {c: e for c in faltan}
+            with reg["lock"]:
+                for c in faltan:
+                    valor = res.get(c)
+                    if valor is None or isinstance(valor, Exception):
+                        fallidas[c] = {"valor": None, "ts": None, "refrescando": False,
+                                       "error": valor or RuntimeError("sin datos")}
+                    else:
+                        reg["datos"][c] = _nueva(valor)
+            _contabilizar(reg)
+    ahora = time.time()
+    with reg["lock"]:
+        viejas = [c for c in claves if c in reg["datos"] and c not in fallidas
+                  and not reg["datos"][c]["refrescando"] and ahora - reg["datos"][c]["ts"] > max_edad_s]
+        for c in viejas:
+            reg["datos"][c]["refrescando"] = True
+    if viejas:
+        _lanzar(_refrescar_varios, viejas, cargar_varios)
+    with reg["lock"]:
+        return {c: fallidas[c] if c in fallidas else dict(reg["datos"][c]) for c in claves}
+
+
+def caducar(clave: str) -> None:
+    """Marca la copia como vieja: la siguiente lectura la sirve y lanza el refresco."""
+    reg = _registro()
+    with reg["lock"]:
+        if clave in reg["datos"]:
+            reg["datos"][clave]["ts"] = 0.0
+
+
+def caducar_prefijo(prefijo: str) -> None:
+    """caducar() de todas las claves que empiezan por `prefijo`."""
+    reg = _registro()
+    with reg["lock"]:
+        for clave, ent in reg["datos"].items():
+            if clave.startswith(prefijo):
+                ent["ts"] = 0.0
+
+
+def pintar_estado(datos, origen: str = "SharePoint") -> None:
+    """
+    Fecha de la copia servida (y si se está refrescando) + aviso si el último
+    refresco falló. Acepta una entrada de servir() o varias (la más vieja manda).
+    """
+    entradas = [d for d in (datos if isinstance(datos, (list, tuple)) else [datos]) if d["ts"] is not None]
+    if not entradas:
+        return
+    ts = min(d["ts"] for d in entradas)
+    estado = f"🕒 Datos de {origen} del {datetime.fromtimestamp(ts).strftime('%d/%m/%Y %H:%M')}"
+    if any(d["refrescando"] for d in entradas):
+        estado += " · 🔄 actualizando en segundo plano…"
+    st.caption(estado)
+    for d in entradas:
+        if d["error"]:
+            st.warning(f"⚠️ El último refresco falló; se muestra la copia anterior. ({d['error']})")
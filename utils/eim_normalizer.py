@@ -32,13 +32,13 @@ def clean_headers(df: pd.DataFrame) -> pd.DataFrame:
             base = f"{base}_{i}"
         cols.append(base)
         seen.add(base)
-    d = df.copy()
+    d = df.copy(deep=False)  # copy-on-write: no duplica el dataset compartido
     d.columns = cols
     return d
 
 def ensure_estado(df: pd.DataFrame) -> pd.DataFrame:
     if "Estado" in df.columns:
-        d = df.copy()
+        d = df.copy(deep=False)
         d["Estado"] = d["Estado"].astype(str).map(_norm_text).str.upper()
         return d
     return df
@@ -50,13 +50,12 @@ def totals_until_year(max_year: int, min_year: int = 2018) -> list[str]:
     return [f"Total {y}" for y in range(min_year, max_year + 1)]
 
 def coerce_numeric(df: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
-    d = df.copy()
+    d = df.copy(deep=False)
     existing = [c for c in cols if c in d.columns]
     if existing:
         d[existing] = d[existing].apply(pd.to_numeric, errors="coerce").fillna(0)
     return d
 
 def prepare_eim_df(raw: pd.DataFrame) -> pd.DataFrame:
-    d = clean_headers(raw)
-    d = ensure_estado(d)
-    return d
+    # 'Estado' ya llega normalizado desde utils.cobro_store.aplicar_esquema
+    return clean_headers(raw)
@@ -0,0 +1,81 @@
+# utils/empleo.py
+# Excel de Empleo (st.secrets["empleo"]) para Desarrollo y el panel principal:
+# un único cargador y una única clave stale-while-revalidate, así el libro se
+# descarga, parsea y guarda una sola vez aunque lo enseñen las dos páginas.
+# Necesita en secrets:
+#   domain = "grupomainjobs.sharepoint.com"
+#   site_name = "GrupoMainjobs928"
+#   file_path = "/EIP BBDD/EIP EMPLEO.xlsx"
+#   worksheet_name = "GENERAL" (o worksheet_index)
+#   share_url (opcional: se prueba antes que file_path)
+import requests
+import streamlit as st
+
+from utils.cache_ns import registrar_invalidador
+from utils.datos_remotos import servir, caducar
+from utils.graph_client import (
+    obtener_token_o_none, site_id, referencia_excel_item, referencia_vigente, leer_referencia,
+    ruta_por_path, ruta_share,
+)
+
+CLAVE_EMPLEO = "empleo_general"
+MAX_EDAD_MIN = 15  # por defecto; se puede fijar con st.secrets["empleo"]["max_edad_min"]
+
+registrar_invalidador("empleo", "swr_empleo", lambda: caducar(CLAVE_EMPLEO))
+
+
+def _hoja(cfg):
+    if cfg.get("worksheet_name"):
+        return cfg["worksheet_name"]
+    if "worksheet_index" in cfg:
+        return int(cfg["worksheet_index"])
+    return "GENERAL"
+
+
+def cargar_empleo(cfg) -> dict:
+    """
+    {"ref", "avisos"}: primero por 'share_url' y, si falla, por site + file_path.
+    Con el cTag sin cambios no se vuelve a descargar; el libro no se parsea aquí
+    sino al leer la referencia. Sin pintar nada (puede ir en segundo plano);
+    lanza si no sale por ninguna vía.
+    """
+    avisos = []
+    token = obtener_token_o_none(cfg)
+    if not token:
+        raise RuntimeError("Error obteniendo token de Empleo.")
+    hoja = _hoja(cfg)
+
+    share_url = cfg.get("share_url")
+    if share_url:
+        try:
+            ref = referencia_excel_item(ruta_share(share_url), token, sheet_name=hoja)
+            leer_referencia(ref)  # un libro que no se puede leer no sustituye a la copia buena
+            return {"ref": ref, "avisos": avisos}
+        except requests.HTTPError as e:
+            avisos.append(f"SharePoint download status: {e.response.status_code}\n{e.response.text[:800]}")
+        except Exception as e:
+            avisos.append(f"Se descargó por share_url pero pd.read_excel falló: {e}")
+
+    try:
+        sid = site_id(cfg["domain"], cfg["site_name"], token)
+        if not sid:
+            raise RuntimeError("Error obteniendo site_id.")
+        ref = referencia_excel_item(ruta_por_path(sid, cfg["file_path"]), token, sheet_name=hoja)
+        leer_referencia(ref)
+    except Exception as e:
+        raise RuntimeError("\n".join(avisos + [f"{type(e).__name__}: {e}"])) from e
+    return {"ref": ref, "avisos": avisos}
+
+
+def servir_empleo() -> dict:
+    """
+    servir() del Excel de Empleo (ver utils/datos_remotos.py) con el valor ya
+    resuelto a {"df", "avisos"}; el df es una copia propia de quien llama.
+    """
+    cfg = st.secrets.get("empleo", {})
+    max_edad_s = float(cfg.get("max_edad_min", MAX_EDAD_MIN)) * 60
+    datos = servir(CLAVE_EMPLEO, lambda: cargar_empleo(cfg), max_edad_s=max_edad_s,
+                   valido=lambda v: referencia_vigente(v["ref"]))
+    df = leer_referencia(datos["valor"]["ref"])  # sellada por cTag
+    df.columns = df.columns.str.strip()
+    return {**datos, "valor": {"df": df, "avisos": datos["valor"]["avisos"]}}
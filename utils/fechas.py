@@ -0,0 +1,80 @@
+import re
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+MESES_NUM = {
+    "enero": "01", "febrero": "02", "marzo": "03", "abril": "04", "mayo": "05", "junio": "06",
+    "julio": "07", "agosto": "08", "septiembre": "09", "setiembre": "09", "octubre": "10",
+    "noviembre": "11", "diciembre": "12",
+}
+_RE_MES = re.compile(r"\b(" + "|".join(MESES_NUM) + r")\b")
+_RE_DIA_MES_ANIO = r"^(\d{1,2})\s+(\d{2})\s+(\d{4})$"
+_RE_SERIAL = r"\d{5}(?:\.\d+)?"  # serial de Excel guardado como texto (p. ej. '45292')
+ORIGEN_EXCEL = "1899-12-30"
+
+
+def _es_numero(v) -> bool:
+    return isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+
+
+def _parsear_texto(texto: pd.Series) -> pd.Series:
+    """'12 de marzo de 2024', '12/03/2024', '45292'... -> datetime64 (solo valores únicos)."""
+    t = (texto.str.lower()
+              .str.normalize("NFD").str.replace(r"[\u0300-\u036f]", "", regex=True)
+              .str.replace(r"\bde\b", " ", regex=True)
+              .str.replace(r"\s+", " ", regex=True).str.strip()
+              .str.replace(_RE_MES, lambda m: MESES_NUM[m.group(1)], regex=True))
+    partes = t.str.extract(_RE_DIA_MES_ANIO)
+    norm = texto.where(partes[0].isna(), partes[0].str.zfill(2) + "/" + partes[1] + "/" + partes[2])
+
+    dt = pd.to_datetime(norm, format="%d/%m/%Y", errors="coerce")
+    serial = norm.str.fullmatch(_RE_SERIAL).fillna(False)
+    if serial.any():
+        dt[serial] = pd.to_datetime(pd.to_numeric(norm[serial]), unit="D", origin=ORIGEN_EXCEL)
+    resto = dt.isna() & ~serial & norm.ne("")
+    if resto.any():
+        dt[resto] = pd.to_datetime(norm[resto], errors="coerce", dayfirst=True, format="mixed")
+    return dt
+
+
+def parsear_fecha_es(serie: pd.Series) -> pd.Series:
+    """
+    Columna de fechas "a la española" -> datetime64 en una pasada:
+    seriales de Excel, fechas ya tipadas, 'dd de mes de aaaa' y 'dd/mm/aaaa'.
+    Las cadenas se procesan con accesores .str sobre los valores únicos.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return pd.to_datetime(serie, unit="D", origin=ORIGEN_EXCEL, errors="coerce")
+
+    codigos, unicos = pd.factorize(serie)
+    u = pd.Series(unicos, dtype=object)
+    res = pd.Series(pd.NaT, index=u.index, dtype="datetime64[ns]")
+    if len(u):
+        es_num = u.map(_es_numero).astype(bool)
+        es_fecha = u.map(lambda v: isinstance(v, (date, pd.Timestamp, np.datetime64))).astype(bool)
+        if es_num.any():
+            res[es_num] = pd.to_datetime(pd.to_numeric(u[es_num]), unit="D",
+                                         origin=ORIGEN_EXCEL, errors="coerce")
+        if es_fecha.any():
+            res[es_fecha] = pd.to_datetime(u[es_fecha], errors="coerce")
+        texto = ~es_num & ~es_fecha
+        if texto.any():
+            res[texto] = _parsear_texto(u[texto].astype(str).str.strip())
+    # código -1 (NaN) -> último elemento = NaT
+    valores = np.append(res.to_numpy(), np.datetime64("NaT"))
+    return pd.Series(valores[codigos], index=serie.index, name=serie.name)
+
+
+def sanear_fecha_cierre(dt: pd.Series) -> pd.Series:
+    """Descarta fechas imposibles: 1899/1970 (vacíos de Excel/epoch), <2015 (salvo 2000) y >2035."""
+    anio = dt.dt.year
+    mask = (anio.isin([1899, 1970]) | ((anio < 2015) & (anio != 2000)) | (anio > 2035))
+    return dt.mask(mask)
+
+
+def parsear_fecha_cierre(serie: pd.Series) -> pd.Series:
+    return sanear_fecha_cierre(parsear_fecha_es(serie))
@@ -1,9 +1,29 @@
-import unicodedata
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+# utils/geo_utils.py
+# Coordenadas de provincias y países para el mapa de alumnos, sin red: el
+# render no puede quedarse esperando a Nominatim (timeouts de 5 s por país y
+# límite de uso compartido por toda la instancia).
+# - Provincias: PROVINCIAS_COORDS.
+# - Países: assets/centroides_paises.csv (centroide de cada código ISO 3166
+#   con su nombre en español), por nombre, alias o código vía pycountry.
+# - Lo que no esté en la tabla se añade a mano en un JSON en disco,
+#   compartido por todas las sesiones y procesos:
+#       python -m utils.geo_utils "Nombre del país" <lat> <lon>
+import csv
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
 import pandas as pd
 import pycountry
 
+from utils.normalizacion import norm_clave, norm_texto, quitar_tildes
+
+RUTA_CENTROIDES = os.path.join("assets", "centroides_paises.csv")
+RUTA_COORDS_MANUALES = os.environ.get(
+    "GEO_COORDS_MANUALES", os.path.join("cache_geo", "coords_manuales.json"))
+
 PROVINCIAS_COORDS = {
     "A Coruña": (43.3623, -8.4115), "Álava": (42.8466, -2.6727), "Albacete": (38.9943, -1.8585),
     "Alicante": (38.3452, -0.4810), "Almería": (36.8340, -2.4637), "Asturias": (43.3619, -5.8494),
@@ -33,24 +53,110 @@ PAISES_COORDS = {
     "Gibraltar": (36.1408, -5.3536)
 }
 
-def get_geolocator():
-    return Nominatim(user_agent="geoapi_map")
+# Nombres habituales en los Excel que no coinciden con el de la tabla
+ALIAS_PAISES = {
+    "eeuu": "US", "ee uu": "US", "usa": "US", "estados unidos de america": "US",
+    "inglaterra": "GB", "escocia": "GB", "gales": "GB", "irlanda del norte": "GB", "uk": "GB",
+    "holanda": "NL", "republica checa": "CZ", "myanmar": "MM", "arabia saudita": "SA",
+    "emiratos arabes": "AE", "bangladesh": "BD", "belarus": "BY", "corea": "KR",
+    "suazilandia": "SZ", "macedonia": "MK", "vaticano": "VA", "kenya": "KE",
+    "guinea bissau": "GW", "timor leste": "TL", "botswana": "BW", "malawi": "MW",
+    "zimbabwe": "ZW", "republica del congo": "CG", "rd congo": "CD", "costa de marfil": "CI",
+}
+
 
-def geolocalizar_pais(pais):
-    geolocator = get_geolocator()
+def _clave(nombre) -> str:
+    # sin tildes, sin puntos y en minúsculas: "EE.UU." -> "ee uu", "Perú" -> "peru"
+    return norm_clave(str(nombre).replace(".", " "))
+
+
+@functools.lru_cache(maxsize=1)
+def _centroides() -> tuple[dict, dict]:
+    """({código ISO: (lat, lon)}, {nombre normalizado: código}) leídos una vez por proceso."""
+    por_codigo, por_nombre = {}, {}
+    with open(RUTA_CENTROIDES, encoding="utf-8", newline="") as f:
+        for fila in csv.DictReader(f):  # ojo: con pandas "NA" (Namibia) sería NaN
+            por_codigo[fila["alpha_2"]] = (float(fila["lat"]), float(fila["lon"]))
+            por_nombre[_clave(fila["nombre"])] = fila["alpha_2"]
+    for alias, codigo in ALIAS_PAISES.items():
+        por_nombre.setdefault(alias, codigo)
+    return por_codigo, por_nombre
+
+
+# ===================== Coordenadas añadidas a mano =====================
+_manuales = {"lock": threading.Lock(), "mtime": None, "datos": {}}
+
+
+def version_coords_manuales() -> float | None:
+    """mtime del JSON de añadidos (None si no hay): para las claves de caché que dependen de él."""
     try:
-        loc = geolocator.geocode(pais, timeout=5)
-        if loc:
-            return (loc.latitude, loc.longitude)
-    except (GeocoderTimedOut, GeocoderServiceError):
+        return os.path.getmtime(RUTA_COORDS_MANUALES)
+    except OSError:
         return None
-    return None
+
+
+def _coords_manuales() -> dict:
+    """Contenido del JSON de añadidos; se relee solo si otro proceso lo ha cambiado."""
+    try:
+        mtime = os.path.getmtime(RUTA_COORDS_MANUALES)
+    except OSError:
+        return {}
+    with _manuales["lock"]:
+        if _manuales["mtime"] != mtime:
+            try:
+                with open(RUTA_COORDS_MANUALES, encoding="utf-8") as f:
+                    datos = json.load(f)
+            except (OSError, ValueError):
+                datos = {}
+            _manuales["datos"] = {k: tuple(v) for k, v in datos.items()}
+            _manuales["mtime"] = mtime
+        return _manuales["datos"]
+
+
+def anadir_coords_manual(nombre: str, lat: float, lon: float) -> None:
+    """Guarda (lat, lon) para `nombre` en el JSON compartido (escritura atómica)."""
+    carpeta = os.path.dirname(RUTA_COORDS_MANUALES) or "."
+    os.makedirs(carpeta, exist_ok=True)
+    with _manuales["lock"]:
+        datos = {}
+        if os.path.exists(RUTA_COORDS_MANUALES):
+            with open(RUTA_COORDS_MANUALES, encoding="utf-8") as f:
+                datos = json.load(f)
+        datos[_clave(nombre)] = [float(lat), float(lon)]
+        fd, tmp = tempfile.mkstemp(dir=carpeta, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(datos, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp, RUTA_COORDS_MANUALES)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        _manuales["mtime"] = None  # se recarga en la siguiente lectura
+
+
+def geolocalizar_pais(pais):
+    """
+    (lat, lon) de `pais` o None. Nunca sale a la red: PAISES_COORDS, añadidos a
+    mano, tabla de centroides por nombre/alias y, por último, por código ISO.
+    """
+    if not pais or pd.isna(pais):
+        return None
+    if pais in PAISES_COORDS:
+        return PAISES_COORDS[pais]
+    clave = _clave(pais)
+    manual = _coords_manuales().get(clave)
+    if manual:
+        return manual
+    por_codigo, por_nombre = _centroides()
+    codigo = por_nombre.get(clave)
+    if codigo is None:
+        codigo = (get_country_code(pais) or "").upper()
+    return por_codigo.get(codigo)
 
 def normalize_text(text):
-    if pd.isna(text):
-        return ""
-    original = str(text).strip().title()
-    sin_tildes = unicodedata.normalize("NFKD", original).encode("ascii", "ignore").decode("utf-8")
+    original = norm_texto(text).title()  # NaN -> ""
+    sin_tildes = quitar_tildes(original)
 
     correcciones = {
         # Países comunes escritos como provincias
@@ -104,3 +210,10 @@ def get_country_code(pais_nombre):
         return country.alpha_2.lower()
     except LookupError:
         return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit('Uso: python -m utils.geo_utils "Nombre del país" <lat> <lon>')
+    anadir_coords_manual(sys.argv[1], float(sys.argv[2]), float(sys.argv[3]))
+    print(f"{sys.argv[1]}: {geolocalizar_pais(sys.argv[1])}")
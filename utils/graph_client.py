@@ -0,0 +1,453 @@
+# utils/graph_client.py
+# Cliente Microsoft Graph compartido por todas las páginas.
+# - Una sola requests.Session por proceso (keep-alive + pool de conexiones), así
+#   que los reruns no vuelven a pagar el handshake TLS con graph.microsoft.com.
+# - Una ConfidentialClientApplication por (tenant, client_id): su caché interna
+#   hace que acquire_token_for_client devuelva el token vigente sin ir a login.
+# - Reintentos ante 429/5xx respetando la cabecera Retry-After, y un limitador
+#   de ritmo común a todos los hilos: un 429 frena a todo el proceso, no solo al
+#   hilo que lo recibió.
+# - Con GRAPH_EMULADOR=http://host:puerto todo (tokens incluidos) va contra el
+#   emulador local de utils/graph_emulador.py en lugar del tenant real.
+# - Descargas condicionadas por cTag/eTag: si el driveItem no cambió se sirve
+#   el fichero de la caché de disco (utils/cache_disco.py) y los DataFrames ya
+#   parseados de la caché de memoria (utils/cache_memoria.py, espacio "excel")
+#   tras una petición de metadatos de pocos bytes.
+import base64
+import hashlib
+import os
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import msal
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.cache_disco import TAM_TROZO, guardar_stream, tocar
+from utils.cache_memoria import fijar_externo, memo, tamano
+from utils.datos_remotos import servir_varios
+from utils.memo_dataset import sellar
+
+EMULADOR = os.environ.get("GRAPH_EMULADOR", "").rstrip("/")
+GRAPH_URL = f"{EMULADOR}/v1.0" if EMULADOR else "https://graph.microsoft.com/v1.0"
+SCOPE_GRAPH = ["https://graph.microsoft.com/.default"]
+ESTADOS_REINTENTO = (429, 500, 502, 503, 504)
+MAX_ESPERA_S = 60.0
+MAX_LOTE = 20  # límite de peticiones por $batch en Graph
+PETICIONES_POR_S = 10.0  # ritmo máximo hacia Graph para todo el proceso
+
+
+# ===================== Sesión HTTP y apps MSAL (por proceso) =====================
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> dict:
+    """Sesión pooled, apps MSAL por credencial y descargas por versión. Compartido entre sesiones y hilos."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)  # emulador local
+    return {"lock": threading.Lock(), "sesion": sesion, "apps": {}, "descargas": {}, "tokens_emulador": {},
+            "ritmo": {"lock": threading.Lock(), "siguiente": 0.0}}
+
+
+def sesion_graph() -> requests.Session:
+    return _registro()["sesion"]
+
+
+def _app_msal(tenant_id: str, client_id: str, client_secret: str) -> tuple:
+    reg = _registro()
+    clave = (tenant_id, client_id, client_secret)
+    with reg["lock"]:
+        ent = reg["apps"].get(clave)
+        if ent is None:
+            app = msal.ConfidentialClientApplication(
+                client_id=client_id,
+                client_credential=client_secret,
+                authority=f"https://login.microsoftonline.com/{tenant_id}",
+                http_client=reg["sesion"],
+            )
+            ent = (app, threading.Lock())
+            reg["apps"][clave] = ent
+    return ent
+
+
+def obtener_token(config: Mapping, force_renew: bool = False) -> str:
+    """
+    Token de aplicación para Graph a partir de una sección de secrets
+    (tenant_id, client_id, client_secret). Lanza RuntimeError si no se obtiene.
+    """
+    try:
+        tenant_id = config["tenant_id"]
+        client_id = config["client_id"]
+        client_secret = config["client_secret"]
+    except (KeyError, TypeError):
+        raise RuntimeError("Faltan tenant_id / client_id / client_secret para Graph")
+
+    if EMULADOR:
+        return _token_emulador(tenant_id, client_id, client_secret, force_renew)
+
+    app, lock = _app_msal(tenant_id, client_id, client_secret)
+    # un solo hilo por credencial pide token nuevo; el resto lo recoge de la caché
+    with lock:
+        result = None
+        if not force_renew:
+            result = app.acquire_token_silent(SCOPE_GRAPH, account=None)
+        if not result or "access_token" not in result:
+            if force_renew:  # acquire_token_for_client devolvería el token cacheado
+                cache = app.token_cache
+                for at in list(cache.search(msal.TokenCache.CredentialType.ACCESS_TOKEN)):
+                    cache.remove_at(at)
+            result = app.acquire_token_for_client(scopes=SCOPE_GRAPH)
+    if not result or "access_token" not in result:
+        raise RuntimeError((result or {}).get("error_description", "No se pudo obtener token de Graph"))
+    return result["access_token"]
+
+
+def _token_emulador(tenant_id: str, client_id: str, client_secret: str, force_renew: bool) -> str:
+    # client_credentials a pelo contra el emulador (MSAL exige un authority real)
+    reg = _registro()
+    clave = (tenant_id, client_id)
+    with reg["lock"]:
+        ent = reg["tokens_emulador"].get(clave)
+        if ent and not force_renew and ent[1] > time.time() + 60:
+            return ent[0]
+    r = sesion_graph().post(f"{EMULADOR}/{tenant_id}/oauth2/v2.0/token", timeout=30, data={
+        "client_id": client_id, "client_secret": client_secret,
+        "grant_type": "client_credentials", "scope": SCOPE_GRAPH[0],
+    })
+    r.raise_for_status()
+    data = r.json()
+    with reg["lock"]:
+        reg["tokens_emulador"][clave] = (data["access_token"], time.time() + int(data.get("expires_in", 3600)))
+    return data["access_token"]
+
+
+def obtener_token_o_none(config: Mapping | None, force_renew: bool = False) -> str | None:
+    if not config:
+        return None
+    try:
+        return obtener_token(config, force_renew=force_renew)
+    except Exception:
+        return None
+
+
+# ===================== Peticiones =====================
+
+def _espera_reintento(cabeceras: Mapping | None, intento: int) -> float:
+    ra = (cabeceras or {}).get("Retry-After")
+    if ra:
+        try:
+            return min(float(ra), MAX_ESPERA_S)
+        except ValueError:
+            pass
+    return min(1.5 * (2 ** intento), MAX_ESPERA_S)
+
+
+def _esperar_turno() -> None:
+    """Limitador compartido: reparte huecos de 1/PETICIONES_POR_S entre todos los hilos."""
+    ritmo = _registro()["ritmo"]
+    with ritmo["lock"]:
+        ahora = time.monotonic()
+        turno = max(ahora, ritmo["siguiente"])
+        ritmo["siguiente"] = turno + 1.0 / PETICIONES_POR_S
+    if turno > ahora:
+        time.sleep(turno - ahora)
+
+
+def _frenar(segundos: float) -> None:
+    # Graph pide esperar (Retry-After): nadie sale antes de que pase
+    ritmo = _registro()["ritmo"]
+    with ritmo["lock"]:
+        ritmo["siguiente"] = max(ritmo["siguiente"], time.monotonic() + segundos)
+
+
+def _url(ruta: str) -> str:
+    return ruta if ruta.startswith("http") else f"{GRAPH_URL}/{ruta.lstrip('/')}"
+
+
+def peticion(metodo: str, ruta: str, token: str | None = None, *, reintentos: int = 4,
+             timeout: int = 30, headers: dict | None = None, **kwargs) -> requests.Response:
+    """
+    Petición a Graph por la sesión compartida. `ruta` puede ser URL completa o
+    relativa a /v1.0. Reintenta 429/5xx y errores de red; devuelve la última
+    respuesta sin hacer raise_for_status.
+    """
+    cab = dict(headers or {})
+    if token:
+        cab["Authorization"] = f"Bearer {token}"
+    url = _url(ruta)
+    ses = sesion_graph()
+    for intento in range(reintentos):
+        ultimo = intento == reintentos - 1
+        _esperar_turno()
+        try:
+            resp = ses.request(metodo, url, headers=cab, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if ultimo:
+                raise
+            time.sleep(_espera_reintento(None, intento))
+            continue
+        if resp.status_code in (429, 503) and resp.headers.get("Retry-After"):
+            _frenar(_espera_reintento(resp.headers, intento))
+        if resp.status_code in ESTADOS_REINTENTO and not ultimo:
+            resp.close()  # con stream=True la conexión no vuelve al pool hasta cerrarla
+            time.sleep(_espera_reintento(resp.headers, intento))
+            continue
+        return resp
+    return resp
+
+
+def graph_get(ruta: str, token: str, **kwargs) -> requests.Response:
+    r = peticion("GET", ruta, token, **kwargs)
+    r.raise_for_status()
+    return r
+
+
+def graph_json(ruta: str, token: str, **kwargs) -> dict:
+    return graph_get(ruta, token, **kwargs).json()
+
+
+# ===================== $batch =====================
+
+def _relativa(ruta: str) -> str:
+    return ruta[len(GRAPH_URL):] if ruta.startswith(GRAPH_URL) else "/" + ruta.lstrip("/")
+
+
+def graph_batch(rutas: list[str], token: str, reintentos: int = 3) -> list[dict]:
+    """
+    Agrupa GETs independientes en llamadas $batch de hasta MAX_LOTE y devuelve,
+    en el mismo orden que `rutas`, {"status", "body", "headers"} de cada una.
+    Las respuestas 429/5xx dentro del lote se reintentan (respetando Retry-After).
+    """
+    resultados: list = [None] * len(rutas)
+    pendientes = list(range(len(rutas)))
+    for intento in range(reintentos):
+        repetir, espera = [], 0.0
+        for ini in range(0, len(pendientes), MAX_LOTE):
+            lote = pendientes[ini:ini + MAX_LOTE]
+            cuerpo = {"requests": [{"id": str(i), "method": "GET", "url": _relativa(rutas[i])} for i in lote]}
+            r = peticion("POST", "$batch", token, json=cuerpo)
+            r.raise_for_status()
+            for resp in r.json().get("responses", []):
+                i = int(resp["id"])
+                status = int(resp.get("status", 0))
+                cab = resp.get("headers") or {}
+                resultados[i] = {"status": status, "body": resp.get("body") or {}, "headers": cab}
+                if status in ESTADOS_REINTENTO and intento < reintentos - 1:
+                    repetir.append(i)
+                    espera = max(espera, _espera_reintento(cab, intento))
+        if not repetir:
+            break
+        time.sleep(espera)
+        pendientes = repetir
+    return resultados
+
+
+def graph_json_varios(rutas: list[str], token: str) -> list[dict | None]:
+    """Como graph_json para varias rutas en un único $batch; None donde la respuesta no fue 2xx."""
+    return [res["body"] if res and 200 <= res["status"] < 300 else None
+            for res in graph_batch(rutas, token)]
+
+
+# ===================== SharePoint =====================
+
+def share_id(share_url: str) -> str:
+    """Codifica un enlace de compartir al formato u!<base64url> de /shares."""
+    encoded = base64.urlsafe_b64encode(share_url.encode("utf-8")).decode("utf-8").rstrip("=")
+    return f"u!{encoded}"
+
+
+def descargar_share_url(share_url: str, token: str, timeout: int = 60) -> requests.Response:
+    return peticion("GET", f"shares/{share_id(share_url)}/driveItem/content", token, timeout=timeout)
+
+
+def site_id(domain: str, site_name: str, token: str) -> str | None:
+    r = peticion("GET", f"sites/{domain}:/sites/{site_name}", token)
+    return r.json()["id"] if r.ok else None
+
+
+# ===================== Descargas condicionadas (cTag / eTag) =====================
+
+def ruta_share(share_url: str) -> str:
+    return f"shares/{share_id(share_url)}/driveItem"
+
+
+def ruta_por_path(site_id: str, file_path: str) -> str:
+    return f"sites/{site_id}/drive/root:/{file_path.lstrip('/')}:"
+
+
+def _version_item(ruta_item: str, token: str) -> str | None:
+    """cTag (cambia solo con el contenido) o, si no viene, eTag del driveItem."""
+    try:
+        r = peticion("GET", f"{ruta_item}?$select=id,eTag,cTag", token)
+    except requests.exceptions.RequestException:
+        return None
+    if not r.ok:
+        return None
+    meta = r.json()
+    return meta.get("cTag") or meta.get("eTag")
+
+
+def descargar_item_a_disco(ruta_item: str, token: str, timeout: int = 60) -> tuple[str, str | None]:
+    """
+    Ruta en la caché de disco (inmutable) del driveItem (`ruta_item` de
+    ruta_share / ruta_por_path) y su versión. La descarga va por streaming; si la
+    versión coincide con la última y el blob sigue en disco, no se vuelve a bajar.
+    Lanza requests.HTTPError si la descarga falla.
+    """
+    reg = _registro()
+    version = _version_item(ruta_item, token)
+    ent = reg["descargas"].get(ruta_item)
+    vigente = ent is not None and tocar(ent["ruta"])
+    if vigente and version is not None and ent["version"] == version:
+        return ent["ruta"], version
+
+    cab = {"If-None-Match": ent["version"]} if vigente and ent["version"] else None
+    r = peticion("GET", f"{ruta_item}/content", token, timeout=timeout, headers=cab, stream=True)
+    try:
+        if r.status_code == 304 and vigente:
+            return ent["ruta"], ent["version"]
+        if not r.ok:
+            # el cuerpo del error queda en memoria antes de cerrar: e.response.text sigue sirviendo
+            _ = r.content
+        r.raise_for_status()
+        ruta = guardar_stream(r.iter_content(TAM_TROZO))
+    finally:
+        r.close()
+    if version is not None:
+        with reg["lock"]:
+            reg["descargas"][ruta_item] = {"version": version, "ruta": ruta}
+            n, entradas = tamano(reg["descargas"]), len(reg["descargas"])
+        fijar_externo("descargas", n, entradas)  # solo rutas: los ficheros van contra el disco
+    return ruta, version
+
+
+def descargar_item(ruta_item: str, token: str, timeout: int = 60) -> tuple[bytes, str | None]:
+    """Como descargar_item_a_disco pero devolviendo los bytes."""
+    ruta, version = descargar_item_a_disco(ruta_item, token, timeout=timeout)
+    with open(ruta, "rb") as f:
+        return f.read(), version
+
+
+def _copia(obj):
+    # el caché es compartido: cada llamada recibe su propia copia de los DataFrames
+    if isinstance(obj, pd.DataFrame):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {k: _copia(v) for k, v in obj.items()}
+    return obj
+
+
+def referencia_excel_item(ruta_item: str, token: str, timeout: int = 60, **kwargs) -> dict:
+    """
+    Descarga (si cambió) el driveItem a la caché de disco y devuelve lo necesario
+    para leerlo después con leer_referencia: unos pocos bytes, apto para guardarse
+    en utils/datos_remotos.py en lugar del libro.
+    """
+    ruta, version = descargar_item_a_disco(ruta_item, token, timeout=timeout)
+    return {"item": ruta_item, "version": version, "ruta": ruta, "kwargs": kwargs}
+
+
+def referencia_vigente(ref: dict) -> bool:
+    """El blob de `ref` sigue en disco (y queda marcado como usado)."""
+    return tocar(ref["ruta"])
+
+
+def leer_referencia(ref: dict):
+    """pd.read_excel de una referencia_excel_item, parseado una vez por versión (espacio "excel")."""
+    kwargs = ref["kwargs"]
+    # sin cTag el blob (direccionado por contenido) identifica igual de bien el contenido;
+    # las versiones viejas ya no se piden y salen solas por LRU
+    clave = (ref["item"], ref["version"] or ref["ruta"], repr(sorted(kwargs.items())))
+    libro = _copia(memo("excel", clave, lambda: pd.read_excel(ref["ruta"], **kwargs)))
+    if isinstance(libro, pd.DataFrame):
+        sellar(libro, hashlib.sha1(repr(clave).encode()).hexdigest()[:16])  # el cTag ya identifica el contenido
+    return libro
+
+
+def leer_excel_item(ruta_item: str, token: str, timeout: int = 60, **kwargs):
+    """
+    pd.read_excel del driveItem con caché por versión: mientras el cTag no cambie
+    se devuelve el libro ya parseado (mismos kwargs) sin descargar ni parsear.
+    """
+    return leer_referencia(referencia_excel_item(ruta_item, token, timeout=timeout, **kwargs))
+
+
+# ===================== Descargas en paralelo =====================
+
+def _hilo_con_contexto(ctx) -> None:
+    # los hilos del pool usan st.cache_resource / st.cache_data; sin contexto Streamlit avisa en el log
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+
+def pool_graph(max_hilos: int) -> ThreadPoolExecutor:
+    """Pool acotado cuyos hilos heredan el ScriptRunContext de quien lo crea."""
+    return ThreadPoolExecutor(max_workers=max(1, max_hilos), initializer=_hilo_con_contexto,
+                              initargs=(get_script_run_ctx(),))
+
+
+def descargar_share_urls_a_disco(share_urls: Mapping[str, str], token: str, max_hilos: int = 4,
+                                 al_completar=None, timeout: int = 60) -> dict:
+    """
+    Descarga varios share links a la vez en un pool acotado, con el mismo token,
+    a la caché de disco. Devuelve {clave: (ruta del blob, versión) | Exception}.
+    `al_completar(clave, hechos, total)` se ejecuta en el hilo que llama, así que
+    puede pintar progreso en la página.
+    """
+    if not share_urls:
+        return {}
+    out = {}
+    with pool_graph(min(max_hilos, len(share_urls))) as pool:
+        futuros = {pool.submit(descargar_item_a_disco, ruta_share(url), token, timeout): clave
+                   for clave, url in share_urls.items()}
+        for hechos, fut in enumerate(as_completed(futuros), 1):
+            clave = futuros[fut]
+            try:
+                out[clave] = fut.result()
+            except Exception as e:
+                out[clave] = e
+            if al_completar is not None:
+                al_completar(clave, hechos, len(futuros))
+    return out
+
+
+PREFIJO_SHARE = "share:"
+
+
+def servir_share_urls(share_urls: Mapping[str, str], config: Mapping | None,
+                      max_edad_s: float = 900, al_completar=None) -> dict:
+    """
+    descargar_share_urls_a_disco con stale-while-revalidate (utils/datos_remotos.py):
+    {clave: {"valor": bytes | None, "ts", "refrescando", "error"}}. Solo espera
+    la primera descarga de cada URL (en paralelo, con `al_completar`); después
+    se sirve la última copia y se refresca en segundo plano. El token se pide en
+    cada carga: un refresco puede llegar cuando el anterior ya ha caducado.
+    En el registro solo queda (ruta del blob, versión); los bytes se leen del
+    disco en cada llamada y no se quedan en memoria.
+    """
+    def cargar(claves, progreso=None):
+        token = obtener_token(config)
+        urls = {c: c[len(PREFIJO_SHARE):] for c in claves}
+        return descargar_share_urls_a_disco(urls, token, al_completar=progreso)
+
+    claves = {clave: PREFIJO_SHARE + url for clave, url in share_urls.items()}
+    datos = servir_varios(list(dict.fromkeys(claves.values())), cargar, max_edad_s=max_edad_s,
+                          cargar_primera=lambda faltan: cargar(faltan, al_completar),
+                          valido=lambda blob: tocar(blob[0]))
+    out = {}
+    for clave, c in claves.items():
+        d = dict(datos[c])
+        if d["valor"] is not None:
+            try:
+                with open(d["valor"][0], "rb") as f:
+                    d["valor"] = f.read()
+            except OSError as e:  # desalojado justo ahora: el siguiente rerun lo vuelve a bajar
+                d.update(valor=None, error=e)
+        out[clave] = d
+    return out
@@ -0,0 +1,400 @@
+# utils/graph_emulador.py
+# Emulador local de Microsoft Graph para desarrollar y medir las páginas que
+# tiran de SharePoint sin tenant real (tokens, sites, drives, children, search,
+# delta, shares/u!…/content, sendMail y $batch). Puede meter latencia y 429.
+#
+#   python -m utils.graph_emulador --fixtures graph_fixtures --crear-ejemplo
+#   python -m utils.graph_emulador --fixtures graph_fixtures --latencia 0.15 --throttle 0.05
+#   GRAPH_EMULADOR=http://127.0.0.1:8765 streamlit run app.py
+#
+# Fixtures:
+#   <fixtures>/sites/<domain>/<site_name>/…  árbol del drive "Documentos" de ese site
+#   <fixtures>/shares.json                   {"<share_url>": "<domain>/<site_name>/<ruta>"}
+#   <fixtures>/_outbox/                      correos recibidos por sendMail (json)
+import argparse
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+NOMBRE_DRIVE = "Documentos"
+
+_config = {"fixtures": "graph_fixtures", "base": "http://127.0.0.1:8765",
+           "latencia": 0.0, "throttle": 0.0, "pagina": 200}
+_deltas = {"lock": threading.Lock(), "snapshots": {}}
+
+
+# ===================== Árbol de fixtures =====================
+
+def _hash(*partes: str) -> str:
+    return hashlib.sha1("/".join(partes).encode("utf-8")).hexdigest()[:16]
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _sites() -> list[tuple[str, str]]:
+    base = os.path.join(_config["fixtures"], "sites")
+    if not os.path.isdir(base):
+        return []
+    return [(d, s) for d in sorted(os.listdir(base)) if os.path.isdir(os.path.join(base, d))
+            for s in sorted(os.listdir(os.path.join(base, d))) if os.path.isdir(os.path.join(base, d, s))]
+
+
+def _site_id(domain: str, site: str) -> str:
+    return f"{domain},{_hash('site', domain, site)}"
+
+
+def _drive_id(domain: str, site: str) -> str:
+    return f"b!{_hash('drive', domain, site)}"
+
+
+def _drive(domain: str, site: str) -> dict:
+    return {"id": _drive_id(domain, site), "domain": domain, "site": site,
+            "raiz": os.path.join(_config["fixtures"], "sites", domain, site)}
+
+
+def _drive_por(clave: str, valor: str) -> dict | None:
+    for domain, site in _sites():
+        if (clave == "site" and _site_id(domain, site) == valor) or \
+           (clave == "drive" and _drive_id(domain, site) == valor):
+            return _drive(domain, site)
+    return None
+
+
+def _id_item(drive: dict, rel: str) -> str:
+    return _hash(drive["id"], rel) if rel else f"root-{drive['id'][2:]}"
+
+
+def _recorrer(drive: dict) -> list[str]:
+    """Rutas relativas de todo el drive, carpetas antes que su contenido."""
+    out = [""]
+    for actual, dirs, files in os.walk(drive["raiz"]):
+        dirs.sort()
+        rel = os.path.relpath(actual, drive["raiz"]).replace(os.sep, "/")
+        rel = "" if rel == "." else rel
+        out += [f"{rel}/{n}".lstrip("/") for n in dirs + sorted(files)]
+    return out
+
+
+def _rel_por_id(drive: dict, item_id: str) -> str | None:
+    return next((rel for rel in _recorrer(drive) if _id_item(drive, rel) == item_id), None)
+
+
+def _version(drive: dict, rel: str) -> str:
+    st_ = os.stat(os.path.join(drive["raiz"], rel))
+    return f"{st_.st_mtime_ns}-{st_.st_size}"
+
+
+def _item(drive: dict, rel: str) -> dict:
+    ruta = os.path.join(drive["raiz"], rel)
+    st_ = os.stat(ruta)
+    iid = _id_item(drive, rel)
+    version = _version(drive, rel)
+    padre = rel.rsplit("/", 1)[0] if "/" in rel else ""
+    d = {
+        "id": iid,
+        "name": rel.rsplit("/", 1)[-1] if rel else "root",
+        "eTag": f'"{{{iid}}},{version}"',
+        "cTag": f'"c:{{{iid}}},{version}"',
+        "lastModifiedDateTime": _iso(st_.st_mtime),
+        "webUrl": f"https://{drive['domain']}/sites/{drive['site']}/Documentos compartidos/{rel}".rstrip("/"),
+    }
+    if rel:
+        d["parentReference"] = {"driveId": drive["id"], "id": _id_item(drive, padre),
+                                "path": f"/drive/root:/{padre}".rstrip("/")}
+    if os.path.isdir(ruta):
+        d["folder"] = {"childCount": len(os.listdir(ruta))}
+        if not rel:
+            d["root"] = {}
+    else:
+        d["file"] = {"mimeType": mimetypes.guess_type(ruta)[0] or "application/octet-stream"}
+        d["size"] = st_.st_size
+    return d
+
+
+# ===================== Respuestas =====================
+
+def _json(status: int, cuerpo: dict, cab: dict | None = None) -> tuple:
+    return status, {"Content-Type": "application/json", **(cab or {})}, json.dumps(cuerpo).encode("utf-8")
+
+
+def _error(status: int, codigo: str, msg: str = "") -> tuple:
+    return _json(status, {"error": {"code": codigo, "message": msg or codigo}})
+
+
+def _contenido(drive: dict, rel: str, cab: dict) -> tuple:
+    ruta = os.path.join(drive["raiz"], rel)
+    if not os.path.isfile(ruta):
+        return _error(404, "itemNotFound")
+    item = _item(drive, rel)
+    if cab.get("if-none-match") in (item["eTag"], item["cTag"]):
+        return 304, {}, b""
+    with open(ruta, "rb") as f:
+        return 200, {"Content-Type": item["file"]["mimeType"], "ETag": item["eTag"]}, f.read()
+
+
+def _paginar(url_base: str, valores: list, query: dict) -> tuple:
+    ini = int(query.get("$skiptoken", ["0"])[0])
+    tam = int(query.get("$top", [_config["pagina"]])[0])
+    cuerpo = {"value": valores[ini:ini + tam]}
+    if ini + tam < len(valores):
+        cuerpo["@odata.nextLink"] = f"{url_base}?$top={tam}&$skiptoken={ini + tam}"
+    return _json(200, cuerpo)
+
+
+def _delta(drive: dict, query: dict) -> tuple:
+    actual = {_id_item(drive, rel): (rel, _version(drive, rel)) for rel in _recorrer(drive)}
+    token = query.get("token", [None])[0]
+    with _deltas["lock"]:
+        previo = _deltas["snapshots"].get(token) if token else None
+        if token and previo is None:
+            return _error(410, "resyncRequired")
+        nuevo = str(len(_deltas["snapshots"]) + 1)
+        _deltas["snapshots"][nuevo] = actual
+    valores = [_item(drive, rel) for iid, (rel, ver) in actual.items()
+               if previo is None or previo.get(iid, (None, None))[1] != ver]
+    valores += [{"id": iid, "deleted": {"state": "deleted"}, "parentReference": {"driveId": drive["id"]}}
+                for iid in (previo or {}) if iid not in actual]
+    link = f"{_config['base']}/v1.0/drives/{drive['id']}/root/delta?token={nuevo}"
+    return _json(200, {"value": valores, "@odata.deltaLink": link})
+
+
+def _accion_item(drive: dict, rel: str, accion: str, query: dict, cab: dict, url_base: str) -> tuple:
+    if rel is None or not os.path.exists(os.path.join(drive["raiz"], rel)):
+        return _error(404, "itemNotFound")
+    if accion == "":
+        return _json(200, _item(drive, rel))
+    if accion == "/content":
+        return _contenido(drive, rel, cab)
+    if accion == "/children":
+        ruta = os.path.join(drive["raiz"], rel)
+        hijos = [_item(drive, f"{rel}/{n}".lstrip("/")) for n in sorted(os.listdir(ruta))]
+        return _paginar(url_base, hijos, query)
+    if accion == "/delta" and rel == "":
+        return _delta(drive, query)
+    m = re.fullmatch(r"/search\(q='(.*)'\)", accion)
+    if m:
+        q = m.group(1).lower()
+        prefijo = f"{rel}/" if rel else ""
+        hits = [_item(drive, r) for r in _recorrer(drive)
+                if r.startswith(prefijo) and r and q in r.rsplit("/", 1)[-1].lower()]
+        return _paginar(url_base, hits, query)
+    return _error(400, "invalidRequest", accion)
+
+
+def _drive_y_resto(ruta: str) -> tuple:
+    m = re.match(r"^/sites/([^/]+)/drive(/.*)$", ruta)
+    if m:
+        return _drive_por("site", m.group(1)), m.group(2)
+    m = re.match(r"^/drives/([^/]+)(/.*)$", ruta)
+    if m:
+        return _drive_por("drive", m.group(1)), m.group(2)
+    return None, None
+
+
+def _item_y_accion(drive: dict, resto: str) -> tuple:
+    if resto.startswith("/root:"):
+        cuerpo = resto[len("/root:"):]
+        ruta, _, accion = cuerpo.partition(":")
+        return ruta.strip("/"), accion
+    if resto.startswith("/root"):
+        return "", resto[len("/root"):]
+    m = re.match(r"^/items/([^/]+)(.*)$", resto)
+    if m:
+        return _rel_por_id(drive, m.group(1)), m.group(2)
+    return None, resto
+
+
+def _share(sid: str) -> tuple:
+    try:
+        b64 = sid[2:] + "=" * (-len(sid[2:]) % 4)
+        url = base64.urlsafe_b64decode(b64).decode("utf-8")
+        with open(os.path.join(_config["fixtures"], "shares.json"), encoding="utf-8") as f:
+            destino = json.load(f)[url]
+    except Exception:
+        return None, None
+    domain, site, rel = (destino.split("/", 2) + [""])[:3]
+    return _drive(domain, site), rel.strip("/")
+
+
+def atender(metodo: str, url: str, cab: dict, cuerpo: bytes) -> tuple:
+    """(status, cabeceras, bytes) para una petición; también la usa $batch por dentro."""
+    partes = urlsplit(url)
+    ruta, query = unquote(partes.path), parse_qs(partes.query)
+    url_base = f"{_config['base']}{quote(ruta)}"
+
+    m = re.fullmatch(r"/([^/]+)/oauth2/v2\.0/token", ruta)
+    if m and metodo == "POST":
+        return _json(200, {"token_type": "Bearer", "expires_in": 3599,
+                           "access_token": f"emulador-{m.group(1)}-{int(time.time())}"})
+
+    if not ruta.startswith("/v1.0/"):
+        return _error(404, "notFound")
+    if not cab.get("authorization", "").startswith("Bearer "):
+        return _error(401, "InvalidAuthenticationToken")
+    ruta = ruta[len("/v1.0"):]
+
+    if metodo == "POST" and ruta == "/$batch":
+        peticiones = json.loads(cuerpo or b"{}").get("requests", [])
+        respuestas = []
+        for p in peticiones[:20]:
+            st_, cab_r, datos = atender(p.get("method", "GET"), f"/v1.0{p['url']}",
+                                        {**cab, **{k.lower(): v for k, v in (p.get("headers") or {}).items()}},
+                                        json.dumps(p.get("body")).encode() if p.get("body") else b"")
+            try:
+                body = json.loads(datos) if datos else None
+            except ValueError:
+                body = base64.b64encode(datos).decode()
+            respuestas.append({"id": p["id"], "status": st_, "headers": cab_r, "body": body})
+        return _json(200, {"responses": respuestas})
+
+    m = re.fullmatch(r"/users/([^/]+)/sendMail", ruta)
+    if m and metodo == "POST":
+        outbox = os.path.join(_config["fixtures"], "_outbox")
+        os.makedirs(outbox, exist_ok=True)
+        with open(os.path.join(outbox, f"{time.time_ns()}.json"), "wb") as f:
+            f.write(cuerpo)
+        return 202, {}, b""
+
+    if metodo != "GET":
+        return _error(405, "methodNotAllowed")
+
+    m = re.fullmatch(r"/sites/([^/:]+):/sites/([^/]+)", ruta)
+    if m:
+        domain, site = m.groups()
+        if (domain, site) not in _sites():
+            return _error(404, "itemNotFound")
+        return _json(200, {"id": _site_id(domain, site), "name": site,
+                           "webUrl": f"https://{domain}/sites/{site}"})
+    m = re.fullmatch(r"/sites/([^/]+)/drives", ruta)
+    if m:
+        drive = _drive_por("site", m.group(1))
+        if drive is None:
+            return _error(404, "itemNotFound")
+        return _json(200, {"value": [{"id": drive["id"], "name": NOMBRE_DRIVE}]})
+    m = re.fullmatch(r"/sites/([^/]+)/drive", ruta)
+    if m:
+        drive = _drive_por("site", m.group(1))
+        if drive is None:
+            return _error(404, "itemNotFound")
+        return _json(200, {"id": drive["id"], "name": NOMBRE_DRIVE})
+
+    m = re.fullmatch(r"/shares/([^/]+)/driveItem(/content)?", ruta)
+    if m:
+        drive, rel = _share(m.group(1))
+        if drive is None:
+            return _error(404, "itemNotFound")
+        return _accion_item(drive, rel, m.group(2) or "", query, cab, url_base)
+
+    drive, resto = _drive_y_resto(ruta)
+    if drive is None:
+        return _error(404, "itemNotFound")
+    rel, accion = _item_y_accion(drive, resto)
+    return _accion_item(drive, rel, accion, query, cab, url_base)
+
+
+# ===================== Servidor =====================
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como Graph
+
+    def _responder(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        cuerpo = self.rfile.read(largo) if largo else b""
+        if _config["latencia"]:
+            time.sleep(_config["latencia"])
+        es_token = self.path.endswith("/oauth2/v2.0/token")
+        if not es_token and random.random() < _config["throttle"]:
+            status, cab, datos = _error(429, "TooManyRequests")
+            cab["Retry-After"] = "1"
+        else:
+            status, cab, datos = atender(self.command, self.path,
+                                         {k.lower(): v for k, v in self.headers.items()}, cuerpo)
+        self.send_response(status)
+        for k, v in cab.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    do_GET = _responder
+    do_POST = _responder
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def crear_ejemplo(carpeta: str, anio: int | None = None) -> None:
+    """Árbol de ejemplo: Excel de Empleo, convenios por área/empresa con fechas repartidas y shares.json."""
+    import pandas as pd
+
+    anio = anio or datetime.now().year
+    raiz = os.path.join(carpeta, "sites", "grupomainjobs.sharepoint.com", "GrupoMainjobs928")
+    empleo = os.path.join(raiz, "EIP BBDD", "EIP EMPLEO.xlsx")
+    os.makedirs(os.path.dirname(empleo), exist_ok=True)
+    pd.DataFrame({
+        "NOMBRE": [f"Alumno {i}" for i in range(40)],
+        "AREA": [["BIM", "CIBER", "IA", "SAP"][i % 4] for i in range(40)],
+        "CONSECUCION GE": [["TRUE", "FALSE", ""][i % 3] for i in range(40)],
+        "INAPLICACION GE": ["FALSE"] * 40,
+        "DEVOLUCION GE": [""] * 40,
+    }).to_excel(empleo, sheet_name="GENERAL", index=False)
+
+    rnd = random.Random(7)
+    for area in ["BIM", "CIBER", "DF", "IA", "SAP", "RRHH"]:
+        for e in range(rnd.randint(3, 8)):
+            carpeta_emp = os.path.join(raiz, "EMPLEO", "_PRÁCTICAS", "Convenios firmados", area, f"Empresa {area} {e}")
+            os.makedirs(carpeta_emp, exist_ok=True)
+            for n in range(rnd.randint(1, 4)):
+                ruta = os.path.join(carpeta_emp, f"CONVENIO_{n}.pdf")
+                with open(ruta, "wb") as f:
+                    f.write(b"%PDF-1.4 convenio de ejemplo\n")
+                ts = datetime(anio - rnd.randint(0, 3), rnd.randint(1, 12), rnd.randint(1, 28)).timestamp()
+                os.utime(ruta, (ts, ts))
+
+    admisiones = os.path.join(raiz, "ADMISIONES")
+    os.makedirs(admisiones, exist_ok=True)
+    shares = {}
+    for nombre in ("ventas", "pvfe", "leads"):
+        pd.DataFrame({"Nombre": [f"{nombre} {i}" for i in range(20)]}).to_excel(
+            os.path.join(admisiones, f"{nombre}.xlsx"), index=False)
+        shares[f"https://emulador.local/{nombre}"] = f"grupomainjobs.sharepoint.com/GrupoMainjobs928/ADMISIONES/{nombre}.xlsx"
+    shares["https://emulador.local/empleo"] = "grupomainjobs.sharepoint.com/GrupoMainjobs928/EIP BBDD/EIP EMPLEO.xlsx"
+    with open(os.path.join(carpeta, "shares.json"), "w", encoding="utf-8") as f:
+        json.dump(shares, f, ensure_ascii=False, indent=2)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Emulador local de Microsoft Graph")
+    ap.add_argument("--fixtures", default=_config["fixtures"])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--puerto", type=int, default=8765)
+    ap.add_argument("--latencia", type=float, default=0.0, help="segundos añadidos a cada respuesta")
+    ap.add_argument("--throttle", type=float, default=0.0, help="probabilidad de responder 429")
+    ap.add_argument("--pagina", type=int, default=200, help="elementos por página en children/search")
+    ap.add_argument("--crear-ejemplo", action="store_true", help="genera fixtures de ejemplo y sale")
+    args = ap.parse_args()
+
+    if args.crear_ejemplo:
+        crear_ejemplo(args.fixtures)
+        print(f"Fixtures de ejemplo en {args.fixtures}")
+        return
+    _config.update(fixtures=args.fixtures, latencia=args.latencia, throttle=args.throttle,
+                   pagina=args.pagina, base=f"http://{args.host}:{args.puerto}")
+    srv = ThreadingHTTPServer((args.host, args.puerto), _Handler)
+    print(f"Emulador Graph en {_config['base']} (fixtures: {args.fixtures})")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
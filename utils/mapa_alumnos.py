@@ -0,0 +1,141 @@
+# utils/mapa_alumnos.py
+# Mapa "Global Alumnos" de los paneles EIP y EIM.
+# - Los conteos por provincia / país se calculan una vez por versión del
+#   dataset de cobro (sobre los valores únicos, no fila a fila).
+# - El HTML del mapa también se genera una vez por versión y se sirve a todas
+#   las sesiones desde la caché de memoria: un rerun ya no reconstruye el
+#   folium.Map.
+# - Las coordenadas salen de utils/geo_utils.py sin red; los países que no
+#   encuentra se listan bajo el mapa para añadirlos a mano (la versión de
+#   esos añadidos entra en la clave de caché: el mapa se regenera solo).
+# - Los países van en un MarkerCluster, así el mapa sigue siendo legible
+#   aunque crezca el número de países.
+import folium
+import streamlit as st
+import streamlit.components.v1 as components
+from folium.plugins import MarkerCluster
+
+from utils.cache_memoria import memo
+from utils.cobro_store import NS_DATASET, obtener_dataset, version_dataset
+from utils.geo_utils import PROVINCIAS_COORDS, geolocalizar_pais, normalize_text, version_coords_manuales
+from utils.normalizacion import mapear_unicos
+
+ALTO_MAPA = 700
+COORDS_ESPANA = (40.4268, -3.7138)
+COLUMNAS = ["Cliente", "Provincia", "País"]
+
+FLAGS = {
+    "Francia": "🇫🇷", "Portugal": "🇵🇹", "Italia": "🇮🇹",
+    "Alemania": "🇩🇪", "Reino Unido": "🇬🇧", "Marruecos": "🇲🇦",
+    "Argentina": "🇦🇷", "México": "🇲🇽", "Colombia": "🇨🇴",
+    "Chile": "🇨🇱", "Brasil": "🇧🇷", "Perú": "🇵🇪",
+    "Uruguay": "🇺🇾", "Venezuela": "🇻🇪", "Ecuador": "🇪🇨",
+    "Gibraltar": "🇬🇮"
+}
+
+
+def _bandera(pais: str) -> str:
+    return FLAGS.get(pais.title(), "🌍")
+
+
+def _calcular_conteos(clave: str) -> dict:
+    df = obtener_dataset(clave)
+    if not all(c in df.columns for c in COLUMNAS):
+        return {"error": "❌ El archivo debe tener columnas: Cliente, Provincia, País."}
+
+    df_u = df[COLUMNAS].drop_duplicates()
+    prov = mapear_unicos(df_u["Provincia"], normalize_text).str.title().str.strip()
+    pais = mapear_unicos(df_u["País"], normalize_text).str.title().str.strip()
+
+    en_provincia = prov.isin(PROVINCIAS_COORDS)
+    es_espana = (pais.str.upper() == "ESPAÑA") & en_provincia
+    es_exterior = prov.isna() | ~en_provincia | (pais == "Gibraltar")
+
+    provincias = [(e, int(n)) for e, n in prov[es_espana].value_counts().items()]
+    paises = [(e, int(n)) for e, n in pais[es_exterior].value_counts().items()]
+    return {
+        "provincias": provincias,
+        "paises": paises,
+        "sin_coords": [e for e, _ in paises if e and e.upper() != "ESPAÑA" and not geolocalizar_pais(e)],
+        "total": sum(n for _, n in provincias) + sum(n for _, n in paises),
+    }
+
+
+def conteos_mapa(clave: str) -> dict | None:
+    """
+    Alumnos por provincia y por país del dataset `clave` (EIP / EIM), una vez por
+    versión del dataset y de las coordenadas añadidas a mano (sin_coords depende de ellas).
+    """
+    version = version_dataset(clave)
+    if version is None:
+        return None
+    clave_memo = ("mapa_conteos", version, version_coords_manuales())
+    return memo(NS_DATASET[clave], clave_memo, lambda: _calcular_conteos(clave))
+
+
+def _construir_html(conteos: dict) -> str:
+    mapa = folium.Map(location=[25, 0], zoom_start=2, width="100%", height=f"{ALTO_MAPA}px", max_bounds=True)
+
+    # Provincias 🇪🇸 (como mucho ~50: marcadores sueltos)
+    for entidad, alumnos in conteos["provincias"]:
+        folium.Marker(
+            location=PROVINCIAS_COORDS[entidad],
+            popup=f"<b>{entidad}</b><br>Alumnos: {alumnos}",
+            tooltip=f"{entidad} ({alumnos})",
+            icon=folium.Icon(color="blue", icon="user", prefix="fa")
+        ).add_to(mapa)
+
+    total_espana = sum(n for _, n in conteos["provincias"])
+    folium.Marker(
+        location=list(COORDS_ESPANA),
+        popup=f"<b>España (provincias)</b><br>Total alumnos: {total_espana}",
+        tooltip=f"España (provincias) ({total_espana})",
+        icon=folium.Icon(color="red", icon="flag", prefix="fa")
+    ).add_to(mapa)
+
+    # Países 🌍 agrupados
+    grupo = MarkerCluster(name="Países").add_to(mapa)
+    for entidad, alumnos in conteos["paises"]:
+        if entidad.upper() == "ESPAÑA":
+            continue
+        coords = geolocalizar_pais(entidad)
+        if coords:
+            bandera = _bandera(entidad)
+            folium.Marker(
+                location=coords,
+                popup=f"<b>{bandera} {entidad}</b><br>Alumnos: {alumnos}",
+                tooltip=f"{bandera} {entidad} ({alumnos})",
+                icon=folium.Icon(color="red", icon="globe", prefix="fa")
+            ).add_to(grupo)
+
+    return mapa.get_root().render()
+
+
+def html_mapa(clave: str) -> str | None:
+    """HTML completo del mapa, compartido entre sesiones mientras no cambie la versión."""
+    version = version_dataset(clave)
+    conteos = conteos_mapa(clave)
+    if conteos is None or "error" in conteos:
+        return None
+    clave_memo = ("mapa_html", version, version_coords_manuales())
+    return memo(NS_DATASET[clave], clave_memo, lambda: _construir_html(conteos))
+
+
+def pintar_mapa(clave: str) -> None:
+    """Badge con el total + mapa del dataset `clave`."""
+    conteos = conteos_mapa(clave)
+    if conteos is None:
+        st.warning("⚠️ No hay archivo cargado para el mapa.")
+        return
+    if "error" in conteos:
+        st.error(conteos["error"])
+        return
+
+    st.markdown(
+        f"<div style='padding:4px 12px;display:inline-block;background:#e3f2fd;border-radius:6px;"
+        f"font-weight:700;color:#1565c0;'>👥 Total: {conteos['total']}</div>",
+        unsafe_allow_html=True
+    )
+    components.html(html_mapa(clave), height=ALTO_MAPA + 10)
+    if conteos["sin_coords"]:
+        st.caption("📍 Sin coordenadas (no aparecen en el mapa): " + ", ".join(conteos["sin_coords"]))
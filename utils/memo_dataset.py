@@ -0,0 +1,73 @@
+# utils/memo_dataset.py
+# Memoización por versión de dataset. st.cache_data hashea cada DataFrame que
+# recibe en cada llamada, y con el Excel de Empleo ese hash cuesta casi lo mismo
+# que el cálculo. Aquí el DataFrame se "sella" una vez al ingerirlo (hash de su
+# contenido) y las funciones decoradas con @memo_dataset se indexan por ese
+# sello + sus parámetros escalares, sin volver a mirar los datos.
+#
+# El sello va ligado al objeto, no se hereda: df.copy(), df[mask], rename...
+# devuelven frames sin sellar, y con esos la función se ejecuta sin caché. Un
+# frame sellado no se debe modificar in situ (usa copia_sellada si hace falta).
+import functools
+import hashlib
+import weakref
+
+import pandas as pd
+
+from utils.cache_memoria import memo
+
+_sellos: dict[int, str] = {}
+
+
+def sellar(df: pd.DataFrame, version: str | None = None) -> str:
+    """Asocia a `df` su versión (por defecto, hash de contenido) y la devuelve."""
+    if version is None:
+        h = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        h.update(repr(list(df.columns)).encode())
+        version = h.hexdigest()[:16]
+    clave = id(df)
+    if clave not in _sellos:
+        weakref.finalize(df, _sellos.pop, clave, None)
+    _sellos[clave] = version
+    return version
+
+
+def version_de(df) -> str | None:
+    return _sellos.get(id(df))
+
+
+def copia_sellada(df: pd.DataFrame) -> pd.DataFrame:
+    """df.copy() que conserva el sello (mismo contenido, misma versión)."""
+    copia = df.copy()
+    version = version_de(df)
+    if version is not None:
+        sellar(copia, version)
+    return copia
+
+
+def _copia(obj):
+    # el resultado se comparte entre sesiones: cada llamada recibe sus DataFrames
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {k: _copia(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return tuple(_copia(v) for v in obj)
+    return obj
+
+
+def memo_dataset(ns: str):
+    """
+    f(df, *escalares) memoizada en el espacio `ns` de utils/cache_memoria.py por
+    (versión de df, escalares). Los escalares deben ser hashables.
+    """
+    def deco(func):
+        @functools.wraps(func)
+        def envoltura(df, *args, **kwargs):
+            version = version_de(df)
+            if version is None:
+                return func(df, *args, **kwargs)
+            clave = (func.__module__, func.__qualname__, version, args, tuple(sorted(kwargs.items())))
+            return _copia(memo(ns, clave, lambda: func(df, *args, **kwargs)))
+        return envoltura
+    return deco
@@ -0,0 +1,134 @@
+import unicodedata
+
+import pandas as pd
+
+NBSP = "\u00A0"
+
+
+# ===================== Tablas precompiladas =====================
+
+def _tabla_sin_tildes() -> dict:
+    tabla = {cp: None for cp in range(0x0300, 0x0370)}  # marcas combinantes sueltas
+    for ini, fin in ((0x00C0, 0x0250), (0x1E00, 0x1F00)):
+        for cp in range(ini, fin):
+            base = "".join(c for c in unicodedata.normalize("NFD", chr(cp))
+                           if unicodedata.category(c) != "Mn")
+            if base != chr(cp):
+                tabla[cp] = base
+    return tabla
+
+
+_TABLA_SIN_TILDES = _tabla_sin_tildes()
+_TABLA_COLNAME = str.maketrans({".": " ", "-": " ", "_": " ", "/": " ", NBSP: " "})
+
+
+# ===================== Escalares =====================
+
+def quitar_tildes(s: str) -> str:
+    """Igual que filtrar NFD sin categoría 'Mn', con tabla precompilada."""
+    out = s.translate(_TABLA_SIN_TILDES)
+    if out.isascii():
+        return out
+    return "".join(c for c in unicodedata.normalize("NFD", out) if unicodedata.category(c) != "Mn")
+
+
+def norm_texto(x: object, upper: bool = False, deaccent: bool = False, lower: bool = False) -> str:
+    """NaN -> '', NBSP -> espacio, espacios colapsados; opcionalmente sin tildes y MAYÚS/minús."""
+    if x is None or (not isinstance(x, str) and pd.isna(x)):
+        return ""
+    s = " ".join(str(x).replace(NBSP, " ").split())
+    if deaccent:
+        s = quitar_tildes(s)
+    if upper:
+        s = s.upper()
+    elif lower:
+        s = s.lower()
+    return s
+
+
+def norm_colname(s: object) -> str:
+    """Cabecera comparable: sin tildes, MAYÚS, separadores -> espacio, solo [A-Z0-9 ]."""
+    s = quitar_tildes(str(s)).upper().translate(_TABLA_COLNAME)
+    s = " ".join(s.split())
+    return "".join(c for c in s if c == " " or ("A" <= c <= "Z") or ("0" <= c <= "9"))
+
+
+def norm_clave(s: object) -> str:
+    """Clave de búsqueda: minúsculas, sin tildes y espacios colapsados."""
+    s = str(s or "").strip().lower()
+    return " ".join(quitar_tildes(s).split())
+
+
+def sin_tildes_lower(s: object) -> str:
+    if not isinstance(s, str):
+        return ""
+    return quitar_tildes(s.strip().lower())
+
+
+# ===================== Vectorizado (solo valores únicos) =====================
+
+def mapear_unicos(serie: pd.Series, func) -> pd.Series:
+    """
+    Aplica `func` una sola vez por valor distinto (factorize) y reconstruye la
+    columna por posición. Las columnas de Empleo / Ventas tienen muy pocos valores
+    distintos, así que el coste pasa de O(filas) a O(únicos).
+    """
+    if len(serie) == 0:
+        return pd.Series([], index=serie.index, dtype=object)
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    valores = pd.Index([func(v) for v in unicos], dtype=object)
+    return pd.Series(valores.take(codigos), index=serie.index, name=serie.name)
+
+
+def normalizar_serie(serie: pd.Series, upper: bool = False, deaccent: bool = False,
+                     lower: bool = False) -> pd.Series:
+    return mapear_unicos(serie, lambda v: norm_texto(v, upper=upper, deaccent=deaccent, lower=lower))
+
+
+# ===================== Booleanos (flags GE de Empleo) =====================
+
+VALORES_VERDADEROS = frozenset({"true", "verdadero", "sí", "si", "1", "1.0", "x"})
+FLAGS_GE = {"CONSECUCION GE": "CONSECUCION", "INAPLICACION GE": "INAPLICACION", "DEVOLUCION GE": "DEVOLUCION"}
+
+
+def _bool_o_na(v):
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return pd.NA
+    if pd.api.types.is_number(v):  # bool, int, float, numpy
+        return bool(v)
+    s = str(v).strip().lower()
+    if s == "":
+        return pd.NA
+    return s in VALORES_VERDADEROS
+
+
+def a_booleano(serie: pd.Series) -> pd.Series:
+    """Columna 'boolean' (nullable): True/False, y <NA> cuando la celda está vacía."""
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.astype("boolean")
+    return mapear_unicos(serie, _bool_o_na).astype("boolean")
+
+
+def es_falso_o_vacio(serie: pd.Series) -> pd.Series:
+    """Vacío o explícitamente falso ('', 'nan', 'false', '0', 'no')."""
+    def _uno(v):
+        if v is None or (not isinstance(v, str) and pd.isna(v)):
+            return True
+        return str(v).strip().lower() in ("", "nan", "false", "0", "no")
+    return mapear_unicos(serie, _uno).astype(bool)
+
+
+def anadir_flags_ge(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Una sola coerción por flag GE: <X>_BOOL (marcado) y <X>_VACIO (celda en blanco).
+    Los conteos de consecución / inaplicación / devolución / en curso pasan a ser sumas de máscaras.
+    """
+    for col, pref in FLAGS_GE.items():
+        if col in df.columns:
+            flag = a_booleano(df[col])
+            df[f"{pref}_BOOL"] = flag.fillna(False).astype(bool)
+            df[f"{pref}_VACIO"] = flag.isna().astype(bool)
+        else:
+            df[f"{pref}_BOOL"] = False
+            df[f"{pref}_VACIO"] = False
+    return df
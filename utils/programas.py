@@ -0,0 +1,104 @@
+import re
+import unicodedata
+
+import pandas as pd
+
+from utils.normalizacion import mapear_unicos, sin_tildes_lower
+
+# =========================================================
+# Leads: alias exactos -> categoría (índice hash precompilado)
+# =========================================================
+SIN_CLASIFICAR = "SIN CLASIFICAR"
+
+CATEGORIAS_EXACTAS = {
+    "MÁSTER IA": ["máster en inteligencia artificial", "máster integral en inteligencia artificial", "máster ia", "master ia", "master en inteligencia artificial"],
+    "MÁSTER RRHH": ["máster recursos humanos rrhh: dirección de personas, desarrollo de talento y gestión laboral", "máster en rrhh: dirección de personas, desarrollo de talento y gestión laboral", "máster rrhh", "master rrhh", "master en rrhh, dirección de personas, desarrollo de talento y gestión laboral"],
+    "MÁSTER CIBERSEGURIDAD": ["máster en dirección de ciberseguridad, hacking ético y seguridad ofensiva", "master en direccion de ciberseguridad, hacking etico y seguridad ofensiva", "la importancia de la ciberseguridad y privacidad", "máster ciber", "master ciber", "máster ciberseguridad"],
+    "CERTIFICACIÓN SAP S/4HANA": ["certificado sap s/4hana finance", "certificado oficial sap s/4hana finance", "certificado oficial sap s/4hana sourcing and procurement", "certificado oficial sap s/4hana logística", "consultoría sap s4hana finanzas", "consultoría sap bw4/hana", "consultoría sap s4hana planificación de la producción y fabricación", "sap btp: la plataforma para la transformación digital", "máster en dirección financiera y consultoría funcional sap s/4hana finance", "sap s/4hana", "sap"],
+    "MÁSTER DPO": ["máster profesional en auditoría de protección de datos, gestión de riesgos y cyber compliance", "master en auditoría de protección de datos, gestión de riesgos y cyber compliance", "máster en dirección de compliance & protección de datos", "máster en auditoría de protección de datos, gestión de riesgos y cyber compliance​", "dpo"],
+    "MÁSTER EERR": ["master en gestión eficiente de energías renovables", "master profesional en energías renovables, redes inteligentes y movilidad eléctrica", "máster en gestión eficiente de las energías renovables", "máster en bim y gestión eficiente de la energía (no usar)", "energías renovables", "eerr"],
+    "MBA + RRHH": ["doble máster oficial en rrhh + mba", "doble máster en rrhh + mba", "doble máster rrhh + mba", "doble máster en dirección financiera + dirección rrhh", "mba rrhh"],
+    "PROGRAMA CALIFORNIA": ["programa movilidad california", "california state university"]
+}
+
+
+def normalizar_alias(texto) -> str:
+    texto = str(texto) if pd.notna(texto) else ""
+    texto = unicodedata.normalize("NFD", texto.lower()).encode("ascii", "ignore").decode("utf-8")
+    return texto.strip()
+
+
+# alias normalizado -> categoría (gana la primera categoría, como el bucle original)
+INDICE_ALIAS: dict[str, str] = {}
+for _categoria, _alias in CATEGORIAS_EXACTAS.items():
+    for _a in _alias:
+        INDICE_ALIAS.setdefault(normalizar_alias(_a), _categoria)
+
+
+def clasificar_programa(nombre) -> str:
+    return INDICE_ALIAS.get(normalizar_alias(nombre), SIN_CLASIFICAR)
+
+
+def clasificar_programas(serie: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """(programa_categoria, programa_final) clasificando solo los nombres distintos."""
+    categoria = mapear_unicos(serie, clasificar_programa)
+    final = serie.where(categoria.eq(SIN_CLASIFICAR), categoria)
+    return categoria, final
+
+
+# =========================================================
+# Ventas: palabras clave -> nombre_unificado / abreviatura
+# =========================================================
+CATEGORIAS_KEYWORDS = {
+    "MÁSTER CIBERSEGURIDAD": ["ciber","ciberseguridad","hacking","etico","seguridad ofensiva","seguridad informatica","ethical hacking","ofensiva"],
+    "MÁSTER RRHH": ["rrhh","recursos humanos","gestion laboral","human resources"],
+    "MÁSTER EERR": ["eerr","energias","energia","renovables","energetica"],
+    "MÁSTER DPO": ["dpo","delegado de proteccion de datos","proteccion de datos","privacidad","rgpd","gdpr"],
+    "MÁSTER IA": ["ia","inteligencia artificial","machine learning","aprendizaje automatico"],
+    "CERTIFICACIÓN SAP S/4HANA": ["sap","s/4hana","certificacion sap","sap s4hana","sap s 4 hana"],
+    "MBA + RRHH": ["mba rrhh","mba + rrhh","mba y rrhh","mba recursos humanos"],
+    "PROGRAMA CALIFORNIA": ["california","programa california"],
+}
+
+# una regex de alternancias por categoría, en el mismo orden de prioridad
+_PATRONES_CATEGORIA = [
+    (categoria, re.compile("|".join(re.escape(k) for k in kws)))
+    for categoria, kws in CATEGORIAS_KEYWORDS.items()
+]
+
+REGLAS_ABREVIATURA = [
+    ("CIBER", re.compile(r"ciber|hacking|ofensiva")),
+    ("SAP", re.compile(r"sap|s/4hana|s 4 hana")),
+    ("IA", re.compile(r"inteligencia artificial|\Amaster ia|\Amáster ia|\Aia\Z")),
+    ("DPO", re.compile(r"dpo|proteccion de datos|compliance")),
+    ("RRHH", re.compile(r"rrhh|recursos humanos")),
+    ("EERR", re.compile(r"energ|eerr|renovabl")),
+    ("BLACKWELL", re.compile(r"blackwell")),
+]
+
+
+def unificar_nombre(valor_original):
+    if not isinstance(valor_original, str) or not valor_original.strip():
+        return valor_original
+    base = sin_tildes_lower(valor_original)
+    for categoria, patron in _PATRONES_CATEGORIA:
+        if patron.search(base):
+            return categoria
+    return valor_original
+
+
+def abreviar_programa(nombre):
+    """Nombre corto EN MAYÚSCULAS para tiles y gráficos."""
+    base = sin_tildes_lower(nombre)
+    for abreviatura, patron in REGLAS_ABREVIATURA:
+        if patron.search(base):
+            return abreviatura
+    return nombre.upper() if isinstance(nombre, str) else nombre
+
+
+def unificar_nombres(serie: pd.Series) -> pd.Series:
+    return mapear_unicos(serie, unificar_nombre)
+
+
+def abreviar_programas(serie: pd.Series) -> pd.Series:
+    return mapear_unicos(serie, abreviar_programa)